@@ -5,25 +5,41 @@ logging.basicConfig(level=logging.INFO, format='  -  [%(asctime)s] #%(levelname)
 logger = logging.getLogger(__name__)
 
 import asyncio
-import psutil # этот модуль позволяет получать информацию о системе, такую как использование памяти и CPU
 
 from aiogram import Bot, Dispatcher, types
 from aiogram.fsm.strategy import FSMStrategy
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
+from aiogram.methods import SendMessage
 
 from config_data.config import Config, load_config
 from handlers import admin, start, editor
 from common.comands import private
-from middlewares import counter
+from common import gpt_client
+from common.editing_engine import setup_engine
+from common.cache import ResultCache, TranscriptCache
+from common.voice_buffer import VoiceBuffers
+from common.fsm_storage import create_storage
+from common.webhook_server import run_webhook
+from common.scheduler import RequestScheduler
+from middlewares import metrics
+from middlewares.lanes import UpdateLanesMiddleware
+from middlewares.access import AccessMiddleware
+from common.metrics import start_metrics_server
+from common.resource_monitor import ResourceMonitor
+from common.send_queue import SendQueue
+from common.channels import ChannelRegistry
+from common.publish_outbox import PublishOutbox
+from common.transcription import Transcriber
+from common.speculation import Speculator
+from common.draft import DraftStore
 
 
 # Загружаем конфиг в переменную config
 config: Config = load_config()
 
-# Инициализируем объект хранилища
-storage = MemoryStorage()  # данные хранятся в оперативной памяти, при перезапуске всё стирается (для тестов и разработки)
+# Инициализируем объект хранилища: memory (для тестов и разработки), sqlite или redis - задается FSM_STORAGE
+storage = create_storage(config.storage)
 
 logger.info('Инициализируем бот и диспетчер')
 bot = Bot(token=config.tg_bot.token,
@@ -33,68 +49,148 @@ bot = Bot(token=config.tg_bot.token,
                                        link_preview_prefer_large_media=None,
                                        link_preview_prefer_small_media=None,
                                        link_preview_show_above_text=None))
-bot.owner = config.tg_bot.owner
-bot.admin_list = config.tg_bot.admin_list
+# Множества, а не списки: проверка доступа на каждом апдейте (список админов перечитывает /reload_admins)
+bot.owner = frozenset(config.tg_bot.owner)
+bot.admin_list = frozenset(config.tg_bot.admin_list)
 bot.home_group = config.tg_bot.home_group
 bot.work_group = config.tg_bot.work_group
 
+# Инициализируем общий асинхронный клиент OpenAI с пулом соединений
+gpt_client.setup_client(config.tg_bot.api_gpt, config.gpt, config.resilience)
+
+# Движок редактирования текста: реестр операций (промпт, модель, параметры)
+setup_engine(config.gpt, config.router)
+
 
 dp = Dispatcher(fsm_strategy=FSMStrategy.USER_IN_CHAT, storage=storage)
 
 
+# Кэш результатов "Поправить текст" / "Переформулировать"
+text_cache = ResultCache(max_entries=config.cache.max_entries,
+                         max_bytes=int(config.cache.max_mb * 1024 * 1024),
+                         ttl=config.cache.ttl_hours * 3600,
+                         db_path=config.cache.db_path)
+
+# Кэш расшифровок голосовых по file_unique_id
+voice_cache = TranscriptCache(max_entries=config.cache.voice_max_entries,
+                              ttl=config.cache.voice_ttl_hours * 3600,
+                              db_path=config.cache.voice_db_path)
+
+# Буферы в памяти для скачивания голосовых
+voice_buffers = VoiceBuffers(spill_bytes=int(config.cache.voice_buffer_mb * 1024 * 1024))
+
+# Распознавание голосовых: API Whisper или локальная модель (STT_BACKEND)
+transcriber = Transcriber(config.transcription, openai_model=editor.WHISPER_MODEL)
+
+# Общая очередь запросов к GPT и Whisper
+scheduler = RequestScheduler(max_concurrent=config.scheduler.max_concurrent,
+                             per_user_concurrent=config.scheduler.per_user_concurrent,
+                             max_queue=config.scheduler.max_queue,
+                             max_queue_per_user=config.scheduler.max_queue_per_user)
+
+# Упреждающая обработка текста в фоне (SPEC_ENABLED), пока пользователь выбирает кнопку
+speculator = Speculator(config.speculation, scheduler, text_cache)
+
+# Черновики с историей правок (DRAFT_DB - журнал изменений на диске)
+drafts = DraftStore(config.draft, ttl=config.storage.ttl_hours * 3600)
+
+# Общая очередь исходящих сообщений: лимиты частоты, флуд-контроль, склейка сообщений
+send_queue = SendQueue(bot, config.send_queue)
+
+# Функция отправки предупреждений мониторинга в домашнюю группу
+async def send_alert(text: str):
+    send_queue.submit(SendMessage(chat_id=bot.home_group[0], text=text))
+
+# Фоновый мониторинг ресурсов процесса (запускается при старте бота)
+resource_monitor = ResourceMonitor(config.monitor, config.memory_limit, alert=send_alert)
+
+# Каналы для публикации: названия и права бота, обновляются в фоне
+channels = ChannelRegistry(bot, config.tg_bot.channels, ttl=config.channels_ttl)
+
+# Очередь публикаций в каналы (SQLite), отправляет фоновый воркер
+outbox = PublishOutbox(config.outbox, send_queue, channels)
+
+# Допуск апдейтов до роутеров и защита от флуда
+access = AccessMiddleware(config.access)
+
+# Очереди апдейтов по пользователям: апдейты одного пользователя по порядку, разных - параллельно
+lanes = UpdateLanesMiddleware(config.lanes)
+
 # Помещаем нужные объекты в workflow_data диспетчера
-chanel_dict = config.tg_bot.channels
-dp.workflow_data.update({'chanel_dict': chanel_dict})
+dp.workflow_data.update({'channels': channels, 'outbox': outbox, 'gpt_config': config.gpt,
+                          'text_cache': text_cache, 'voice_cache': voice_cache,
+                          'voice_buffers': voice_buffers, 'transcriber': transcriber, 'scheduler': scheduler,
+                          'resource_monitor': resource_monitor, 'send_queue': send_queue,
+                          'speculator': speculator, 'drafts': drafts, 'lanes': lanes,
+                          'access': access, 'editor_ui': config.editor_ui})
 
 # Подключаем мидлвари
-dp.update.outer_middleware(counter.CounterMiddleware())  # простой счетчик
+dp.update.outer_middleware(metrics.UpdateMetricsMiddleware())  # апдейты: счетчик, время, ошибки
+dp.update.outer_middleware(access)  # посторонние и флуд отсекаются до очередей и роутеров
+dp.update.outer_middleware(lanes)  # апдейты пользователя строго по очереди
+bot.session.middleware(metrics.TelegramRequestMetrics())  # время запросов к Telegram API
 
-# Подключаем роутеры
-dp.include_router(start.start_router)
-dp.include_router(admin.admin_router)
-dp.include_router(editor.editor_router)
+# Подключаем роутеры, на каждом считаем метрики хендлеров
+for router in (start.start_router, admin.owner_router, admin.admin_router, editor.editor_router):
+    router.message.middleware(metrics.HandlerMetricsMiddleware())
+    router.callback_query.middleware(metrics.HandlerMetricsMiddleware())
+    dp.include_router(router)
 
 
 
 # Типы апдейтов которые будем отлавливать ботом
 ALLOWED_UPDATES = dp.resolve_used_update_types()  # Отбираем только используемые события по роутерам
 
+# HTTP сервер метрик (запускается при старте бота)
+metrics_runner = None
+
 # Функция сработает при запуске бота
 async def on_startup():
+    global metrics_runner
+    if config.metrics.port:
+        try:
+            metrics_runner = await start_metrics_server(config.metrics.host, config.metrics.port)
+        except Exception as e:
+            logger.error("Не удалось запустить сервер метрик: %s", e)
+
+    # Запускаем фоновый мониторинг ресурсов, проверку каналов и воркер публикаций
+    resource_monitor.start()
+    channels.start()
+    outbox.start()
+
+    # Загружаем локальную модель распознавания в фоне
+    transcriber.start()
+
     bot_info = await bot.get_me()
     bot_username = bot_info.username
     bot.username = bot_username
-    try:
-        await bot.send_message(chat_id = bot.home_group[0], text = f"🤖  @{bot_username}  -  запущен!")
-    except Exception as e:
-        logger.error("Ошибка при отправке сообщения при запуске бота: %s", e)
+    send_queue.submit(SendMessage(chat_id=bot.home_group[0], text=f"🤖  @{bot_username}  -  запущен!"))
 
 # Функция сработает при остановке работы бота
 async def on_shutdown():
     bot_info = await bot.get_me()
     bot_username = bot_info.username
-    try:
-        await bot.send_message(chat_id = bot.home_group[0], text = f"☠️  @{bot_username}  -  деактивирован!")
-    except Exception as e:
-        logger.error("Ошибка при отправке сообщения при остановке бота: %s", e)
-
-# Функция мониторинга
-async def monitor_resources():
-    """Мониторит использование ресурсов и логирует при превышении лимитов"""
-    try:
-        process = psutil.Process()
-        memory_usage = process.memory_info().rss / 1024 / 1024  # Конвертация в МБ
-
-        if memory_usage > config.memory_limit:
-            logger.warning("Высокое потребление памяти: %.2fMB (лимит: %sMB)", memory_usage, config.memory_limit)
-
-        # Логируем использование CPU
-        cpu_percent = process.cpu_percent(interval=1)
-        if cpu_percent > 80:
-            logger.warning("Высокая загрузка CPU: %s%%", cpu_percent)
-
-    except Exception as e:
-        logger.error("Ошибка мониторинга ресурсов: %s", e)
+    send_queue.submit(SendMessage(chat_id=bot.home_group[0], text=f"☠️  @{bot_username}  -  деактивирован!"))
+
+    # Отменяем упреждающие запросы, останавливаем мониторинг ресурсов, проверку каналов и воркер публикаций
+    # (неотправленные публикации остаются в базе до следующего запуска)
+    speculator.close()
+    await resource_monitor.stop()
+    await channels.stop()
+    await outbox.stop()
+
+    # Новых запросов к Telegram больше не будет - дожидаемся доставки очереди и останавливаем ее последней
+    await send_queue.close()
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
+
+    # Закрываем пул соединений OpenAI и дисковый кэш
+    await gpt_client.close_client()
+    text_cache.close()
+    voice_cache.close()
+    outbox.close()
+    transcriber.close()
+    await drafts.close()
 
 # Главная функция конфигурирования и запуска бота
 async def main() -> None:
@@ -103,9 +199,6 @@ async def main() -> None:
     dp.startup.register(on_startup)
     dp.shutdown.register(on_shutdown)
 
-    # Пропускаем накопившиеся апдейты - удаляем вебхуки (то что бот получил пока спал)
-    await bot.delete_webhook(drop_pending_updates=True)
-
     # Удаляем ранее установленные команды для бота во всех личных чатах
     await bot.delete_my_commands(scope=types.BotCommandScopeAllPrivateChats())
 
@@ -113,16 +206,20 @@ async def main() -> None:
     await bot.set_my_commands(commands=private, scope=types.BotCommandScopeAllPrivateChats())
 
 
-    # Запускаем polling
     try:
+        if config.webhook.mode == "webhook":
+            # Запускаем сервер вебхука, Telegram сам присылает апдейты
+            await run_webhook(dp, bot, config.webhook, ALLOWED_UPDATES)
+            return
+
+        # Пропускаем накопившиеся апдейты - удаляем вебхуки (то что бот получил пока спал)
+        await bot.delete_webhook(drop_pending_updates=True)
+
+        # Запускаем polling
         await dp.start_polling(bot,
                                allowed_updates=ALLOWED_UPDATES,)
                             #    skip_updates=False)  # Если бот будет обрабатывать платежи, НЕ пропускаем обновления!
 
-        while True:
-            await monitor_resources()
-            await asyncio.sleep(300)  # Проверка каждые 5 минут
-
     except Exception as e:
         logger.error("Критическая ошибка в main: %s", e)
         await bot.send_message(chat_id=bot.home_group[0],
@@ -0,0 +1,183 @@
+"""
+Детерминированный OpenAI-совместимый сервер для тестов и бенчмарков без живого API.
+
+    python -m bench.fake_openai --port 8081 --latency 0.2 --per-char 0.0005
+    GPT_BASE_URL=http://127.0.0.1:8081/v1 python app.py
+
+/v1/chat/completions - "правит" текст после первой пустой строки сообщения пользователя:
+    схлопывает пробелы, делает заглавной первую букву предложений, ставит точку в конце.
+    С response_format=json_object возвращает те же исправления списком правок {"edits": [...]}.
+    Поддерживает stream=true (SSE), max_tokens обрезает ответ.
+/v1/audio/transcriptions - возвращает "голосовое N байт".
+Один и тот же запрос всегда дает один и тот же ответ. Задержка = latency + per_char * длина ответа.
+error_rate - доля запросов, на которые сервер отвечает 500 (последовательность задается seed).
+"""
+
+import logging
+
+# Настраиваем базовую конфигурацию логирования
+logging.basicConfig(level=logging.INFO, format='  -  [%(asctime)s] #%(levelname)-5s -  %(name)s:%(lineno)d  -  %(message)s')
+logger = logging.getLogger(__name__)
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+
+from difflib import SequenceMatcher
+
+from aiohttp import web
+
+from common.text_edits import DIFF_TOKEN
+
+
+
+# Конец предложения и первая буква после него
+SENTENCE_START = re.compile(r"(^|[.!?…]\s+)(\w)")
+
+
+# Функция детерминированной "правки" текста
+def edit_text(text: str) -> str:
+    """Схлопывает пробелы, делает заглавными начала предложений и ставит точку в конце"""
+    lines = [re.sub(r"[ \t]+", " ", line).strip() for line in text.strip().splitlines()]
+    text = "\n".join(lines)
+    text = SENTENCE_START.sub(lambda m: m.group(1) + m.group(2).upper(), text)
+    if text and text[-1] not in ".!?…":
+        text += "."
+    return text
+
+
+# Функция построения списка правок между исходным и исправленным текстом
+def edit_list(old: str, new: str) -> str:
+    """Правки в формате операции fix_edits: фрагменты с парой слов контекста"""
+    a = DIFF_TOKEN.findall(old)
+    b = DIFF_TOKEN.findall(new)
+    edits = []
+    for group in SequenceMatcher(None, a, b, autojunk=False).get_grouped_opcodes(2):
+        i1, j1 = group[0][1], group[0][3]
+        i2, j2 = group[-1][2], group[-1][4]
+        edits.append({"old": "".join(a[i1:i2]), "new": "".join(b[j1:j2])})
+    return json.dumps({"edits": edits}, ensure_ascii=False)
+
+
+class FakeOpenAI:
+    """Состояние сервера: настройки задержки, внесения ошибок и счетчики запросов"""
+    def __init__(self, latency: float = 0.0, per_char: float = 0.0, chunk_chars: int = 40,
+                 error_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.per_char = per_char
+        self.chunk_chars = chunk_chars
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.requests = {"chat": 0, "transcriptions": 0, "errors": 0}
+
+    def fail(self) -> web.Response | None:
+        """Ответ с ошибкой сервера для доли error_rate запросов"""
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.requests["errors"] += 1
+            return web.json_response({"error": {"message": "Injected error", "type": "server_error"}}, status=500)
+        return None
+
+    def answer(self, body: dict) -> tuple[str, str]:
+        user = next((m["content"] for m in reversed(body.get("messages", [])) if m.get("role") == "user"), "")
+        # Сообщение бота: "Инструкция:\n\nтекст" - правим только текст
+        text = user.split("\n\n", 1)[1] if "\n\n" in user else user
+        result = edit_text(text)
+        if body.get("response_format", {}).get("type") == "json_object":
+            result = edit_list(text, result)
+        # Как у настоящего API: ответ длиннее max_tokens (~3 символа на токен) обрезается с finish_reason=length
+        if body.get("max_tokens") and len(result) > body["max_tokens"] * 3:
+            return result[:body["max_tokens"] * 3], "length"
+        return result, "stop"
+
+    async def chat(self, request: web.Request) -> web.StreamResponse:
+        self.requests["chat"] += 1
+        body = await request.json()
+        if (error := self.fail()) is not None:
+            await asyncio.sleep(self.latency)
+            return error
+        content, finish_reason = self.answer(body)
+        model = body.get("model", "fake")
+        created = int(time.time())
+        delay = self.latency + self.per_char * len(content)
+
+        if not body.get("stream"):
+            await asyncio.sleep(delay)
+            return web.json_response({
+                "id": f"chatcmpl-fake-{self.requests['chat']}",
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "finish_reason": finish_reason,
+                             "message": {"role": "assistant", "content": content}}],
+                "usage": {"prompt_tokens": len(str(body)) // 3, "completion_tokens": len(content) // 3,
+                          "total_tokens": (len(str(body)) + len(content)) // 3},
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        pieces = [content[i:i + self.chunk_chars] for i in range(0, len(content), self.chunk_chars)] or [""]
+        await asyncio.sleep(self.latency)
+        for index, piece in enumerate(pieces):
+            await asyncio.sleep(self.per_char * len(piece))
+            chunk = {
+                "id": f"chatcmpl-fake-{self.requests['chat']}",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": piece},
+                             "finish_reason": finish_reason if index == len(pieces) - 1 else None}],
+            }
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def transcriptions(self, request: web.Request) -> web.Response:
+        self.requests["transcriptions"] += 1
+        size = 0
+        reader = await request.multipart()
+        async for part in reader:
+            if part.name == "file":
+                size = len(await part.read())
+        await asyncio.sleep(self.latency)
+        if (error := self.fail()) is not None:
+            return error
+        return web.json_response({"text": f"голосовое {size} байт"})
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.requests)
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=50 * 1024 * 1024)
+        app.router.add_post("/v1/chat/completions", self.chat)
+        app.router.add_post("/v1/audio/transcriptions", self.transcriptions)
+        app.router.add_get("/stats", self.stats)
+        return app
+
+
+# Функция запуска сервера внутри уже работающего цикла событий (для бенчмарков)
+async def start_fake_openai(host: str = "127.0.0.1", port: int = 8081, **options) -> tuple[web.AppRunner, FakeOpenAI]:
+    fake = FakeOpenAI(**options)
+    runner = web.AppRunner(fake.app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host=host, port=port).start()
+    logger.info("Fake OpenAI: http://%s:%s/v1", host, port)
+    return runner, fake
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Детерминированный OpenAI-совместимый сервер",
+                                     epilog=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа, сек")
+    parser.add_argument("--per-char", type=float, default=0.0, help="задержка на символ ответа, сек")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 500")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    fake = FakeOpenAI(latency=args.latency, per_char=args.per_char, error_rate=args.error_rate, seed=args.seed)
+    web.run_app(fake.app(), host=args.host, port=args.port, access_log=None)
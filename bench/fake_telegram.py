@@ -0,0 +1,137 @@
+"""
+Локальный сервер Telegram Bot API для бенчмарков: отвечает на запросы бота без сети.
+
+    python -m bench.fake_telegram --port 8082 --latency 0.05 --flood-rate 0.01
+
+Бот подключается через TelegramAPIServer.from_base("http://127.0.0.1:8082").
+Отправка и правка сообщений возвращают сообщение с новым message_id, getFile и /file/... отдают
+"голосовое" размером voice_bytes, каналы всегда доступны (бот - владелец).
+flood_rate - доля запросов на отправку/правку с ответом 429 (retry_after), error_rate - с ответом 500.
+"""
+
+import logging
+
+# Настраиваем базовую конфигурацию логирования
+logging.basicConfig(level=logging.INFO, format='  -  [%(asctime)s] #%(levelname)-5s -  %(name)s:%(lineno)d  -  %(message)s')
+logger = logging.getLogger(__name__)
+
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+
+from aiohttp import web
+
+
+# Методы, которые Telegram ограничивает флуд-контролем
+SEND_METHODS = {"sendmessage", "editmessagetext", "editmessagereplymarkup", "deletemessage"}
+
+
+class FakeTelegram:
+    """Состояние сервера: настройки задержки, внесения ошибок и счетчики вызовов по методам"""
+    def __init__(self, latency: float = 0.0, flood_rate: float = 0.0, retry_after: int = 1,
+                 error_rate: float = 0.0, voice_bytes: int = 32 * 1024, seed: int = 0):
+        self.latency = latency
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.error_rate = error_rate
+        self.voice_bytes = voice_bytes
+        self.random = random.Random(seed)
+        self.calls: Counter[str] = Counter()
+        self.errors: Counter[str] = Counter()
+        self.message_id = 1000
+
+    def user(self, bot_id: int) -> dict:
+        return {"id": bot_id, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+    def message(self, chat_id: int | str, text: str | None, message_id: int | None = None) -> dict:
+        if message_id is None:
+            self.message_id += 1
+            message_id = self.message_id
+        chat_id = int(chat_id)
+        chat = {"id": chat_id, "type": "private" if chat_id > 0 else "channel"}
+        return {"message_id": message_id, "date": int(time.time()), "chat": chat, "text": text or ""}
+
+    def result(self, method: str, params: dict, bot_id: int):
+        """Результат вызова метода"""
+        if method == "getme":
+            return self.user(bot_id)
+        if method == "sendmessage":
+            return self.message(params["chat_id"], params.get("text"))
+        if method in ("editmessagetext", "editmessagereplymarkup"):
+            return self.message(params["chat_id"], params.get("text"), int(params["message_id"]))
+        if method == "getfile":
+            file_id = params["file_id"]
+            return {"file_id": file_id, "file_unique_id": file_id, "file_size": self.voice_bytes,
+                    "file_path": f"voice/{file_id}.oga"}
+        if method == "getchat":
+            return {"id": int(params["chat_id"]), "type": "channel", "title": f"Канал {params['chat_id']}",
+                    "accent_color_id": 0, "max_reaction_count": 11, "accepted_gift_types": {
+                        "unlimited_gifts": False, "limited_gifts": False, "unique_gifts": False,
+                        "premium_subscription": False, "gifts_from_channels": False}}
+        if method == "getchatmember":
+            return {"status": "creator", "user": self.user(bot_id), "is_anonymous": False}
+        # deleteMessage, answerCallbackQuery, setMyCommands и прочие
+        return True
+
+    async def method(self, request: web.Request) -> web.Response:
+        name = request.match_info["method"]
+        method = name.lower()
+        self.calls[name] += 1
+        params = dict(await request.post())
+        bot_id = int(request.match_info["token"].split(":", 1)[0])
+        await asyncio.sleep(self.latency)
+
+        if method in SEND_METHODS and self.random.random() < self.flood_rate:
+            self.errors[f"{name}:429"] += 1
+            return web.json_response({"ok": False, "error_code": 429,
+                                      "description": f"Too Many Requests: retry after {self.retry_after}",
+                                      "parameters": {"retry_after": self.retry_after}}, status=429)
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.errors[f"{name}:500"] += 1
+            return web.json_response({"ok": False, "error_code": 500, "description": "Internal Server Error"},
+                                     status=500)
+        return web.json_response({"ok": True, "result": self.result(method, params, bot_id)})
+
+    async def file(self, request: web.Request) -> web.Response:
+        self.calls["file"] += 1
+        await asyncio.sleep(self.latency)
+        return web.Response(body=b"\0" * self.voice_bytes, content_type="audio/ogg")
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response({"calls": dict(self.calls), "errors": dict(self.errors)})
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.method)
+        app.router.add_get("/file/bot{token}/{path:.+}", self.file)
+        app.router.add_get("/stats", self.stats)
+        return app
+
+
+# Функция запуска сервера внутри уже работающего цикла событий (для бенчмарков)
+async def start_fake_telegram(host: str = "127.0.0.1", port: int = 8082, **options) -> tuple[web.AppRunner, FakeTelegram]:
+    fake = FakeTelegram(**options)
+    runner = web.AppRunner(fake.app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host=host, port=port).start()
+    logger.info("Fake Telegram Bot API: http://%s:%s", host, port)
+    return runner, fake
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Локальный сервер Telegram Bot API для бенчмарков",
+                                     epilog=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа, сек")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="доля ответов 429 на отправку и правку")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after в ответах 429, сек")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 500")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    fake = FakeTelegram(latency=args.latency, flood_rate=args.flood_rate, retry_after=args.retry_after,
+                        error_rate=args.error_rate, seed=args.seed)
+    web.run_app(fake.app(), host=args.host, port=args.port, access_log=None)
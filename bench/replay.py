@@ -0,0 +1,354 @@
+"""
+Бенчмарк бота целиком, без сети: поднимает локальные Telegram Bot API и OpenAI (в отдельном процессе,
+чтобы не делить с ботом CPU и память), импортирует настоящий app.py и прогоняет через dp.feed_update
+сценарии администраторов - текст, голосовое, добавить, объединить, поправить, переформулировать, отправить.
+
+    python -m bench.replay --sessions 20 --rounds 3 --tg-latency 0.05 --gpt-latency 0.5
+    python -m bench.replay --json bench.json                          # сохранить результат
+    python -m bench.replay --baseline bench.json --tolerance 0.25     # код возврата 1 при регрессии
+
+Отчет: пропускная способность (апдейтов в секунду), p50/p95/p99 времени обработки каждого шага,
+запросы к Telegram и OpenAI на один сценарий и пиковый RSS процесса бота.
+Голосовые бенчмарка меньше VOICE_BUFFER_MB: если хоть одно попало во временный файл, код возврата 1.
+Переменные окружения бота (SEND_*, SCHED_*, GPT_* и т.д.) можно задать как обычно - они применятся к прогону.
+"""
+
+import logging
+
+# Настраиваем базовую конфигурацию логирования
+logging.basicConfig(level=logging.INFO, format='  -  [%(asctime)s] #%(levelname)-5s -  %(name)s:%(lineno)d  -  %(message)s')
+logger = logging.getLogger(__name__)
+
+import argparse
+import asyncio
+import datetime
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import socket
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import aiohttp
+
+from bench.fake_openai import start_fake_openai
+from bench.fake_telegram import start_fake_telegram
+
+
+
+# Сценарий одного администратора: шаги выполняются по порядку, каждый шаг - один апдейт.
+# Шаг: name - имя в отчете, text - сообщение, voice - голосовое (секунд), callback - нажатие inline-кнопки.
+# В тексте и callback подставляются {user}, {round} и {channel}.
+SCRIPT = [
+    {"name": "text", "text": "привет   это черновик поста номер {round} от {user}. тут есть ошибки"},
+    {"name": "fix", "text": "ℹ️ Поправить текст ℹ️"},
+    {"name": "add", "text": "↗️ Добавить"},
+    {"name": "voice", "voice": 7},
+    {"name": "merge", "text": "⏺️ Объединить"},
+    {"name": "rephrase", "text": "🔄 Переформулировать 🔄"},
+    {"name": "send", "text": "✅ Отправить"},
+    {"name": "select", "callback": "btn_{channel}"},
+    {"name": "publish", "callback": "btn_publish"},
+]
+
+# Тот же сценарий для EDITOR_UI=inline: команды - кнопки сообщения-черновика, "Добавить" не нужен
+INLINE_SCRIPT = [
+    {"name": "text", "text": "привет   это черновик поста номер {round} от {user}. тут есть ошибки"},
+    {"name": "fix", "callback": "ed_fix"},
+    {"name": "voice", "voice": 7},
+    {"name": "merge", "callback": "ed_merge"},
+    {"name": "rephrase", "callback": "ed_rephrase"},
+    {"name": "send", "callback": "ed_send"},
+    {"name": "select", "callback": "btn_{channel}"},
+    {"name": "publish", "callback": "btn_publish"},
+]
+
+# Каналы для публикации в прогоне
+CHANNELS = {"Бенчмарк 1": -1001, "Бенчмарк 2": -1002}
+
+
+# Функция поиска свободного порта
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# Функция запуска поддельных серверов (выполняется в отдельном процессе)
+def run_fakes(tg_port: int, gpt_port: int, tg_options: dict, gpt_options: dict) -> None:
+    logging.getLogger("bench").setLevel(logging.WARNING)
+
+    async def serve():
+        await start_fake_telegram(port=tg_port, **tg_options)
+        await start_fake_openai(port=gpt_port, **gpt_options)
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+# Функция ожидания готовности сервера
+async def wait_ready(url: str, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.get(url) as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                if time.monotonic() > deadline:
+                    raise
+            await asyncio.sleep(0.05)
+
+
+# Функция получения счетчиков поддельного сервера
+async def fetch_stats(url: str) -> dict:
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url) as response:
+            return await response.json()
+
+
+# Функция расчета перцентиля по отсортированному списку
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, round(q / 100 * len(values) + 0.5) - 1))
+    return values[index]
+
+
+class Replay:
+    """Прогон сценариев через диспетчер бота и сбор времени обработки шагов"""
+    def __init__(self, app, script: list[dict], channel: int, think: float = 0.0):
+        self.app = app
+        self.script = script
+        self.channel = channel
+        self.think = think
+        self.timings: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+        self.update_id = 0
+        self.message_id = 0
+
+    def update(self, user_id: int, round_no: int, step: dict, panel: int | None = None):
+        """Апдейт Telegram для шага сценария. panel - id сообщения-черновика (EDITOR_UI=inline)"""
+        from aiogram.types import CallbackQuery, Chat, Message, Update, User, Voice
+
+        self.update_id += 1
+        self.message_id += 1
+        user = User(id=user_id, is_bot=False, first_name=f"admin{user_id}")
+        chat = Chat(id=user_id, type="private")
+        now = datetime.datetime.now()
+        fields = {"user": user_id, "round": round_no, "channel": self.channel}
+
+        if "callback" in step:
+            # Нажатие на сообщении-черновике, а без него - на своем сообщении, как будто клавиатура отправлена заново
+            message = Message(message_id=panel or self.message_id, date=now, chat=chat, text="Доступные каналы:")
+            return Update(update_id=self.update_id,
+                          callback_query=CallbackQuery(id=str(self.update_id), from_user=user,
+                                                       chat_instance=str(user_id), message=message,
+                                                       data=step["callback"].format(**fields)))
+        if "voice" in step:
+            file_id = f"voice-{user_id}-{round_no}-{self.update_id}"
+            voice = Voice(file_id=file_id, file_unique_id=file_id, duration=step["voice"], file_size=32 * 1024)
+            return Update(update_id=self.update_id,
+                          message=Message(message_id=self.message_id, date=now, chat=chat, from_user=user, voice=voice))
+        return Update(update_id=self.update_id,
+                      message=Message(message_id=self.message_id, date=now, chat=chat, from_user=user,
+                                      text=step["text"].format(**fields)))
+
+    async def session(self, user_id: int, rounds: int) -> None:
+        """Один администратор проходит сценарий rounds раз, шаги - строго по очереди"""
+        for round_no in range(1, rounds + 1):
+            for step in self.script:
+                panel = None
+                if "callback" in step:
+                    state = self.app.dp.fsm.get_context(self.app.bot, chat_id=user_id, user_id=user_id)
+                    panel = (await state.get_data()).get('panel')
+                update = self.update(user_id, round_no, step, panel)
+                started = time.perf_counter()
+                try:
+                    await self.app.dp.feed_update(self.app.bot, update)
+                except Exception as e:
+                    self.errors[step["name"]] += 1
+                    logger.error("Шаг %s пользователя %s: %s", step["name"], user_id, e)
+                self.timings[step["name"]].append(time.perf_counter() - started)
+                # Пауза "на подумать" между нажатиями, в замер не входит
+                if self.think:
+                    await asyncio.sleep(self.think)
+
+
+# Функция прогона бенчмарка
+async def run(args: argparse.Namespace) -> dict:
+    tg_port, gpt_port = free_port(), free_port()
+    fakes = multiprocessing.get_context("spawn").Process(
+        target=run_fakes, daemon=True,
+        args=(tg_port, gpt_port,
+              {"latency": args.tg_latency, "flood_rate": args.flood_rate, "error_rate": args.tg_error_rate,
+               "seed": args.seed},
+              {"latency": args.gpt_latency, "per_char": args.gpt_per_char, "error_rate": args.gpt_error_rate,
+               "seed": args.seed}))
+    fakes.start()
+    tg_url, gpt_url = f"http://127.0.0.1:{tg_port}", f"http://127.0.0.1:{gpt_port}"
+
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    admins = [100_000 + i for i in range(args.sessions)]
+    try:
+        await wait_ready(f"{tg_url}/stats")
+        await wait_ready(f"{gpt_url}/stats")
+
+        # Окружение бота: поддельные серверы, хранилища во временной папке, без сервера метрик
+        os.environ.update({
+            "BOT_TOKEN": "123456:BENCH", "API_GPT": "sk-bench", "GPT_BASE_URL": f"{gpt_url}/v1",
+            "OWNER": str(admins[0]), "ADMIN_LIST": ",".join(map(str, admins)),
+            "HOME_GROUP": "-100", "WORK_GROUP": "-200", "CHANNELS": json.dumps(CHANNELS),
+            "FSM_STORAGE": "memory", "CACHE_DB": "", "VOICE_CACHE_DB": "",
+            "OUTBOX_DB": os.path.join(workdir, "outbox.db"), "METRICS_PORT": "0",
+            "STT_BACKEND": "openai", "EDITOR_UI": args.ui,
+        })
+        started = time.perf_counter()
+        import app
+        import_seconds = time.perf_counter() - started
+        if not args.verbose:
+            for handler in logging.getLogger().handlers:
+                handler.setLevel(logging.WARNING)
+
+        from aiogram.client.telegram import TelegramAPIServer
+        app.bot.session.api = TelegramAPIServer.from_base(tg_url)
+        await app.on_startup()
+
+        replay = Replay(app, args.script, next(iter(CHANNELS.values())), args.think)
+        started = time.perf_counter()
+        await asyncio.gather(*(replay.session(user_id, args.rounds) for user_id in admins))
+        handled = time.perf_counter() - started
+
+        # Дожидаемся публикаций из очереди и доставки исходящих сообщений
+        deadline = time.monotonic() + args.drain_timeout
+        while (await app.outbox.stats())["pending"] and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        await app.on_shutdown()
+        drained = time.perf_counter() - started
+
+        tg_stats = await fetch_stats(f"{tg_url}/stats")
+        gpt_stats = await fetch_stats(f"{gpt_url}/stats")
+    finally:
+        fakes.terminate()
+        fakes.join()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    updates = sum(len(values) for values in replay.timings.values())
+    interactions = args.sessions * args.rounds
+    tg_calls = sum(tg_stats["calls"].values())
+    gpt_calls = gpt_stats["chat"] + gpt_stats["transcriptions"]
+    steps = {}
+    for name, values in replay.timings.items():
+        values.sort()
+        steps[name] = {"count": len(values), "errors": replay.errors.get(name, 0),
+                       "p50": percentile(values, 50), "p95": percentile(values, 95), "p99": percentile(values, 99)}
+    return {
+        "sessions": args.sessions,
+        "rounds": args.rounds,
+        "updates": updates,
+        "import_seconds": import_seconds,
+        "handled_seconds": handled,
+        "drained_seconds": drained,
+        "throughput": updates / handled if handled else 0.0,
+        "steps": steps,
+        "telegram_calls": tg_stats["calls"],
+        "telegram_errors": tg_stats["errors"],
+        "openai_calls": gpt_stats,
+        "speculation": app.speculator.stats(),
+        "voice_spilled": app.voice_buffers.stats()["spilled"],
+        "telegram_per_interaction": tg_calls / interactions,
+        "openai_per_interaction": gpt_calls / interactions,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+# Функция вывода отчета
+def print_report(result: dict) -> None:
+    print(f"\nСессий: {result['sessions']} x {result['rounds']} сценариев, апдейтов: {result['updates']}")
+    print(f"Импорт app: {result['import_seconds']:.2f} сек, обработка: {result['handled_seconds']:.2f} сек, "
+          f"с доставкой: {result['drained_seconds']:.2f} сек")
+    print(f"Пропускная способность: {result['throughput']:.1f} апдейтов/сек")
+    print(f"\n{'шаг':<10}{'кол-во':>8}{'ошибок':>8}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}")
+    for name, step in result["steps"].items():
+        print(f"{name:<10}{step['count']:>8}{step['errors']:>8}"
+              f"{step['p50'] * 1000:>10.1f}{step['p95'] * 1000:>10.1f}{step['p99'] * 1000:>10.1f}")
+    print(f"\nЗапросов на сценарий: Telegram {result['telegram_per_interaction']:.1f}, "
+          f"OpenAI {result['openai_per_interaction']:.1f}")
+    print("Telegram по методам: " + ", ".join(f"{name} {count}" for name, count in sorted(result["telegram_calls"].items())))
+    if result["telegram_errors"]:
+        print("Внесенные ошибки Telegram: " + ", ".join(f"{name} {count}" for name, count in result["telegram_errors"].items()))
+    print(f"OpenAI: {result['openai_calls']}")
+    if result["speculation"]["enabled"]:
+        print(f"Упреждающая обработка: {result['speculation']}")
+    print(f"Голосовых сброшено во временный файл: {result['voice_spilled']}")
+    print(f"Пиковый RSS: {result['peak_rss_mb']:.1f} МБ")
+
+
+# Функция сравнения с сохраненным результатом
+def compare(result: dict, baseline: dict, tolerance: float, min_delta: float = 0.05) -> list[str]:
+    """
+    Список регрессий: p95 шагов, пропускная способность, запросы на сценарий и память.
+    Рост p95 меньше min_delta секунд не считается - у быстрых шагов это шум.
+    """
+    regressions = []
+    for name, step in result["steps"].items():
+        base = baseline["steps"].get(name)
+        if base and step["p95"] > base["p95"] * (1 + tolerance) and step["p95"] - base["p95"] > min_delta:
+            regressions.append(f"{name}: p95 {base['p95'] * 1000:.1f} -> {step['p95'] * 1000:.1f} мс")
+    if result["throughput"] < baseline["throughput"] * (1 - tolerance):
+        regressions.append(f"пропускная способность {baseline['throughput']:.1f} -> {result['throughput']:.1f}")
+    for key in ("telegram_per_interaction", "openai_per_interaction", "peak_rss_mb"):
+        if result[key] > baseline[key] * (1 + tolerance):
+            regressions.append(f"{key}: {baseline[key]:.1f} -> {result[key]:.1f}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк бота на поддельных Telegram и OpenAI",
+                                     epilog=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=10, help="одновременных администраторов")
+    parser.add_argument("--rounds", type=int, default=3, help="сценариев на администратора")
+    parser.add_argument("--script", type=lambda path: json.load(open(path, encoding="utf-8")), default=SCRIPT,
+                        help="JSON файл со сценарием (по умолчанию - встроенный)")
+    parser.add_argument("--tg-latency", type=float, default=0.03, help="задержка Telegram, сек")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="доля ответов 429 Telegram")
+    parser.add_argument("--tg-error-rate", type=float, default=0.0, help="доля ответов 500 Telegram")
+    parser.add_argument("--gpt-latency", type=float, default=0.3, help="задержка OpenAI, сек")
+    parser.add_argument("--gpt-per-char", type=float, default=0.0, help="задержка OpenAI на символ ответа, сек")
+    parser.add_argument("--gpt-error-rate", type=float, default=0.0, help="доля ответов 500 OpenAI")
+    parser.add_argument("--ui", choices=("reply", "inline"), default="reply", help="интерфейс редактора (EDITOR_UI)")
+    parser.add_argument("--think", type=float, default=0.0, help="пауза администратора между шагами, сек")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--drain-timeout", type=float, default=60.0, help="сколько ждать доставки в конце, сек")
+    parser.add_argument("--json", help="сохранить результат в файл")
+    parser.add_argument("--baseline", help="сравнить с сохраненным результатом")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="допустимое ухудшение при сравнении")
+    parser.add_argument("--min-delta", type=float, default=0.05, help="допустимый рост p95 шага, сек")
+    parser.add_argument("--verbose", action="store_true", help="не скрывать логи бота")
+    args = parser.parse_args()
+    if args.ui == "inline" and args.script is SCRIPT:
+        args.script = INLINE_SCRIPT
+
+    result = asyncio.run(run(args))
+    print_report(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
+
+    # Голосовые бенчмарка меньше VOICE_BUFFER_MB - ни одно не должно попасть на диск
+    if result["voice_spilled"]:
+        print(f"\nОшибка: {result['voice_spilled']} голосовых меньше VOICE_BUFFER_MB сброшены на диск")
+        sys.exit(1)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            regressions = compare(result, json.load(file), args.tolerance, args.min_delta)
+        if regressions:
+            print("\nРегрессии относительно " + args.baseline + ":\n" + "\n".join(regressions))
+            sys.exit(1)
+        print("\nРегрессий нет")
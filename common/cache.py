@@ -0,0 +1,192 @@
+import logging
+
+# Инициализируем логгер модуля
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.info("Загружен модуль: %s", __name__)
+
+import asyncio
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+
+# Функция нормализации текста перед хешированием
+def normalize_text(text: str) -> str:
+    """Приводит текст к единому виду: NFC, без лишних пробелов в строках и по краям"""
+    text = unicodedata.normalize("NFC", text)
+    lines = [re.sub(r"[ \t]+", " ", line).strip() for line in text.strip().splitlines()]
+    return "\n".join(lines)
+
+
+class ResultCache:
+    """
+    Кэш результатов обработки текста: LRU в памяти с ограничением по числу записей,
+    по объему и по времени жизни (TTL), плюс необязательный уровень на диске в SQLite.
+    """
+    def __init__(self,
+                 max_entries: int = 512,
+                 max_bytes: int = 8 * 1024 * 1024,
+                 ttl: float = 24 * 3600,
+                 db_path: str | None = None,
+                 table: str = "cache"):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.table = table
+        self._items: OrderedDict[str, tuple[str, float]] = OrderedDict()  # key -> (value, expires_at)
+        self._bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db: sqlite3.Connection | None = None
+        self._db_lock = threading.Lock()
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(f"CREATE TABLE IF NOT EXISTS {table} "
+                             "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)")
+            self._db.execute(f"DELETE FROM {table} WHERE expires_at < ?", (time.time(),))
+            self._db.commit()
+            logger.info("Дисковый кэш %s подключен: %s", table, db_path)
+
+    @staticmethod
+    def make_key(operation: str, model: str, prompt_version: int | str, text: str) -> str:
+        """Ключ кэша: операция, модель, версия промпта и хеш нормализованного текста"""
+        digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+        return f"{operation}:{model}:v{prompt_version}:{digest}"
+
+    @staticmethod
+    def _size(key: str, value: str) -> int:
+        return len(key) + len(value.encode("utf-8"))
+
+    def _evict(self) -> None:
+        """Вытесняет самые старые по использованию записи, пока не уложимся в лимиты"""
+        while self._items and (len(self._items) > self.max_entries or self._bytes > self.max_bytes):
+            key, (value, _) = self._items.popitem(last=False)
+            self._bytes -= self._size(key, value)
+
+    def _put_memory(self, key: str, value: str, expires_at: float) -> None:
+        old = self._items.pop(key, None)
+        if old is not None:
+            self._bytes -= self._size(key, old[0])
+        self._items[key] = (value, expires_at)
+        self._bytes += self._size(key, value)
+        self._evict()
+
+    def _db_get(self, key: str) -> tuple[str, float] | None:
+        with self._db_lock:
+            row = self._db.execute(f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return row[0], row[1]
+
+    def _db_set(self, key: str, value: str, expires_at: float) -> None:
+        with self._db_lock:
+            self._db.execute(f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",
+                             (key, value, expires_at))
+            self._db.commit()
+
+    async def _lookup(self, key: str) -> tuple[str | None, bool]:
+        """Ищет значение в памяти, затем на диске, без счетчиков: (значение или None, найдено ли на диске)"""
+        item = self._items.get(key)
+        if item is not None:
+            if item[1] >= time.time():
+                self._items.move_to_end(key)
+                return item[0], False
+            self._items.pop(key)
+            self._bytes -= self._size(key, item[0])
+
+        if self._db is not None:
+            try:
+                row = await asyncio.to_thread(self._db_get, key)
+            except Exception as e:
+                logger.error("Ошибка чтения дискового кэша: %s", e)
+                row = None
+            if row is not None:
+                self._put_memory(key, row[0], row[1])
+                return row[0], True
+
+        return None, False
+
+    def _count(self, value: str | None, from_disk: bool) -> None:
+        if value is None:
+            self.misses += 1
+            return
+        self.hits += 1
+        if from_disk:
+            self.disk_hits += 1
+
+    async def get(self, key: str) -> str | None:
+        """Возвращает значение из кэша, либо None"""
+        value, from_disk = await self._lookup(key)
+        self._count(value, from_disk)
+        return value
+
+    async def set(self, key: str, value: str) -> None:
+        """Сохраняет значение в памяти и, если подключен, на диске"""
+        expires_at = time.time() + self.ttl
+        self._put_memory(key, value, expires_at)
+        if self._db is not None:
+            try:
+                await asyncio.to_thread(self._db_set, key, value, expires_at)
+            except Exception as e:
+                logger.error("Ошибка записи дискового кэша: %s", e)
+
+    def stats(self) -> dict:
+        """Счетчики кэша для /status"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total * 100 if total else 0.0,
+            "entries": len(self._items),
+            "bytes": self._bytes,
+        }
+
+    def close(self) -> None:
+        """Закрывает соединение с дисковым кэшем"""
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
+
+
+class TranscriptCache(ResultCache):
+    """
+    Кэш распознанных голосовых сообщений по file_unique_id из Telegram.
+    Дополнительно считает, сколько секунд аудио не пришлось скачивать и распознавать повторно.
+    """
+    def __init__(self, *args, table: str = "transcripts", **kwargs):
+        super().__init__(*args, table=table, **kwargs)
+        self.saved_seconds = 0
+
+    @staticmethod
+    def make_voice_key(file_unique_id: str, language: str, model: str) -> str:
+        """Ключ кэша: file_unique_id голосового, язык и модель распознавания"""
+        return f"voice:{model}:{language}:{file_unique_id}"
+
+    async def get_voice(self, keys: list[str], duration: int) -> str | None:
+        """
+        Возвращает расшифровку по первому найденному ключу (одно голосовое - несколько моделей)
+        и учитывает длительность сэкономленного аудио. На голосовое - одно попадание или один промах.
+        """
+        text, from_disk = None, False
+        for key in keys:
+            text, from_disk = await self._lookup(key)
+            if text is not None:
+                break
+        self._count(text, from_disk)
+        if text is not None:
+            self.saved_seconds += duration
+        return text
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats["saved_seconds"] = self.saved_seconds
+        return stats
@@ -0,0 +1,111 @@
+import logging
+
+# Инициализируем логгер модуля
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.info("Загружен модуль: %s", __name__)
+
+import asyncio
+import time
+from dataclasses import dataclass
+
+from aiogram import Bot
+from aiogram.enums import ChatMemberStatus
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+
+@dataclass
+class ChannelInfo:
+    """Сведения о канале для публикации"""
+    id: int
+    name: str                       # Название из конфига (CHANNELS)
+    title: str | None = None        # Название чата в Telegram
+    can_post: bool | None = None    # Может ли бот публиковать (None - неизвестно, публикацию пробуем)
+    error: str | None = None        # Ошибка последней проверки
+    checked_at: float = 0.0         # time.monotonic() последней проверки
+
+
+class ChannelRegistry:
+    """
+    Кэш каналов для публикации: название, права бота и результат последней проверки.
+    Проверка (get_chat + get_chat_member) выполняется в фоне раз в ttl/2 секунд,
+    поэтому при публикации остается один запрос на канал - сама отправка.
+    """
+    def __init__(self, bot: Bot, channels: dict[str, int | str], ttl: float = 3600.0):
+        self.bot = bot
+        self.ttl = ttl
+        # Словари id -> сведения и id -> название, без перебора chanel_dict
+        self.channels: dict[int, ChannelInfo] = {int(chat_id): ChannelInfo(id=int(chat_id), name=name)
+                                                 for name, chat_id in channels.items()}
+        self.names: dict[int, str] = {info.id: info.name for info in self.channels.values()}
+        self._task: asyncio.Task | None = None
+
+    async def check(self, chat_id: int) -> ChannelInfo:
+        """Проверяет канал и права бота в нем, обновляет кэш"""
+        info = self.channels[chat_id]
+        try:
+            chat = await self.bot.get_chat(chat_id=chat_id)
+            member = await self.bot.get_chat_member(chat_id=chat_id, user_id=self.bot.id)
+            info.title = chat.title
+            if member.status == ChatMemberStatus.CREATOR:
+                info.can_post = True
+            elif member.status == ChatMemberStatus.ADMINISTRATOR:
+                # В группах у администратора нет флага can_post_messages - писать может всегда
+                info.can_post = member.can_post_messages is not False
+            else:
+                info.can_post = member.status == ChatMemberStatus.MEMBER and chat.type != "channel"
+            info.error = None if info.can_post else f"у бота нет прав на публикацию ({member.status})"
+        except (TelegramBadRequest, TelegramForbiddenError) as e:
+            # Чат не найден или бот исключен - публиковать некуда
+            info.can_post = False
+            info.error = str(e)
+        except Exception as e:
+            # Сетевая или временная ошибка - прежний результат проверки оставляем
+            info.error = str(e)
+        info.checked_at = time.monotonic()
+        if info.error:
+            logger.warning("Канал %s (%s): %s", info.name, chat_id, info.error)
+        return info
+
+    async def get(self, chat_id: int) -> ChannelInfo:
+        """Сведения о канале из кэша, проверка - только если запись устарела"""
+        info = self.channels[chat_id]
+        if not info.checked_at or time.monotonic() - info.checked_at > self.ttl:
+            info = await self.check(chat_id)
+        return info
+
+    def invalidate(self, chat_id: int, error: str) -> None:
+        """Помечает канал недоступным после неудачной отправки, до следующей проверки"""
+        info = self.channels.get(chat_id)
+        if info is not None:
+            info.can_post = False
+            info.error = error
+            # Следующая публикация перепроверит канал, а не будет ждать фонового обновления
+            info.checked_at = 0.0
+
+    async def refresh(self) -> None:
+        """Перепроверяет все каналы параллельно"""
+        await asyncio.gather(*(self.check(chat_id) for chat_id in self.channels))
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error("Ошибка обновления сведений о каналах: %s", e)
+            await asyncio.sleep(self.ttl / 2)
+
+    def start(self) -> None:
+        """Запускает фоновое обновление сведений о каналах"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="channel-registry")
+
+    async def stop(self) -> None:
+        """Останавливает фоновое обновление"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
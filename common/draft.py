@@ -0,0 +1,407 @@
+import logging
+
+# Инициализируем логгер модуля
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.info("Загружен модуль: %s", __name__)
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from config_data.config import DraftConfig
+from common.metrics import REGISTRY
+
+
+class Draft:
+    """
+    Черновик пользователя с историей правок.
+    Каждый текст фрагмента хранится один раз (id -> текст), а ревизия черновика - это кортеж id фрагментов,
+    поэтому соседние ревизии делят все неизмененные фрагменты и правка одного фрагмента не копирует остальные.
+    История линейная: undo/redo двигают указатель, новая правка после undo отбрасывает ветку redo.
+    Старые ревизии вытесняются, когда их больше max_revisions или тексты истории занимают больше max_bytes;
+    текущая ревизия не вытесняется никогда.
+    Каждое изменение записывается в pending компактной дельтой - DraftStore дописывает их в журнал.
+    """
+    def __init__(self,
+                 max_revisions: int = 30,
+                 max_bytes: int = 1024 * 1024,
+                 max_fragments: int = 50,
+                 max_chars: int = 50_000):
+        self.max_revisions = max(max_revisions, 1)
+        self.max_bytes = max_bytes
+        self.max_fragments = max_fragments
+        self.max_chars = max_chars
+        self.texts: dict[int, str] = {}                 # id фрагмента -> текст
+        self.sizes: dict[int, int] = {}                 # id фрагмента -> размер текста в байтах
+        self.revisions: list[tuple[int, ...]] = [()]   # ревизии черновика, первая - пустой черновик
+        self.labels: list[str] = [""]                  # какой командой получена ревизия
+        self.position = 0                              # индекс текущей ревизии
+        self.next_id = 1
+        self.history_bytes = 0
+        self.pending: list[dict[str, Any]] = []        # дельты, еще не записанные в журнал
+        self.logged = 0                                # дельт в журнале после последнего снимка
+        self.touched = 0.0                             # когда черновик последний раз брали из хранилища
+
+    # --- Чтение ---
+
+    @property
+    def ids(self) -> tuple[int, ...]:
+        return self.revisions[self.position]
+
+    @property
+    def fragments(self) -> list[str]:
+        return [self.texts[fragment_id] for fragment_id in self.ids]
+
+    @property
+    def last(self) -> str | None:
+        return self.texts[self.ids[-1]] if self.ids else None
+
+    @property
+    def last_id(self) -> int | None:
+        return self.ids[-1] if self.ids else None
+
+    @property
+    def can_undo(self) -> bool:
+        return self.position > 0
+
+    @property
+    def can_redo(self) -> bool:
+        return self.position < len(self.revisions) - 1
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def history(self, index: int) -> list[str]:
+        """Все сохраненные версии фрагмента index текущей ревизии, от старых к новым"""
+        versions = []
+        for revision in self.revisions[:self.position + 1]:
+            if len(revision) > index and (not versions or versions[-1] != revision[index]):
+                versions.append(revision[index])
+        return [self.texts[fragment_id] for fragment_id in versions]
+
+    # --- Изменения ---
+
+    def add(self, text: str) -> None:
+        """Добавляет фрагмент в конец черновика"""
+        if len(text) > self.max_chars:
+            logger.warning("Фрагмент обрезан по объему: лимит %s символов", self.max_chars)
+            text = text[-self.max_chars:]
+        fragment_id = self._new_text(text)
+        self._record({"op": "rev", "ids": list(self._cap(self.ids + (fragment_id,))), "label": "add"})
+
+    def merge(self, separator: str = "\n") -> bool:
+        """Объединяет все фрагменты в один. False - объединять нечего"""
+        if len(self.ids) < 2:
+            return False
+        fragment_id = self._new_text(separator.join(self.fragments))
+        self._record({"op": "rev", "ids": [fragment_id], "label": "merge"})
+        return True
+
+    def replace(self, fragment_id: int, text: str, label: str) -> bool:
+        """
+        Заменяет фрагмент новой версией (результат fix, rephrase).
+        False - фрагмента в текущей ревизии уже нет (его удалили или отменили, пока шел запрос).
+        """
+        if fragment_id not in self.ids:
+            return False
+        if self.texts[fragment_id] == text:
+            return True
+        new_id = self._new_text(text)
+        ids = [new_id if current == fragment_id else current for current in self.ids]
+        self._record({"op": "rev", "ids": ids, "label": label})
+        return True
+
+    def undo(self) -> str | None:
+        """Возвращает к предыдущей ревизии. Результат - команда, которую отменили, None - отменять нечего"""
+        if not self.can_undo:
+            return None
+        label = self.labels[self.position]
+        self._record({"op": "move", "to": self.position - 1})
+        return label
+
+    def redo(self) -> str | None:
+        """Повторяет отмененную правку. Результат - команда, которую вернули, None - возвращать нечего"""
+        if not self.can_redo:
+            return None
+        self._record({"op": "move", "to": self.position + 1})
+        return self.labels[self.position]
+
+    # --- Дельты ---
+
+    def _new_text(self, text: str) -> int:
+        fragment_id = self.next_id
+        self._record({"op": "text", "id": fragment_id, "s": text})
+        return fragment_id
+
+    def _record(self, delta: dict[str, Any]) -> None:
+        self.apply(delta)
+        self.pending.append(delta)
+
+    def apply(self, delta: dict[str, Any]) -> None:
+        """Применяет дельту: и для живых изменений, и при восстановлении из журнала"""
+        op = delta["op"]
+        if op == "text":
+            fragment_id = delta["id"]
+            self.texts[fragment_id] = delta["s"]
+            self.sizes[fragment_id] = len(delta["s"].encode())
+            self.history_bytes += self.sizes[fragment_id]
+            self.next_id = max(self.next_id, fragment_id + 1)
+        elif op == "rev":
+            # Новая правка отбрасывает отмененные ревизии (ветку redo)
+            del self.revisions[self.position + 1:]
+            del self.labels[self.position + 1:]
+            self.revisions.append(tuple(delta["ids"]))
+            self.labels.append(delta["label"])
+            self.position = len(self.revisions) - 1
+            self._evict()
+        elif op == "move":
+            self.position = delta["to"]
+        else:
+            raise ValueError(f"Неизвестная дельта черновика: {op}")
+
+    def _cap(self, ids: tuple[int, ...]) -> tuple[int, ...]:
+        """Не больше max_fragments фрагментов и max_chars символов, старые фрагменты отбрасываются"""
+        if len(ids) > self.max_fragments:
+            logger.warning("Черновик обрезан: %s фрагментов, лимит %s", len(ids), self.max_fragments)
+            ids = ids[-self.max_fragments:]
+        total = 0
+        for index in range(len(ids) - 1, -1, -1):
+            total += len(self.texts[ids[index]])
+            if total > self.max_chars:
+                logger.warning("Черновик обрезан по объему: лимит %s символов", self.max_chars)
+                return ids[index + 1:]
+        return ids
+
+    def _evict(self) -> None:
+        """Вытесняет старые ревизии по числу и объему и удаляет тексты, на которые больше никто не ссылается"""
+        self._collect()
+        dropped = 0
+        while self.position > 0 and (len(self.revisions) > self.max_revisions or self.history_bytes > self.max_bytes):
+            self.revisions.pop(0)
+            self.labels.pop(0)
+            self.position -= 1
+            dropped += 1
+            self._collect()
+        if dropped:
+            REGISTRY.inc("bot_draft_revisions_evicted_total", dropped)
+
+    def _collect(self) -> None:
+        alive = set().union(*self.revisions)
+        for fragment_id in [fragment_id for fragment_id in self.texts if fragment_id not in alive]:
+            del self.texts[fragment_id]
+            self.history_bytes -= self.sizes.pop(fragment_id)
+
+    # --- Снимок ---
+
+    def snapshot(self) -> dict[str, Any]:
+        return {"texts": {str(fragment_id): text for fragment_id, text in self.texts.items()},
+                "revisions": [list(revision) for revision in self.revisions],
+                "labels": self.labels,
+                "position": self.position,
+                "next_id": self.next_id}
+
+    def restore(self, snapshot: dict[str, Any]) -> None:
+        self.texts = {int(fragment_id): text for fragment_id, text in snapshot["texts"].items()}
+        self.sizes = {fragment_id: len(text.encode()) for fragment_id, text in self.texts.items()}
+        self.history_bytes = sum(self.sizes.values())
+        self.revisions = [tuple(revision) for revision in snapshot["revisions"]]
+        self.labels = list(snapshot["labels"])
+        self.position = snapshot["position"]
+        self.next_id = snapshot["next_id"]
+
+
+class DraftStore:
+    """
+    Черновики пользователей. В памяти - объекты Draft, на диске (db_path) - журнал дельт:
+    изменение черновика дописывает в базу пару коротких строк, а не весь черновик целиком.
+    Когда в журнале черновика набирается compact_every дельт, он сворачивается в снимок, а журнал очищается.
+    Без db_path черновики живут только в памяти, как в MemoryStorage.
+    Черновик, к которому не обращались дольше ttl, считается брошенным, как просроченная сессия FSM.
+    В памяти держится не больше cache_size черновиков: с журналом вытесненный черновик дочитывается с диска,
+    без него - пропадает.
+    """
+    def __init__(self, config: DraftConfig, ttl: float = 7 * 24 * 3600):
+        self.config = config
+        self.ttl = ttl
+        self._drafts: OrderedDict[int, Draft] = OrderedDict()
+        self._db: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self._executor: ThreadPoolExecutor | None = None
+        self.deltas_written = 0
+        self.bytes_written = 0
+        self.compactions = 0
+        self.evicted = 0
+
+        if config.db_path:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="drafts-sqlite")
+            self._db = sqlite3.connect(config.db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS drafts "
+                             "(user_id INTEGER PRIMARY KEY, snapshot TEXT, updated_at REAL NOT NULL)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS draft_log "
+                             "(id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, delta TEXT NOT NULL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS draft_log_user ON draft_log (user_id, id)")
+            self._purge_expired()
+            logger.info("Журнал черновиков в SQLite: %s", config.db_path)
+
+    def _new_draft(self) -> Draft:
+        return Draft(max_revisions=self.config.max_revisions,
+                     max_bytes=int(self.config.max_history_mb * 1024 * 1024),
+                     max_fragments=self.config.max_fragments,
+                     max_chars=self.config.max_chars)
+
+    # --- База ---
+
+    def _purge_expired(self) -> None:
+        with self._lock:
+            expired = time.time() - self.ttl
+            self._db.execute("DELETE FROM draft_log WHERE user_id IN (SELECT user_id FROM drafts WHERE updated_at < ?)",
+                             (expired,))
+            deleted = self._db.execute("DELETE FROM drafts WHERE updated_at < ?", (expired,)).rowcount
+            self._db.commit()
+        if deleted:
+            logger.info("Удалено брошенных черновиков: %s", deleted)
+
+    def _db_load(self, user_id: int) -> tuple[str | None, list[str]]:
+        with self._lock:
+            row = self._db.execute("SELECT snapshot, updated_at FROM drafts WHERE user_id = ?", (user_id,)).fetchone()
+            if row is None or row[1] < time.time() - self.ttl:
+                return None, []
+            log = self._db.execute("SELECT delta FROM draft_log WHERE user_id = ? ORDER BY id", (user_id,)).fetchall()
+        return row[0], [delta for delta, in log]
+
+    def _db_append(self, user_id: int, deltas: list[str], snapshot: str | None) -> None:
+        # Снимок заменяет весь журнал черновика, иначе просто дописываем дельты
+        with self._lock:
+            now = time.time()
+            if snapshot is not None:
+                self._db.execute("DELETE FROM draft_log WHERE user_id = ?", (user_id,))
+                self._db.execute("INSERT INTO drafts (user_id, snapshot, updated_at) VALUES (?, ?, ?) "
+                                 "ON CONFLICT(user_id) DO UPDATE SET snapshot = excluded.snapshot, "
+                                 "updated_at = excluded.updated_at", (user_id, snapshot, now))
+            else:
+                self._db.executemany("INSERT INTO draft_log (user_id, delta) VALUES (?, ?)",
+                                     [(user_id, delta) for delta in deltas])
+                self._db.execute("INSERT INTO drafts (user_id, snapshot, updated_at) VALUES (?, NULL, ?) "
+                                 "ON CONFLICT(user_id) DO UPDATE SET updated_at = excluded.updated_at", (user_id, now))
+            self._db.commit()
+
+    def _db_delete(self, user_id: int) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM draft_log WHERE user_id = ?", (user_id,))
+            self._db.execute("DELETE FROM drafts WHERE user_id = ?", (user_id,))
+            self._db.commit()
+
+    async def _run(self, func, *args):
+        """Выполняет запрос к базе в отдельном потоке; один поток - запросы идут строго по очереди"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    # --- Черновики ---
+
+    def _remember(self, user_id: int, draft: Draft) -> None:
+        now = time.monotonic()
+        draft.touched = now
+        self._drafts[user_id] = draft
+        self._drafts.move_to_end(user_id)
+        # Словарь упорядочен по давности обращения: брошенные и лишние черновики - в начале
+        excess = len(self._drafts) - self.config.cache_size
+        victims = []
+        for oldest_id, oldest in self._drafts.items():
+            if oldest_id == user_id or (excess <= 0 and now - oldest.touched <= self.ttl):
+                break
+            if self._db is not None and oldest.pending:
+                # Дельты не записаны в журнал (save не удался) - вытеснение их потеряло бы, черновик остается
+                continue
+            victims.append(oldest_id)
+            excess -= 1
+        for oldest_id in victims:
+            del self._drafts[oldest_id]
+            if self._db is None:
+                self.evicted += 1
+                REGISTRY.inc("bot_draft_evicted_total")
+
+    async def get(self, user_id: int) -> Draft:
+        """Черновик пользователя: из памяти, из журнала или новый пустой"""
+        draft = self._drafts.get(user_id)
+        if draft is not None and time.monotonic() - draft.touched > self.ttl and not draft.pending:
+            # Черновик брошен дольше ttl - начинаем новый
+            del self._drafts[user_id]
+            draft = None
+        if draft is None:
+            draft = self._new_draft()
+            if self._db is not None:
+                snapshot, log = await self._run(self._db_load, user_id)
+                if snapshot:
+                    draft.restore(json.loads(snapshot))
+                for delta in log:
+                    draft.apply(json.loads(delta))
+                draft.logged = len(log)
+            # Пока ждали базу, черновик могли создать - тогда берем его (пустой черновик тоже: len() == 0)
+            existing = self._drafts.get(user_id)
+            draft = existing if existing is not None else draft
+        self._remember(user_id, draft)
+        return draft
+
+    async def save(self, user_id: int, draft: Draft) -> None:
+        """
+        Записывает накопленные дельты черновика в журнал (или снимок, если журнал разросся).
+        Дельты снимаются с черновика только после записи: если база не ответила, они уйдут со следующим save.
+        """
+        deltas = list(draft.pending)
+        if self._db is None or not deltas:
+            draft.pending.clear()
+            return
+        dumped = [json.dumps(delta, ensure_ascii=False) for delta in deltas]
+        snapshot = None
+        if draft.logged + len(dumped) >= self.config.compact_every:
+            snapshot = json.dumps(draft.snapshot(), ensure_ascii=False)
+        await self._run(self._db_append, user_id, dumped, snapshot)
+
+        # Пока шла запись, черновик могли изменить - снимаем только записанные дельты
+        del draft.pending[:len(deltas)]
+        if snapshot is not None:
+            draft.logged = 0
+            self.compactions += 1
+            REGISTRY.inc("bot_draft_compactions_total")
+        else:
+            draft.logged += len(dumped)
+        written = len(snapshot.encode()) if snapshot is not None else sum(len(delta.encode()) for delta in dumped)
+        self.deltas_written += len(dumped)
+        self.bytes_written += written
+        REGISTRY.inc("bot_draft_write_bytes_total", written)
+
+    async def clear(self, user_id: int) -> None:
+        """Удаляет черновик вместе с историей (публикация, отмена)"""
+        self._drafts.pop(user_id, None)
+        if self._db is not None:
+            await self._run(self._db_delete, user_id)
+
+    async def close(self) -> None:
+        if self._db is not None:
+            await self._run(self._db.close)
+            self._executor.shutdown(wait=True)
+        logger.info("Хранилище черновиков закрыто")
+
+    def stats(self) -> dict:
+        """Счетчики для /status"""
+        return {
+            "drafts": len(self._drafts),
+            "revisions": sum(len(draft.revisions) for draft in self._drafts.values()),
+            "history_bytes": sum(draft.history_bytes for draft in self._drafts.values()),
+            "deltas_written": self.deltas_written,
+            "bytes_written": self.bytes_written,
+            "compactions": self.compactions,
+            "evicted": self.evicted,
+        }
+
+
+REGISTRY.describe("bot_draft_revisions_evicted_total", "Ревизии черновиков, вытесненные из истории правок")
+REGISTRY.describe("bot_draft_evicted_total", "Черновики без журнала, удаленные из памяти по ttl или cache_size")
+REGISTRY.describe("bot_draft_compactions_total", "Сворачивания журнала черновика в снимок")
+REGISTRY.describe("bot_draft_write_bytes_total", "Байты, записанные в журнал черновиков")
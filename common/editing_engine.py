@@ -0,0 +1,302 @@
+import logging
+
+# Инициализируем логгер модуля
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.info("Загружен модуль: %s", __name__)
+
+import time
+from dataclasses import dataclass, replace
+from typing import Awaitable, Callable
+
+from config_data.config import GptConfig, RouterConfig
+from common.gpt_client import get_client, get_caller
+from common.llm_resilience import LLMError
+from common.metrics import REGISTRY
+from common.cache import ResultCache
+from common.text_chunks import split_text, process_chunks
+from common.model_router import ModelRouter, Route
+from common.text_edits import EditError, apply_edits, parse_edits
+from common.tokens import count_tokens
+
+
+@dataclass(frozen=True)
+class Operation:
+    """
+    Операция редактирования текста: промпт и параметры модели.
+    При изменении текста промпта увеличиваем prompt_version - старые записи кэша перестанут совпадать.
+    """
+    name: str
+    system_prompt: str
+    instruction: str                # Строка перед текстом в сообщении пользователя
+    prompt_version: int = 1
+    model: str = "gpt-4o"
+    max_tokens: int | None = None   # None - max_tokens выбирает роутер по размеру текста
+    temperature: float | None = None  # None - значение по умолчанию сервера
+    json_output: bool = False       # Просить ответ в формате JSON (response_format=json_object)
+    edit_list: str | None = None    # Операция, отвечающая списком правок вместо всего текста
+
+
+# Встроенные операции
+FIX = Operation(
+    name="fix",
+    system_prompt="""Ты опытный редактор текста. Твоя задача:
+                            1. Исправить грамматические и пунктуационные ошибки
+                            2. Обеспечить правильное написание заглавных букв (начало предложений, имена собственные)
+                            3. Расставить корректные знаки препинания
+                            4. НЕ менять порядок слов и смысл текста
+                            5. НЕ добавлять новую информацию
+                            6. НЕ писать ни чего от себя
+                            7. Сохранить исходный стиль автора""",
+    instruction="Исправь этот текст",
+    prompt_version=1,
+    temperature=0.0,
+    edit_list="fix_edits",
+    )
+
+# Исправление списком правок: модель возвращает только измененные фрагменты, текст собирается локально
+FIX_EDITS = Operation(
+    name="fix_edits",
+    system_prompt="""Ты опытный редактор текста. Найди в тексте ошибки:
+                            1. Грамматические и пунктуационные ошибки
+                            2. Неправильное написание заглавных букв (начало предложений, имена собственные)
+                            3. Пропущенные или лишние знаки препинания
+                            НЕ меняй порядок слов и смысл текста, НЕ добавляй новую информацию, сохрани стиль автора.
+                            Верни только JSON: {"edits": [{"old": "фрагмент", "new": "исправленный фрагмент"}]}
+                            old - дословная цитата из текста, 2-6 слов вокруг ошибки, чтобы фрагмент был однозначным.
+                            Правки перечисляй в порядке следования в тексте, фрагменты не должны пересекаться.
+                            Если ошибок нет, верни {"edits": []}""",
+    instruction="Найди ошибки в этом тексте",
+    prompt_version=1,
+    temperature=0.0,
+    json_output=True,
+    )
+
+REPHRASE = Operation(
+    name="rephrase",
+    system_prompt="""Ты опытный литературный редактор. Твоя задача:
+                            1. Переформулировать текст, сделав его более лаконичным и литературным
+                            2. Улучшить стиль изложения, сохраняя естественность речи
+                            3. Исправить грамматические и пунктуационные ошибки
+                            4. Сохранить основной смысл, идею и посыл текста
+                            5. НЕ добавлять новую информацию или факты
+                            6. НЕ менять эмоциональный окрас текста
+                            7. НЕ писать ни чего от себя""",
+    instruction="Переформулируй этот текст",
+    prompt_version=1,
+    temperature=0.7,
+    )
+
+
+class EditingEngine:
+    """
+    Движок редактирования текста: реестр операций и их выполнение через OpenAI-совместимый API
+    (api.openai.com, локальный llama.cpp / vLLM сервер или тестовый fake_openai - задается GPT_BASE_URL).
+    Модель и max_tokens для каждого текста выбирает ModelRouter, запрос идет через общий клиент
+    и LLMCaller, результат кэшируется, длинный текст режется на куски.
+    """
+    def __init__(self, config: GptConfig | None = None, router_config: RouterConfig | None = None):
+        self.config = config or GptConfig()
+        self.router = ModelRouter(router_config or RouterConfig())
+        self.operations: dict[str, Operation] = {}
+        # Операции, модель которых задана в конфиге - роутер ее не меняет
+        self.pinned: set[str] = set()
+
+    def register(self, operation: Operation) -> None:
+        """Добавляет операцию в реестр. Модель из конфига (GPT_MODEL, GPT_OPERATION_MODELS) имеет приоритет"""
+        model = self.config.operation_models.get(operation.name) or self.config.model
+        if model:
+            self.pinned.add(operation.name)
+        self.operations[operation.name] = replace(operation, model=model or operation.model)
+        logger.info("Операция %s: модель %s", operation.name, model or operation.model)
+
+    def get(self, name: str) -> Operation:
+        try:
+            return self.operations[name]
+        except KeyError:
+            raise LLMError(f"Неизвестная операция: {name}") from None
+
+    def route(self, operation: Operation, text: str) -> Route:
+        """Модель и max_tokens для текста"""
+        if self.router.latency is None:
+            self.router.latency = get_caller().latency
+        return self.router.route(operation.name, operation.model, text, operation.max_tokens,
+                                 pinned=operation.name in self.pinned)
+
+    async def complete(self, operation: Operation, user_content: str,
+                       on_partial: Callable[[str], Awaitable[None]] | None = None,
+                       route: Route | None = None) -> tuple[str, str]:
+        """
+        Отправляет запрос модели через слой повторов и предохранителей.
+        Если передан on_partial, читает ответ потоком и отдает накопленный текст.
+        Возвращает ответ и модель, которая его дала.
+        """
+        route = route or self.route(operation, user_content)
+        messages = [
+            {"role": "system", "content": operation.system_prompt},
+            {"role": "user", "content": user_content}]
+        params = {}
+        if operation.temperature is not None:
+            params["temperature"] = operation.temperature
+        if operation.json_output:
+            params["response_format"] = {"type": "json_object"}
+
+        async def send(model: str, max_tokens: int | None) -> tuple[str, str | None]:
+            limit = {} if max_tokens is None else {"max_tokens": max_tokens}
+            if on_partial is None:
+                response = await get_client().chat.completions.create(model=model, messages=messages,
+                                                                      **params, **limit)
+                return response.choices[0].message.content, response.choices[0].finish_reason
+
+            stream = await get_client().chat.completions.create(model=model, messages=messages,
+                                                                 stream=True, **params, **limit)
+            content, finish_reason = "", None
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    content += chunk.choices[0].delta.content
+                    await on_partial(content)
+                if chunk.choices and chunk.choices[0].finish_reason:
+                    finish_reason = chunk.choices[0].finish_reason
+            return content, finish_reason
+
+        async def request(model: str) -> tuple[str, str]:
+            async with REGISTRY.timer("gpt", model=model, operation=operation.name):
+                content, finish_reason = await send(model, route.max_tokens)
+                # Оценка max_tokens оказалась мала - повторяем без предела, обрезанный текст не отдаем
+                if finish_reason == "length" and operation.max_tokens is None and route.max_tokens is not None:
+                    logger.warning("%s: ответ %s обрезан на max_tokens=%s, повторяем без предела",
+                                   operation.name, model, route.max_tokens)
+                    REGISTRY.inc("bot_llm_truncated_total", operation=operation.name, model=model)
+                    content, finish_reason = await send(model, None)
+
+            if not content:
+                raise ValueError("Модель вернула пустой ответ")
+            return content, model
+
+        started = time.monotonic()
+        result, model = await get_caller().call(operation.name, route.model, request, size=len(user_content))
+        seconds = time.monotonic() - started
+        # Маршрут и фактическое время - по этим строкам подбираются пороги роутера
+        logger.info("Маршрут %s: %s токенов -> %s (%s), max_tokens %s, ответ %s за %.2f сек",
+                    operation.name, route.tokens, route.model, route.reason, route.max_tokens, model, seconds)
+        REGISTRY.inc("bot_llm_route_total", operation=operation.name, model=model, reason=route.reason)
+        REGISTRY.observe("bot_llm_route_seconds", seconds, operation=operation.name, reason=route.reason)
+        return result, model
+
+    async def cached_complete(self, operation: Operation, text: str,
+                              on_partial: Callable[[str], Awaitable[None]] | None = None,
+                              cache: ResultCache | None = None) -> str:
+        """Возвращает результат из кэша, либо запрашивает модель и сохраняет ответ в кэш"""
+        if self.wants_edit_list(operation, text):
+            result = await self.edit_list_complete(self.operations[operation.edit_list], text, cache)
+            if result is not None:
+                return result
+
+        route = self.route(operation, text)
+        key = ResultCache.make_key(operation.name, route.model, operation.prompt_version, text)
+        if cache is not None:
+            cached = await cache.get(key)
+            if cached is not None:
+                logger.info("Результат %s взят из кэша", operation.name)
+                return cached
+
+        result, model = await self.complete(operation, f"{operation.instruction}:\n\n{text}", on_partial, route)
+        # Ответ запасной модели не кэшируем под ключом выбранной
+        if cache is not None and model == route.model:
+            await cache.set(key, result)
+        return result
+
+    def wants_edit_list(self, operation: Operation, text: str) -> bool:
+        """Просить ли у модели список правок вместо всего текста (GPT_EDIT_MODE)"""
+        if operation.edit_list not in self.operations or self.config.edit_mode == "full":
+            return False
+        return self.config.edit_mode == "edits" or count_tokens(text, operation.model) >= self.config.edit_min_tokens
+
+    async def edit_list_complete(self, operation: Operation, text: str, cache: ResultCache | None = None) -> str | None:
+        """
+        Запрашивает список правок и применяет его к тексту локально.
+        Возвращает None, если модель не ответила или правки не разобрались и не применились - тогда нужен полный ответ.
+        """
+        route = self.route(operation, text)
+        key = ResultCache.make_key(operation.name, route.model, operation.prompt_version, text)
+        if cache is not None:
+            cached = await cache.get(key)
+            if cached is not None:
+                logger.info("Результат %s взят из кэша", operation.name)
+                return cached
+
+        try:
+            raw, model = await self.complete(operation, f"{operation.instruction}:\n\n{text}", None, route)
+        except LLMError as e:
+            # Например, локальный сервер не поддерживает response_format - пробуем обычный запрос
+            logger.warning("%s: список правок не получен, запрашиваем весь текст: %s", operation.name, e)
+            REGISTRY.inc("bot_llm_edit_list_total", operation=operation.name, result="fallback")
+            return None
+        try:
+            edits = parse_edits(raw)
+            result = apply_edits(text, edits)
+        except EditError as e:
+            logger.warning("%s: правки не применились, запрашиваем весь текст: %s", operation.name, e)
+            REGISTRY.inc("bot_llm_edit_list_total", operation=operation.name, result="fallback")
+            return None
+
+        logger.info("%s: %s правок, ответ %s символов вместо ~%s", operation.name, len(edits), len(raw), len(text))
+        REGISTRY.inc("bot_llm_edit_list_total", operation=operation.name, result="applied")
+        if cache is not None and model == route.model:
+            await cache.set(key, result)
+        return result
+
+    async def run(self, name: str, text: str,
+                  on_partial: Callable[[str], Awaitable[None]] | None = None,
+                  cache: ResultCache | None = None) -> str:
+        """Выполняет операцию над текстом. Длинный текст делится на куски и обрабатывается параллельно"""
+        operation = self.get(name)
+        try:
+            chunks = split_text(text, self.config.chunk_tokens)
+            if len(chunks) == 1:
+                return await self.cached_complete(operation, text, on_partial, cache)
+
+            logger.info("Операция %s: текст разбит на %s кусков", name, len(chunks))
+
+            async def worker(chunk: str) -> str:
+                if not chunk.strip():
+                    return chunk
+                return await self.cached_complete(operation, chunk, None, cache)
+
+            return await process_chunks(chunks, worker,
+                                        concurrency=self.config.chunk_concurrency,
+                                        on_progress=on_partial)
+        except LLMError:
+            raise
+        except Exception as e:
+            logger.error("Ошибка при обработке текста операцией %s: %s", name, str(e))
+            raise LLMError(f"Ошибка обработки текста: {str(e)}") from e
+
+
+# Общий движок на весь процесс
+_engine: EditingEngine | None = None
+
+
+# Функция создания движка со встроенными операциями
+def setup_engine(config: GptConfig, router_config: RouterConfig | None = None) -> EditingEngine:
+    """Создает общий движок редактирования и регистрирует встроенные операции"""
+    global _engine
+
+    _engine = EditingEngine(config, router_config)
+    for operation in (FIX, FIX_EDITS, REPHRASE):
+        _engine.register(operation)
+    return _engine
+
+
+# Функция получения общего движка
+def get_engine() -> EditingEngine:
+    """Возвращает общий движок, созданный в setup_engine (или движок по умолчанию)"""
+    if _engine is None:
+        return setup_engine(GptConfig())
+    return _engine
+
+
+REGISTRY.describe("bot_llm_route_total", "Запросы к модели по выбранному маршруту")
+REGISTRY.describe("bot_llm_route_seconds", "Время ответа модели по маршруту")
+REGISTRY.describe("bot_llm_truncated_total", "Ответы, обрезанные по max_tokens и запрошенные повторно")
+REGISTRY.describe("bot_llm_edit_list_total", "Ответы списком правок: применены или нужен полный текст")
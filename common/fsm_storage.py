@@ -0,0 +1,146 @@
+import logging
+
+# Инициализируем логгер модуля
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.info("Загружен модуль: %s", __name__)
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Mapping
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from config_data.config import StorageConfig
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    Хранилище FSM во встроенной базе SQLite.
+    Записи живут ttl секунд с последнего изменения, читаются лениво при первом обращении
+    и держатся в небольшом LRU в памяти, чтобы не ходить в базу на каждый апдейт.
+    """
+    def __init__(self,
+                 path: str,
+                 ttl: float = 7 * 24 * 3600,
+                 cache_size: int = 256):
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self.key_builder = DefaultKeyBuilder(with_destiny=True)
+        self._cache: OrderedDict[str, tuple[str | None, str, float]] = OrderedDict()  # key -> (state, data json, expires_at)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm-sqlite")
+        self._writes = 0
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS fsm "
+                         "(key TEXT PRIMARY KEY, state TEXT, data TEXT NOT NULL, expires_at REAL NOT NULL)")
+        self._purge_expired()
+        logger.info("Хранилище FSM в SQLite: %s", path)
+
+    def _purge_expired(self) -> None:
+        with self._lock:
+            deleted = self._db.execute("DELETE FROM fsm WHERE expires_at < ? OR (state IS NULL AND data = '{}')",
+                                       (time.time(),)).rowcount
+            self._db.commit()
+        if deleted:
+            logger.info("Удалено просроченных записей FSM: %s", deleted)
+
+    def _db_load(self, key: str) -> tuple[str | None, str, float] | None:
+        with self._lock:
+            row = self._db.execute("SELECT state, data, expires_at FROM fsm WHERE key = ?", (key,)).fetchone()
+        return row
+
+    def _db_save(self, key: str, column: str, value: str | None, expires_at: float) -> None:
+        # Обновляем только изменившуюся колонку, чтобы запись состояния не затирала данные и наоборот
+        with self._lock:
+            self._db.execute("INSERT INTO fsm (key, state, data, expires_at) VALUES (?, NULL, '{}', ?) "
+                             "ON CONFLICT(key) DO NOTHING", (key, expires_at))
+            self._db.execute(f"UPDATE fsm SET {column} = ?, expires_at = ? WHERE key = ?", (value, expires_at, key))
+            self._db.commit()
+
+    async def _run(self, func, *args):
+        """Выполняет запрос к базе в отдельном потоке; один поток - запросы идут строго по очереди"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _remember(self, key: str, record: tuple[str | None, str, float]) -> None:
+        self._cache[key] = record
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _load(self, key: str) -> tuple[str | None, str, float]:
+        """Ленивая загрузка записи: сначала из LRU, затем из базы"""
+        record = self._cache.get(key)
+        if record is None:
+            loaded = await self._run(self._db_load, key) or (None, "{}", 0.0)
+            # Пока ждали базу, запись могли обновить - тогда берем более свежую из LRU
+            record = self._cache.get(key) or loaded
+        if record[2] and record[2] < time.time():
+            record = (None, "{}", 0.0)
+        self._remember(key, record)
+        return record
+
+    async def _save(self, key: str, column: str, value: str | None) -> None:
+        await self._run(self._db_save, key, column, value, time.time() + self.ttl)
+
+        # Время от времени чистим базу от брошенных сессий
+        self._writes += 1
+        if self._writes % 500 == 0:
+            await self._run(self._purge_expired)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key = self.key_builder.build(key)
+        _, data, _ = await self._load(storage_key)
+        state = state.state if isinstance(state, State) else state
+        self._remember(storage_key, (state, data, time.time() + self.ttl))
+        await self._save(storage_key, "state", state)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        state, _, _ = await self._load(self.key_builder.build(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        storage_key = self.key_builder.build(key)
+        state, _, _ = await self._load(storage_key)
+        dumped = json.dumps(dict(data), ensure_ascii=False)
+        self._remember(storage_key, (state, dumped, time.time() + self.ttl))
+        await self._save(storage_key, "data", dumped)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        _, data, _ = await self._load(self.key_builder.build(key))
+        return json.loads(data)
+
+    async def close(self) -> None:
+        await self._run(self._db.close)
+        self._executor.shutdown(wait=True)
+        logger.info("Хранилище FSM закрыто")
+
+
+# Функция создания хранилища FSM по конфигу
+def create_storage(config: StorageConfig) -> BaseStorage:
+    """Возвращает хранилище FSM: memory, sqlite или redis"""
+    if config.backend == "sqlite":
+        return SQLiteStorage(path=config.path,
+                             ttl=config.ttl_hours * 3600,
+                             cache_size=config.cache_size)
+
+    if config.backend == "redis":
+        # Redis нужен только в этом режиме, поэтому импортируем его здесь
+        from aiogram.fsm.storage.redis import RedisStorage
+
+        ttl = int(config.ttl_hours * 3600)
+        storage = RedisStorage.from_url(config.redis_url, state_ttl=ttl, data_ttl=ttl)
+        logger.info("Хранилище FSM в Redis: %s", config.redis_url)
+        return storage
+
+    # данные хранятся в оперативной памяти, при перезапуске всё стирается (для тестов и разработки)
+    return MemoryStorage()
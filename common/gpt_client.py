@@ -0,0 +1,73 @@
+import logging
+
+# Инициализируем логгер модуля
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.info("Загружен модуль: %s", __name__)
+
+import httpx
+from openai import AsyncOpenAI
+
+from config_data.config import GptConfig, ResilienceConfig
+from common.llm_resilience import LLMCaller
+
+
+# Общий асинхронный клиент OpenAI на весь процесс
+_client: AsyncOpenAI | None = None
+
+# Общий слой повторов и предохранителей для запросов через клиент
+_caller: LLMCaller | None = None
+
+
+# Функция создания общего клиента OpenAI с пулом keep-alive соединений
+def setup_client(api_key: str, config: GptConfig, resilience: ResilienceConfig | None = None) -> AsyncOpenAI:
+    """Создает общий AsyncOpenAI клиент с пулом соединений и таймаутами из конфига"""
+    global _client, _caller
+
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=config.pool_size,
+                            max_keepalive_connections=config.keepalive,
+                            keepalive_expiry=config.keepalive_expiry),
+        timeout=httpx.Timeout(config.read_timeout, connect=config.connect_timeout),
+        )
+
+    _client = AsyncOpenAI(api_key=api_key,
+                          base_url=config.base_url,
+                          http_client=http_client,
+                          max_retries=config.max_retries)
+    _caller = LLMCaller(resilience or ResilienceConfig())
+    logger.info("Клиент OpenAI создан: %s, пул %s соединений, keep-alive %s",
+                _client.base_url, config.pool_size, config.keepalive)
+    return _client
+
+
+# Функция получения общего клиента
+def get_client() -> AsyncOpenAI:
+    """Возвращает общий клиент OpenAI, созданный в setup_client"""
+    if _client is None:
+        raise RuntimeError("Клиент OpenAI не инициализирован, вызовите setup_client()")
+    return _client
+
+
+# Функция получения слоя повторов и предохранителей
+def get_caller() -> LLMCaller:
+    """Возвращает общий LLMCaller, созданный в setup_client"""
+    if _caller is None:
+        raise RuntimeError("Клиент OpenAI не инициализирован, вызовите setup_client()")
+    return _caller
+
+
+# Функция закрытия клиента при остановке бота
+async def close_client() -> None:
+    """Закрывает пул соединений клиента OpenAI"""
+    global _client
+
+    if _client is None:
+        return
+    try:
+        await _client.close()
+        logger.info("Клиент OpenAI закрыт")
+    except Exception as e:
+        logger.error("Ошибка при закрытии клиента OpenAI: %s", e)
+    finally:
+        _client = None
@@ -5,6 +5,8 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 logger.info("Загружен модуль: %s", __name__)
 
+from functools import lru_cache
+
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove, KeyboardButtonPollType, InlineKeyboardButton
 from aiogram.utils.keyboard import ReplyKeyboardBuilder, InlineKeyboardBuilder
 
@@ -46,14 +48,22 @@ def get_keyboard(
                                              input_field_placeholder=placeholder) # в поле ввода выводим текст placeholder
 
 
+# Рабочая клавиатура собирается один раз и переиспользуется
+WORK_KB = get_keyboard("↗️ Добавить", "⏺️ Объединить",
+                       "🔄 Переформулировать 🔄",
+                       "ℹ️ Поправить текст ℹ️",
+                       "↩️ Назад", "↪️ Вперед",
+                       "❌ Отменить", "✅ Отправить",
+                       sizes=(2,1,1,2,2),
+                       placeholder='⬇️')
+
+# Клавиатура с одной кнопкой отмены (ввод времени публикации)
+CANCEL_KB = get_keyboard("❌ Отменить")
+
+
 # Функция рабочей клавиатуры
 def work_keyboard():
-    return get_keyboard("↗️ Добавить", "⏺️ Объединить",
-                        "🔄 Переформулировать 🔄",
-                        "ℹ️ Поправить текст ℹ️",
-                        "❌ Отменить", "✅ Отправить",
-                        sizes=(2,1,1,2,1),
-                        placeholder='⬇️')
+    return WORK_KB
 
 # создать обычные inline кнопки с отображаемым текстом
 def get_callback_btns(*, # запрет на передачу неименованных аргументов
@@ -68,3 +78,39 @@ def get_callback_btns(*, # запрет на передачу неименова
         keyboard.add(InlineKeyboardButton(text=text, callback_data=btn)) # событие callback_data
 
     return keyboard.adjust(*sizes).as_markup()
+
+# Клавиатура выбора каналов для публикации: кнопка канала включает/выключает его
+def channels_keyboard(names: dict[int, str], selected: list[int] | set[int]):
+    # Готовые клавиатуры кэшируются по набору каналов и выбранным каналам
+    return _channels_keyboard(tuple(names.items()), frozenset(selected))
+
+
+@lru_cache(maxsize=128)
+def _channels_keyboard(names: tuple[tuple[int, str], ...], selected: frozenset[int]):
+    keyboard = InlineKeyboardBuilder()
+
+    for chat_id, name in names:
+        mark = "✅" if chat_id in selected else "▫️"
+        keyboard.add(InlineKeyboardButton(text=f"{mark} {name}", callback_data=f"btn_{chat_id}"))
+    keyboard.add(InlineKeyboardButton(text=f"📤 Опубликовать ({len(selected)})", callback_data="btn_publish"))
+    keyboard.add(InlineKeyboardButton(text="🕒 Запланировать", callback_data="btn_schedule"))
+    keyboard.add(InlineKeyboardButton(text="❌ Отменить", callback_data="btn_cancel"))
+
+    return keyboard.adjust(*([1] * len(names)), 2, 1).as_markup()
+
+
+# Inline клавиатура сообщения-черновика (EDITOR_UI=inline): кнопки правят это же сообщение
+EDITOR_KB = InlineKeyboardBuilder(markup=[
+    [InlineKeyboardButton(text="⏺️ Объединить", callback_data="ed_merge")],
+    [InlineKeyboardButton(text="🔄 Переформулировать", callback_data="ed_rephrase"),
+     InlineKeyboardButton(text="ℹ️ Поправить", callback_data="ed_fix")],
+    [InlineKeyboardButton(text="↩️ Назад", callback_data="ed_undo"),
+     InlineKeyboardButton(text="↪️ Вперед", callback_data="ed_redo")],
+    [InlineKeyboardButton(text="❌ Отменить", callback_data="ed_cancel"),
+     InlineKeyboardButton(text="✅ Отправить", callback_data="ed_send")],
+]).as_markup()
+
+# Inline отмена ввода времени публикации - возвращает к выбору каналов
+PUBLISH_TIME_KB = InlineKeyboardBuilder(markup=[
+    [InlineKeyboardButton(text="❌ Отменить", callback_data="ed_time_cancel")],
+]).as_markup()
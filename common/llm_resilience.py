@@ -0,0 +1,202 @@
+import logging
+
+# Инициализируем логгер модуля
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.info("Загружен модуль: %s", __name__)
+
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, TypeVar
+
+import openai
+
+from config_data.config import ResilienceConfig
+
+
+T = TypeVar("T")
+
+
+class LLMError(Exception):
+    """Запрос к модели не удался. Текст ошибки показывается пользователю, черновик не меняется"""
+
+
+# Ошибки, после которых есть смысл повторить запрос
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+    asyncio.TimeoutError,
+)
+
+
+# Функция классификации ошибки
+def is_retryable(error: BaseException) -> bool:
+    """True для временных ошибок: лимиты, таймауты, обрывы соединения, 5xx"""
+    if isinstance(error, RETRYABLE_ERRORS):
+        return True
+    # 409 и прочие статусы от прокси/балансировщика тоже бывают временными
+    return isinstance(error, openai.APIStatusError) and error.status_code in (408, 409, 502, 503, 504)
+
+
+def _retry_after(error: BaseException) -> float | None:
+    """Пауза из заголовка Retry-After, если провайдер ее прислал"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """
+    Предохранитель: после threshold ошибок подряд запросы к модели не отправляются reset_timeout секунд,
+    затем пропускается один пробный запрос - при успехе предохранитель закрывается.
+    """
+    def __init__(self, name: str, threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        if self.opened_at is not None:
+            logger.info("Предохранитель %s закрыт", self.name)
+        self.failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.opened_at is not None or self.failures >= self.threshold:
+            if self.opened_at is None:
+                logger.warning("Предохранитель %s открыт после %s ошибок подряд", self.name, self.failures)
+            self.opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """Скользящая оценка (EWMA) задержки модели в секундах на 1000 символов запроса"""
+    def __init__(self, alpha: float = 0.3):
+        self.alpha = alpha
+        self._rates: dict[str, float] = {}
+
+    def observe(self, model: str, size: int, seconds: float) -> None:
+        rate = seconds / max(size, 200) * 1000
+        old = self._rates.get(model)
+        self._rates[model] = rate if old is None else old + self.alpha * (rate - old)
+
+    def predict(self, model: str, size: int) -> float | None:
+        rate = self._rates.get(model)
+        return None if rate is None else rate * max(size, 200) / 1000
+
+    def snapshot(self) -> dict[str, float]:
+        return dict(self._rates)
+
+
+class LLMCaller:
+    """
+    Надежный вызов модели: повторы временных ошибок с паузой "full jitter",
+    предохранитель на каждую модель и переход на быструю модель,
+    если основная по прогнозу не укладывается в бюджет задержки операции.
+    """
+    def __init__(self, config: ResilienceConfig):
+        self.config = config
+        self.latency = LatencyTracker()
+        self._breakers: dict[str, CircuitBreaker] = {}
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        if model not in self._breakers:
+            self._breakers[model] = CircuitBreaker(model, self.config.breaker_threshold, self.config.breaker_reset)
+        return self._breakers[model]
+
+    def _models(self, operation: str, model: str, size: int) -> list[str]:
+        """Порядок моделей для операции: основная и запасная, с учетом бюджета задержки"""
+        fallback = self.config.fallback_model
+        if not fallback or fallback == model or operation not in self.config.budgets:
+            return [model]
+
+        budget = self.config.budgets[operation]
+        predicted = self.latency.predict(model, size)
+        if predicted is not None and predicted > budget:
+            logger.info("%s: прогноз %s %.1f сек > бюджета %.1f сек, используем %s",
+                        operation, model, predicted, budget, fallback)
+            return [fallback, model]
+        return [model, fallback]
+
+    async def call(self, operation: str, model: str, request: Callable[[str], Awaitable[T]], size: int = 0) -> T:
+        """Выполняет request(model) с повторами, предохранителем и запасной моделью"""
+        models = self._models(operation, model, size)
+        last_error: BaseException | None = None
+
+        for attempt in range(self.config.max_attempts):
+            # Берем первую модель, чей предохранитель пропускает запрос
+            current = next((m for m in models if self.breaker(m).allow()), None)
+            if current is None:
+                raise LLMError("Сервис временно недоступен, попробуйте через минуту")
+
+            started = time.monotonic()
+            try:
+                result = await asyncio.wait_for(request(current), timeout=self.config.attempt_timeout)
+            except asyncio.CancelledError:
+                # Пробный запрос отменен - следующий запрос снова сможет стать пробным
+                self.breaker(current)._probe_in_flight = False
+                raise
+            except Exception as e:
+                last_error = e
+                if not is_retryable(e):
+                    # Ошибка запроса (неверные данные, ключ) - повтор не поможет
+                    self.breaker(current).record_success()
+                    logger.error("%s: неповторяемая ошибка %s: %s", operation, type(e).__name__, e)
+                    raise LLMError(f"Модель отклонила запрос: {e}") from e
+
+                self.breaker(current).record_failure()
+                # Следующую попытку отдаем другой модели, если она есть
+                models.remove(current)
+                models.append(current)
+                if attempt + 1 >= self.config.max_attempts:
+                    break
+                delay = _retry_after(e)
+                if delay is None:
+                    delay = random.uniform(0, min(self.config.backoff_cap, self.config.backoff_base * 2 ** attempt))
+                logger.warning("%s: %s на %s, попытка %s/%s, повтор через %.1f сек",
+                               operation, type(e).__name__, current, attempt + 1, self.config.max_attempts, delay)
+                await asyncio.sleep(delay)
+                continue
+
+            self.breaker(current).record_success()
+            self.latency.observe(current, size, time.monotonic() - started)
+            return result
+
+        logger.error("%s: все попытки исчерпаны: %s", operation, last_error)
+        raise LLMError(f"Не удалось получить ответ модели: {last_error}") from last_error
+
+    def stats(self) -> dict:
+        """Состояние предохранителей и оценки задержек"""
+        return {
+            "breakers": {name: breaker.state for name, breaker in self._breakers.items()},
+            "latency": self.latency.snapshot(),
+        }
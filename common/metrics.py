@@ -0,0 +1,163 @@
+import logging
+
+# Инициализируем логгер модуля
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.info("Загружен модуль: %s", __name__)
+
+import time
+from bisect import bisect_left
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from aiohttp import web
+
+
+# Границы корзин гистограмм задержки, сек
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+def _labels(labels: dict[str, str]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels, extra: tuple[str, str] | None = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in items) + "}"
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами: count, sum и накопительные корзины как в Prometheus"""
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля по корзинам (верхняя граница корзины)"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        total = 0
+        for index, count in enumerate(self.counts):
+            total += count
+            if total >= rank:
+                return self.buckets[index] if index < len(self.buckets) else float("inf")
+        return float("inf")
+
+
+class MetricsRegistry:
+    """
+    Простой реестр метрик: счетчики, датчики и гистограммы с метками.
+    Умеет отдавать все в текстовом формате Prometheus.
+    """
+    def __init__(self):
+        self.counters: dict[str, dict[Labels, float]] = {}
+        self.gauges: dict[str, dict[Labels, float]] = {}
+        self.histograms: dict[str, dict[Labels, Histogram]] = {}
+        self.help: dict[str, str] = {}
+
+    def describe(self, name: str, text: str) -> None:
+        self.help[name] = text
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        series = self.counters.setdefault(name, {})
+        key = _labels(labels)
+        series[key] = series.get(key, 0) + value
+
+    def gauge_add(self, name: str, value: float, **labels) -> None:
+        series = self.gauges.setdefault(name, {})
+        key = _labels(labels)
+        series[key] = series.get(key, 0) + value
+
+    def gauge_set(self, name: str, value: float, **labels) -> None:
+        self.gauges.setdefault(name, {})[_labels(labels)] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        series = self.histograms.setdefault(name, {})
+        key = _labels(labels)
+        if key not in series:
+            series[key] = Histogram()
+        series[key].observe(value)
+
+    @asynccontextmanager
+    async def timer(self, target: str, **labels) -> AsyncIterator[None]:
+        """Замеряет внешний вызов (Telegram API, скачивание, Whisper, GPT): время, ошибки, выполняющиеся"""
+        self.gauge_add("bot_external_in_flight", 1, target=target)
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.inc("bot_external_errors_total", target=target, **labels)
+            raise
+        finally:
+            self.observe("bot_external_seconds", time.perf_counter() - started, target=target, **labels)
+            self.gauge_add("bot_external_in_flight", -1, target=target)
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        lines = []
+        for kind, store in (("counter", self.counters), ("gauge", self.gauges)):
+            for name, series in sorted(store.items()):
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in series.items():
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        for name, series in sorted(self.histograms.items()):
+            if name in self.help:
+                lines.append(f"# HELP {name} {self.help[name]}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in series.items():
+                total = 0
+                for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                    total += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{_format_labels(labels, ('le', le))} {total}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+# Общий реестр метрик процесса
+REGISTRY = MetricsRegistry()
+REGISTRY.describe("bot_updates_total", "Входящие апдейты по типу")
+REGISTRY.describe("bot_updates_in_flight", "Апдейты в обработке")
+REGISTRY.describe("bot_update_seconds", "Время обработки апдейта")
+REGISTRY.describe("bot_handler_calls_total", "Вызовы хендлеров")
+REGISTRY.describe("bot_handler_errors_total", "Ошибки в хендлерах")
+REGISTRY.describe("bot_handler_in_flight", "Хендлеры в работе")
+REGISTRY.describe("bot_handler_seconds", "Время работы хендлера")
+REGISTRY.describe("bot_external_seconds", "Время внешних вызовов: telegram, download, whisper, gpt")
+REGISTRY.describe("bot_external_errors_total", "Ошибки внешних вызовов")
+REGISTRY.describe("bot_external_in_flight", "Внешние вызовы в работе")
+
+
+# Функция запуска локального HTTP сервера с метриками
+async def start_metrics_server(host: str, port: int, registry: MetricsRegistry = REGISTRY) -> web.AppRunner:
+    """Поднимает aiohttp сервер, отдающий /metrics в формате Prometheus"""
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host=host, port=port).start()
+    logger.info("Метрики доступны на http://%s:%s/metrics", host, port)
+    return runner
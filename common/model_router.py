@@ -0,0 +1,67 @@
+import logging
+
+# Инициализируем логгер модуля
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.info("Загружен модуль: %s", __name__)
+
+import math
+from dataclasses import dataclass
+
+from config_data.config import RouterConfig
+from common.llm_resilience import LatencyTracker
+from common.tokens import count_tokens
+
+
+@dataclass(frozen=True)
+class Route:
+    """Выбранная модель и параметры запроса"""
+    model: str
+    max_tokens: int | None
+    tokens: int                     # Токенов во входном тексте
+    reason: str                     # short - короткий текст, long - длинный, latency - сильная модель не успевает, fixed - без выбора
+
+
+class ModelRouter:
+    """
+    Выбор модели для операции по размеру текста и желаемому времени ответа:
+    - короткий текст (до small_tokens токенов) - быстрая модель;
+    - длинный текст - модель операции, но если по накопленной статистике она не укладывается
+      в latency_target, а быстрая укладывается - быстрая;
+    max_tokens считается от размера текста, чтобы ответ не мог разрастись без предела.
+    Повторы, предохранитель и запасная модель остаются за LLMCaller.
+    """
+    def __init__(self, config: RouterConfig, latency: LatencyTracker | None = None):
+        self.config = config
+        self.latency = latency
+
+    def max_tokens(self, operation: str, tokens: int) -> int:
+        ratio = self.config.output_ratio.get(operation, 1.5)
+        return min(self.config.max_output, math.ceil(tokens * ratio) + self.config.output_margin)
+
+    def route(self, operation: str, model: str, text: str, max_tokens: int | None = None,
+              pinned: bool = False) -> Route:
+        """
+        Маршрут для текста. model - модель операции, max_tokens - предел из описания операции (имеет приоритет).
+        pinned=True - модель задана в конфиге для этой операции, ее не меняем.
+        """
+        tokens = count_tokens(text, model)
+        if max_tokens is None:
+            max_tokens = self.max_tokens(operation, tokens)
+
+        small = self.config.small_model
+        if not self.config.enabled or pinned or not small or small == model:
+            return Route(model, max_tokens, tokens, "fixed")
+        if tokens <= self.config.small_tokens.get(operation, 0):
+            return Route(small, max_tokens, tokens, "short")
+
+        target = self.config.latency_targets.get(operation)
+        if target and self.latency is not None:
+            predicted = self.latency.predict(model, len(text))
+            if predicted is not None and predicted > target:
+                small_predicted = self.latency.predict(small, len(text))
+                if small_predicted is None or small_predicted <= target:
+                    logger.info("%s: прогноз %s %.1f сек > цели %.1f сек, используем %s",
+                                operation, model, predicted, target, small)
+                    return Route(small, max_tokens, tokens, "latency")
+        return Route(model, max_tokens, tokens, "long")
@@ -0,0 +1,226 @@
+import logging
+
+# Инициализируем логгер модуля
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.info("Загружен модуль: %s", __name__)
+
+import asyncio
+import sqlite3
+import threading
+import time
+from html import escape
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from aiogram.methods import SendMessage
+
+from config_data.config import OutboxConfig
+from common.channels import ChannelRegistry
+from common.send_queue import SendQueue
+
+
+# Ошибки, после которых повторять публикацию бессмысленно
+PERMANENT_ERRORS = (TelegramBadRequest, TelegramForbiddenError)
+
+# Сколько хранить записи о выполненных публикациях, сек
+KEEP_DONE = 7 * 24 * 3600
+
+
+class PublishOutbox:
+    """
+    Очередь публикаций в SQLite: хендлер только записывает пост и сразу отвечает пользователю,
+    фоновый воркер отправляет посты пачками, повторяет временные ошибки с растущей паузой
+    и присылает пользователю отчет, когда все каналы пачки обработаны.
+    Запись переживает перезапуск бота. Доставка "хотя бы один раз": пост помечается
+    отправленным только после ответа Telegram. Ключ идемпотентности (пачка + канал)
+    не дает поставить один и тот же пост в канал дважды, например при двойном нажатии.
+    Пост можно запланировать - он уйдет не раньше publish_at.
+    """
+    def __init__(self, config: OutboxConfig, send_queue: SendQueue, channels: ChannelRegistry):
+        self.config = config
+        self.send_queue = send_queue
+        self.channels = channels
+        self._lock = threading.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+        self._db = sqlite3.connect(config.db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS outbox ("
+                         "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                         "key TEXT NOT NULL UNIQUE, "       # ключ идемпотентности
+                         "batch TEXT NOT NULL, "            # одна публикация во все выбранные каналы
+                         "chat_id INTEGER NOT NULL, "
+                         "text TEXT NOT NULL, "
+                         "notify_chat INTEGER, "            # куда прислать отчет
+                         "publish_at REAL NOT NULL, "
+                         "status TEXT NOT NULL DEFAULT 'pending', "  # pending, sent, failed
+                         "attempts INTEGER NOT NULL DEFAULT 0, "
+                         "next_attempt REAL NOT NULL, "
+                         "last_error TEXT, "
+                         "message_id INTEGER, "
+                         "reported INTEGER NOT NULL DEFAULT 0, "
+                         "created_at REAL NOT NULL, "
+                         "done_at REAL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt)")
+        self._db.execute("DELETE FROM outbox WHERE status != 'pending' AND reported = 1 AND done_at < ?",
+                         (time.time() - KEEP_DONE,))
+        self._db.commit()
+        logger.info("Очередь публикаций в SQLite: %s", config.db_path)
+
+    # --- запросы к базе (выполняются в отдельном потоке) ---
+
+    def _db_enqueue(self, rows: list[tuple]) -> int:
+        with self._lock:
+            cursor = self._db.executemany(
+                "INSERT OR IGNORE INTO outbox (key, batch, chat_id, text, notify_chat, publish_at, next_attempt, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._db.commit()
+            return cursor.rowcount
+
+    def _db_due(self, now: float) -> list[tuple]:
+        with self._lock:
+            return self._db.execute(
+                "SELECT id, batch, chat_id, text, attempts FROM outbox "
+                "WHERE status = 'pending' AND next_attempt <= ? ORDER BY next_attempt LIMIT ?",
+                (now, self.config.batch_size)).fetchall()
+
+    def _db_next_due(self) -> float | None:
+        with self._lock:
+            return self._db.execute("SELECT MIN(next_attempt) FROM outbox WHERE status = 'pending'").fetchone()[0]
+
+    def _db_update(self, updates: list[tuple]) -> None:
+        # Результаты пачки записываем одной транзакцией
+        with self._lock:
+            self._db.executemany("UPDATE outbox SET status = ?, attempts = ?, next_attempt = ?, last_error = ?, "
+                                 "message_id = ?, done_at = ? WHERE id = ?", updates)
+            self._db.commit()
+
+    def _db_finished_batch(self, batch: str) -> list[tuple] | None:
+        """Строки пачки, если она полностью обработана и отчет еще не отправлен"""
+        with self._lock:
+            rows = self._db.execute("SELECT chat_id, status, last_error, notify_chat, reported FROM outbox "
+                                    "WHERE batch = ? ORDER BY id", (batch,)).fetchall()
+            if not rows or any(row[1] == 'pending' or row[4] for row in rows):
+                return None
+            self._db.execute("UPDATE outbox SET reported = 1 WHERE batch = ?", (batch,))
+            self._db.commit()
+            return rows
+
+    def _db_stats(self) -> dict:
+        with self._lock:
+            now = time.time()
+            pending, scheduled, failed = self._db.execute(
+                "SELECT "
+                "SUM(status = 'pending' AND publish_at <= ?), "
+                "SUM(status = 'pending' AND publish_at > ?), "
+                "SUM(status = 'failed') FROM outbox", (now, now)).fetchone()
+        return {"pending": pending or 0, "scheduled": scheduled or 0, "failed": failed or 0}
+
+    # --- публичный интерфейс ---
+
+    async def enqueue(self, batch: str, chat_ids: list[int], text: str,
+                      notify_chat: int | None = None, publish_at: float | None = None) -> int:
+        """
+        Ставит пост в очередь для каждого канала и сразу возвращается.
+        Возвращает число новых записей (повторная постановка той же пачки игнорируется).
+        """
+        now = time.time()
+        publish_at = publish_at or now
+        rows = [(f"{batch}:{chat_id}", batch, chat_id, text, notify_chat, publish_at, publish_at, now)
+                for chat_id in chat_ids]
+        added = await asyncio.to_thread(self._db_enqueue, rows)
+        self._wakeup.set()
+        return added
+
+    async def stats(self) -> dict:
+        """Публикации в очереди, запланированные и неудавшиеся"""
+        return await asyncio.to_thread(self._db_stats)
+
+    async def _publish(self, chat_id: int, text: str) -> int:
+        """Отправляет пост в канал, возвращает message_id"""
+        info = await self.channels.get(chat_id)
+        if info.can_post is False:
+            raise PermissionError(info.error or "нет прав на публикацию")
+        try:
+            message = await self.send_queue.submit(SendMessage(chat_id=chat_id, text=text), exclusive=True)
+        except PERMANENT_ERRORS as e:
+            self.channels.invalidate(chat_id, str(e))
+            raise
+        return message.message_id
+
+    async def _process(self, rows: list[tuple]) -> None:
+        """Отправляет пачку постов параллельно и записывает результаты"""
+        results = await asyncio.gather(*(self._publish(chat_id, text) for _, _, chat_id, text, _ in rows),
+                                       return_exceptions=True)
+        now = time.time()
+        updates = []
+        for (row_id, batch, chat_id, _, attempts), result in zip(rows, results):
+            attempts += 1
+            if not isinstance(result, BaseException):
+                updates.append(("sent", attempts, now, None, result, now, row_id))
+                continue
+            error = str(result)
+            if isinstance(result, (PermissionError,) + PERMANENT_ERRORS) or attempts >= self.config.max_attempts:
+                logger.error("Публикация в %s не удалась: %s", chat_id, error)
+                updates.append(("failed", attempts, now, error, None, now, row_id))
+            else:
+                delay = min(self.config.retry_cap, self.config.retry_base * 2 ** (attempts - 1))
+                logger.warning("Публикация в %s: %s, попытка %s/%s, повтор через %.0f сек",
+                               chat_id, error, attempts, self.config.max_attempts, delay)
+                updates.append(("pending", attempts, now + delay, error, None, None, row_id))
+        await asyncio.to_thread(self._db_update, updates)
+
+        for batch in dict.fromkeys(row[1] for row in rows):
+            await self._report(batch)
+
+    async def _report(self, batch: str) -> None:
+        """Присылает отчет о публикации, когда все каналы пачки обработаны"""
+        rows = await asyncio.to_thread(self._db_finished_batch, batch)
+        if not rows or rows[0][3] is None:
+            return
+        lines = [f"✅ <b>{escape(self.channels.names.get(chat_id, str(chat_id)))}</b>" if status == "sent" else
+                 f"❌ <b>{escape(self.channels.names.get(chat_id, str(chat_id)))}</b>: <code>{escape(error or '')}</code>"
+                 for chat_id, status, error, _, _ in rows]
+        self.send_queue.submit(SendMessage(chat_id=rows[0][3], text="📤 Результат публикации:\n\n" + "\n".join(lines)))
+
+    async def _run(self) -> None:
+        while True:
+            # Сбрасываем сигнал до запроса к базе, чтобы не пропустить запись, сделанную во время запроса
+            self._wakeup.clear()
+            try:
+                rows = await asyncio.to_thread(self._db_due, time.time())
+                if rows:
+                    await self._process(rows)
+                    continue
+                # Спим до ближайшей публикации или до новой записи
+                next_due = await asyncio.to_thread(self._db_next_due)
+                timeout = self.config.poll_interval if next_due is None else \
+                    min(self.config.poll_interval, max(0.0, next_due - time.time()))
+            except Exception as e:
+                logger.error("Ошибка воркера публикаций: %s", e)
+                timeout = self.config.poll_interval
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        """Запускает фоновый воркер публикаций"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="publish-outbox")
+
+    async def stop(self) -> None:
+        """Останавливает воркер. Неотправленные посты остаются в базе до следующего запуска"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,150 @@
+import logging
+
+# Инициализируем логгер модуля
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.info("Загружен модуль: %s", __name__)
+
+import asyncio
+import math
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+import psutil
+
+from config_data.config import MonitorConfig
+from common.metrics import MetricsRegistry, REGISTRY
+
+
+@dataclass
+class Sample:
+    """Один замер ресурсов процесса"""
+    time: float         # time.time() момента замера
+    rss_mb: float       # Resident memory, МБ
+    cpu: float          # Загрузка CPU процессом с прошлого замера, %
+    fds: int            # Открытые файловые дескрипторы (-1, если ОС не дает)
+    loop_lag: float     # Насколько позже запланированного проснулся цикл событий, сек
+    tasks: int          # Число задач asyncio
+
+
+# Поля замера, по которым считаются тренды и пороги
+FIELDS = ("rss_mb", "cpu", "fds", "loop_lag", "tasks")
+
+
+class ResourceMonitor:
+    """
+    Фоновый сборщик ресурсов процесса: раз в interval секунд снимает RSS, CPU, дескрипторы,
+    задержку цикла событий и число задач, хранит замеры в кольцевом буфере за последний час
+    и отправляет предупреждение при превышении порогов (не чаще раза в alert_cooldown на показатель).
+    Ничего не блокирует: CPU считается между замерами (cpu_percent(interval=None)).
+    """
+    def __init__(self, config: MonitorConfig, memory_limit: float,
+                 alert: Callable[[str], Awaitable[None]] | None = None,
+                 registry: MetricsRegistry = REGISTRY):
+        self.config = config
+        self.limits = {
+            "rss_mb": memory_limit,
+            "cpu": config.cpu_limit,
+            "fds": config.fd_limit,
+            "loop_lag": config.lag_limit,
+            "tasks": config.tasks_limit,
+        }
+        self.alert = alert
+        self.registry = registry
+        self.samples: deque[Sample] = deque(maxlen=max(1, math.ceil(config.history_minutes * 60 / config.interval)))
+        self._process = psutil.Process()
+        self._last_alert: dict[str, float] = {}
+        self._task: asyncio.Task | None = None
+
+    def sample(self, loop_lag: float = 0.0) -> Sample:
+        """Снимает один замер и кладет его в буфер"""
+        try:
+            fds = self._process.num_fds()
+        except (AttributeError, psutil.Error):
+            # num_fds есть только на POSIX
+            fds = -1
+        sample = Sample(time=time.time(),
+                        rss_mb=self._process.memory_info().rss / 1024 / 1024,
+                        cpu=self._process.cpu_percent(interval=None),
+                        fds=fds,
+                        loop_lag=loop_lag,
+                        tasks=len(asyncio.all_tasks()))
+        self.samples.append(sample)
+        for name in FIELDS:
+            self.registry.gauge_set(f"bot_process_{name}", getattr(sample, name))
+        return sample
+
+    async def _check(self, sample: Sample) -> None:
+        """Отправляет предупреждения по показателям, превысившим порог"""
+        now = time.monotonic()
+        exceeded = []
+        for name, limit in self.limits.items():
+            value = getattr(sample, name)
+            if not limit or value <= limit:
+                continue
+            last = self._last_alert.get(name)
+            if last is not None and now - last < self.config.alert_cooldown:
+                continue
+            self._last_alert[name] = now
+            exceeded.append(f"{name}: {round(value, 3)} (порог {limit})")
+
+        if not exceeded:
+            return
+        text = "⚠️ Превышены пороги ресурсов:\n" + "\n".join(exceeded)
+        logger.warning(text.replace("\n", " "))
+        if self.alert is not None:
+            try:
+                await self.alert(text)
+            except Exception as e:
+                logger.error("Не удалось отправить предупреждение о ресурсах: %s", e)
+
+    async def _run(self) -> None:
+        # Первый вызов cpu_percent(None) всегда 0 - он только запоминает точку отсчета
+        self._process.cpu_percent(interval=None)
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.config.interval)
+            # Задержка цикла: насколько позже запланированного нас разбудили
+            loop_lag = max(0.0, time.monotonic() - started - self.config.interval)
+            try:
+                await self._check(self.sample(loop_lag))
+            except Exception as e:
+                logger.error("Ошибка мониторинга ресурсов: %s", e)
+
+    def start(self) -> None:
+        """Запускает фоновую задачу сбора"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="resource-monitor")
+            logger.info("Мониторинг ресурсов запущен: замер раз в %s сек, история %s мин",
+                        self.config.interval, self.config.history_minutes)
+
+    async def stop(self) -> None:
+        """Останавливает фоновую задачу сбора"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def trends(self, window: float = 3600) -> dict[str, tuple[float, float, float]]:
+        """min/avg/max каждого показателя за последние window секунд"""
+        since = time.time() - window
+        recent = [sample for sample in self.samples if sample.time >= since]
+        if not recent:
+            return {}
+        result = {}
+        for name in FIELDS:
+            values = [getattr(sample, name) for sample in recent]
+            result[name] = (min(values), sum(values) / len(values), max(values))
+        return result
+
+
+REGISTRY.describe("bot_process_rss_mb", "Память процесса (RSS), МБ")
+REGISTRY.describe("bot_process_cpu", "Загрузка CPU процессом, %")
+REGISTRY.describe("bot_process_fds", "Открытые файловые дескрипторы")
+REGISTRY.describe("bot_process_loop_lag", "Задержка цикла событий, сек")
+REGISTRY.describe("bot_process_tasks", "Задачи asyncio")
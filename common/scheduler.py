@@ -0,0 +1,195 @@
+import logging
+
+# Инициализируем логгер модуля
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.info("Загружен модуль: %s", __name__)
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, TypeVar
+
+
+T = TypeVar("T")
+
+
+class SchedulerBusy(Exception):
+    """Очередь переполнена - запрос отклонен сразу, без ожидания"""
+
+
+class RequestCancelled(Exception):
+    """Запрос отменен пользователем (кнопка "❌ Отменить")"""
+
+
+class RequestScheduler:
+    """
+    Общий планировщик запросов к GPT и Whisper.
+    Ограничивает число одновременных запросов глобально и на пользователя,
+    выдает слоты пользователям по кругу, отклоняет запросы при переполнении очереди
+    и умеет отменить все запросы пользователя - и ожидающие, и выполняющиеся.
+    """
+    def __init__(self,
+                 max_concurrent: int = 8,
+                 per_user_concurrent: int = 2,
+                 max_queue: int = 50,
+                 max_queue_per_user: int = 5):
+        self.max_concurrent = max_concurrent
+        self.per_user_concurrent = per_user_concurrent
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+
+        self._queues: OrderedDict[int, deque[asyncio.Future]] = OrderedDict()  # порядок - очередь круга
+        self._running: dict[int, set[asyncio.Task]] = {}
+        self._active: dict[int, int] = {}  # выданные слоты по пользователям
+        self._background: dict[int, int] = {}  # фоновые запросы по пользователям
+        self._running_total = 0
+        self._queued_total = 0
+
+        self.completed = 0
+        self.rejected = 0
+        self.cancelled = 0
+        self._waits: deque[float] = deque(maxlen=200)
+
+    def _dispatch(self) -> None:
+        """Раздает свободные слоты ожидающим: по одному пользователю за раз, по кругу"""
+        granted = True
+        while granted and self._running_total < self.max_concurrent and self._queues:
+            granted = False
+            for user_id in list(self._queues):
+                if self._running_total >= self.max_concurrent:
+                    break
+                if self._active.get(user_id, 0) >= self.per_user_concurrent:
+                    continue
+                queue = self._queues[user_id]
+                waiter = queue.popleft()
+                self._queued_total -= 1
+                if not queue:
+                    del self._queues[user_id]
+                else:
+                    # Пользователь получил слот - отправляем его в конец круга
+                    self._queues.move_to_end(user_id)
+                if waiter.done():
+                    continue
+                waiter.set_result(None)
+                self._acquire(user_id)
+                granted = True
+
+    def _acquire(self, user_id: int) -> None:
+        self._active[user_id] = self._active.get(user_id, 0) + 1
+        self._running_total += 1
+
+    def _release(self, user_id: int) -> None:
+        self._active[user_id] -= 1
+        if not self._active[user_id]:
+            del self._active[user_id]
+        self._running_total -= 1
+        self._dispatch()
+
+    async def run(self, user_id: int, factory: Callable[[], Awaitable[T]]) -> T:
+        """Ставит запрос пользователя в очередь и выполняет его, когда освободится слот"""
+        user_queue_len = len(self._queues.get(user_id, ()))
+        if self._queued_total >= self.max_queue or user_queue_len >= self.max_queue_per_user:
+            self.rejected += 1
+            raise SchedulerBusy("Слишком много запросов в очереди")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(user_id, deque()).append(waiter)
+        self._queued_total += 1
+        queued_at = time.monotonic()
+        self._dispatch()
+
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # Ожидание прервано вместе с хендлером - убираем себя из очереди или возвращаем слот
+            self._forget_waiter(user_id, waiter)
+            raise
+        self._waits.append(time.monotonic() - queued_at)
+        try:
+            return await self._execute(user_id, factory)
+        finally:
+            self._release(user_id)
+
+    async def run_idle(self, user_id: int, factory: Callable[[], Awaitable[T]]) -> T:
+        """
+        Фоновый запрос с низким приоритетом (упреждающая обработка): выполняется, только если общий слот свободен сразу
+        и никто не ждет в очереди. В очередь не встает и ее места не занимает - иначе сразу SchedulerBusy.
+        Занимает общий слот, но не слоты пользователя для обычных запросов (для фоновых у него свой лимит
+        per_user_concurrent), и отменяется вместе с запросами пользователя.
+        """
+        if (self._queues or self._running_total >= self.max_concurrent
+                or self._background.get(user_id, 0) >= self.per_user_concurrent):
+            raise SchedulerBusy("Нет свободного слота для фонового запроса")
+        self._background[user_id] = self._background.get(user_id, 0) + 1
+        self._running_total += 1
+        try:
+            return await self._execute(user_id, factory)
+        finally:
+            self._background[user_id] -= 1
+            if not self._background[user_id]:
+                del self._background[user_id]
+            self._running_total -= 1
+            self._dispatch()
+
+    async def _execute(self, user_id: int, factory: Callable[[], Awaitable[T]]) -> T:
+        """Выполняет запрос в уже выданном слоте; запрос отменяется через cancel(user_id)"""
+        task = asyncio.ensure_future(factory())
+        self._running.setdefault(user_id, set()).add(task)
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if task.cancelled():
+                raise RequestCancelled() from None
+            # Отменили сам хендлер - отменяем и запрос
+            task.cancel()
+            raise
+        finally:
+            self._running[user_id].discard(task)
+            if not self._running[user_id]:
+                del self._running[user_id]
+            self.completed += 1
+
+    def _forget_waiter(self, user_id: int, waiter: asyncio.Future) -> None:
+        queue = self._queues.get(user_id)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            self._queued_total -= 1
+            if not queue:
+                del self._queues[user_id]
+        elif waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+            # Слот уже был выдан, но запрос так и не запустился - возвращаем слот
+            self._release(user_id)
+
+    def cancel(self, user_id: int) -> int:
+        """Отменяет все ожидающие и выполняющиеся запросы пользователя, возвращает их количество"""
+        count = 0
+        queue = self._queues.pop(user_id, deque())
+        for waiter in queue:
+            if not waiter.done():
+                waiter.set_exception(RequestCancelled())
+                count += 1
+        self._queued_total -= len(queue)
+
+        for task in self._running.get(user_id, set()):
+            if not task.done():
+                task.cancel()
+                count += 1
+
+        if count:
+            self.cancelled += count
+            logger.info("Отменено запросов пользователя %s: %s", user_id, count)
+        return count
+
+    def stats(self) -> dict:
+        """Состояние очереди для /status"""
+        waits = list(self._waits)
+        return {
+            "queued": self._queued_total,
+            "running": self._running_total,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "cancelled": self.cancelled,
+            "avg_wait": sum(waits) / len(waits) if waits else 0.0,
+            "max_wait": max(waits) if waits else 0.0,
+        }
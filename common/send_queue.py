@@ -0,0 +1,271 @@
+import logging
+
+# Инициализируем логгер модуля
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.info("Загружен модуль: %s", __name__)
+
+import asyncio
+import itertools
+import time
+from collections import deque
+from typing import Any
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod, SendMessage
+from aiogram.types import InlineKeyboardMarkup
+
+from config_data.config import SendQueueConfig
+from common.metrics import REGISTRY
+
+
+# Максимальная длина текста сообщения в Telegram
+MESSAGE_LIMIT = 4096
+
+# Разделитель текстов при объединении сообщений
+COALESCE_SEPARATOR = "\n\n"
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше burst про запас"""
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        """Через сколько секунд будет доступен токен (0 - доступен сейчас)"""
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self._refill()
+        self.tokens -= 1
+
+
+class _Item:
+    """Запрос в очереди и ожидающие его результата"""
+    __slots__ = ("method", "futures", "attempts", "in_flight", "exclusive")
+
+    def __init__(self, method: TelegramMethod, future: asyncio.Future, exclusive: bool = False):
+        self.method = method
+        self.futures = [future]
+        self.attempts = 0
+        self.in_flight = False
+        self.exclusive = exclusive
+
+
+def _can_coalesce(last: TelegramMethod, new: TelegramMethod) -> bool:
+    """
+    Два сообщения в один чат можно склеить, если это простой текст с одинаковыми параметрами
+    и клавиатура не окажется под чужим текстом: inline-клавиатура может быть только у последнего.
+    """
+    if not (isinstance(last, SendMessage) and isinstance(new, SendMessage)):
+        return False
+    if isinstance(last.reply_markup, InlineKeyboardMarkup):
+        return False
+    if last.reply_markup is not None and new.reply_markup is not None:
+        return False
+    same = ("parse_mode", "message_thread_id", "disable_notification", "protect_content", "link_preview_options")
+    if any(getattr(last, name) != getattr(new, name) for name in same):
+        return False
+    if new.reply_parameters is not None or new.entities or last.entities:
+        return False
+    return len(last.text) + len(COALESCE_SEPARATOR) + len(new.text) <= MESSAGE_LIMIT
+
+
+class SendQueue:
+    """
+    Общая очередь исходящих запросов к Telegram (отправка, правка, удаление сообщений).
+    Хендлер кладет запрос и сразу идет дальше, доставку выполняют фоновые воркеры:
+    - ограничение частоты: общее ведро токенов и ведро на каждый чат (для групп - реже);
+    - при TelegramRetryAfter чат ставится на паузу на retry_after и запрос повторяется;
+    - запросы в один чат выполняются строго по порядку;
+    - идущие подряд текстовые сообщения в один чат, еще не отправленные, склеиваются в одно.
+    """
+    def __init__(self, bot: Bot, config: SendQueueConfig):
+        self.bot = bot
+        self.config = config
+        self.global_bucket = TokenBucket(config.global_rate, config.global_burst)
+        self._buckets: dict[int | str, TokenBucket] = {}
+        self._pending: dict[int | str | tuple, deque[_Item]] = {}
+        self._paused_until: dict[int | str | tuple, float] = {}
+        self._ready: asyncio.Queue | None = None
+        self._workers: list[asyncio.Task] = []
+        self._idle: asyncio.Event | None = None
+        self._closed = False
+        self.sent = 0
+        self.coalesced = 0
+        self.retried = 0
+        self.failed = 0
+        self._chatless = itertools.count()
+
+    def _bucket(self, chat_id: int | str) -> TokenBucket:
+        if chat_id not in self._buckets:
+            group = isinstance(chat_id, str) or (chat_id or 0) < 0
+            rate = self.config.group_rate if group else self.config.chat_rate
+            self._buckets[chat_id] = TokenBucket(rate, self.config.chat_burst)
+        return self._buckets[chat_id]
+
+    def start(self) -> None:
+        """Запускает воркеры доставки (после close не запускает их снова)"""
+        if self._workers or self._closed:
+            return
+        self._ready = asyncio.Queue()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._workers = [asyncio.create_task(self._worker(), name=f"send-queue-{i}")
+                         for i in range(self.config.workers)]
+
+    def submit(self, method: TelegramMethod[Any], exclusive: bool = False) -> asyncio.Future:
+        """
+        Ставит запрос в очередь и сразу возвращает Future с его результатом.
+        Ждать Future нужно, только если нужен результат (например, отправленное сообщение для правки).
+        exclusive=True - сообщение не склеивается с соседними: его потом правят или удаляют отдельно.
+        После close запрос не выполняется: Future сразу завершается ошибкой.
+        """
+        future = asyncio.get_running_loop().create_future()
+        # Ошибку доставки уже залогировали - не даем asyncio ругаться на непрочитанное исключение
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        if self._closed:
+            logger.warning("Очередь отправки остановлена, %s не выполнен", type(method).__name__)
+            future.set_exception(RuntimeError("Очередь отправки остановлена"))
+            return future
+        self.start()
+
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            # Запрос без чата (ответ на нажатие кнопки) не ждет очереди и лимита чата - только общий лимит
+            chat_id = ("chatless", next(self._chatless))
+        pending = self._pending.get(chat_id)
+        last = pending[-1] if pending else None
+        if last and not (exclusive or last.exclusive or last.in_flight) and _can_coalesce(last.method, method):
+            last.method = last.method.model_copy(update={
+                "text": last.method.text + COALESCE_SEPARATOR + method.text,
+                "reply_markup": last.method.reply_markup or method.reply_markup,
+            })
+            last.futures.append(future)
+            self.coalesced += 1
+            REGISTRY.inc("bot_send_coalesced_total")
+            return future
+
+        if pending is None:
+            # Чата нет в работе - отдаем его воркерам
+            pending = self._pending[chat_id] = deque()
+            self._ready.put_nowait(chat_id)
+        pending.append(_Item(method, future, exclusive))
+        self._idle.clear()
+        REGISTRY.gauge_add("bot_send_queue_size", 1)
+        return future
+
+    def _reschedule(self, chat_id: int | str | tuple, delay: float) -> None:
+        """Возвращает чат воркерам через delay секунд"""
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self._ready.put_nowait, chat_id)
+        else:
+            self._ready.put_nowait(chat_id)
+
+    async def _worker(self) -> None:
+        while True:
+            chat_id = await self._ready.get()
+            pending = self._pending[chat_id]
+
+            # Чат на паузе или лимит исчерпан - вернемся к нему позже, воркер не ждет
+            bucket = self._bucket(chat_id) if not isinstance(chat_id, tuple) else None
+            delay = max(bucket.delay() if bucket else 0.0, self.global_bucket.delay(),
+                        self._paused_until.get(chat_id, 0) - time.monotonic())
+            if delay > 0:
+                self._reschedule(chat_id, delay)
+                continue
+
+            if bucket:
+                bucket.take()
+            self.global_bucket.take()
+            item = pending[0]
+            item.in_flight = True
+            try:
+                result = await self.bot(item.method)
+            except TelegramRetryAfter as e:
+                item.in_flight = False
+                self.retried += 1
+                REGISTRY.inc("bot_send_retry_after_total")
+                item.attempts += 1
+                if item.attempts <= self.config.max_retries:
+                    logger.warning("Флуд-контроль в чате %s, повтор через %s сек", chat_id, e.retry_after)
+                    self._paused_until[chat_id] = time.monotonic() + e.retry_after
+                    self._reschedule(chat_id, e.retry_after)
+                    continue
+                self._finish(chat_id, pending, error=e)
+            except Exception as e:
+                self._finish(chat_id, pending, error=e)
+            else:
+                self.sent += 1
+                self._finish(chat_id, pending, result=result)
+
+    def _finish(self, chat_id: int | str | tuple, pending: deque, result: Any = None, error: Exception | None = None) -> None:
+        """Снимает выполненный запрос с очереди чата и передает чат дальше"""
+        item = pending.popleft()
+        REGISTRY.gauge_add("bot_send_queue_size", -1)
+        if error is not None:
+            self.failed += 1
+            logger.error("Не удалось выполнить %s в чате %s: %s", type(item.method).__name__, chat_id, error)
+        for future in item.futures:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+        self._paused_until.pop(chat_id, None)
+        if pending:
+            self._ready.put_nowait(chat_id)
+        else:
+            del self._pending[chat_id]
+            if not self._pending:
+                self._idle.set()
+
+    def stats(self) -> dict:
+        """Размер очереди и счетчики доставки"""
+        return {
+            "queued": sum(len(pending) for pending in self._pending.values()),
+            "chats": len(self._pending),
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
+
+    async def close(self, timeout: float = 10.0) -> None:
+        """Дожидается доставки очереди (не дольше timeout) и останавливает воркеры. Новые запросы больше не принимаются"""
+        self._closed = True
+        if not self._workers:
+            return
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Очередь отправки не доставлена при остановке: %s", self.stats())
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+        # Недоставленные запросы завершаем ошибкой, чтобы их никто не ждал вечно
+        for pending in self._pending.values():
+            for item in pending:
+                for future in item.futures:
+                    if not future.done():
+                        future.set_exception(RuntimeError("Очередь отправки остановлена"))
+        self._pending.clear()
+
+
+REGISTRY.describe("bot_send_queue_size", "Запросы в очереди отправки")
+REGISTRY.describe("bot_send_coalesced_total", "Сообщения, склеенные с предыдущим")
+REGISTRY.describe("bot_send_retry_after_total", "Повторы после флуд-контроля Telegram")
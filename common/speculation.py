@@ -0,0 +1,166 @@
+import logging
+
+# Инициализируем логгер модуля
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.info("Загружен модуль: %s", __name__)
+
+import asyncio
+import hashlib
+import time
+from collections import deque
+from typing import Iterable
+
+from config_data.config import SpeculationConfig
+from common.cache import ResultCache
+from common.editing_engine import get_engine
+from common.metrics import REGISTRY
+from common.scheduler import RequestScheduler, SchedulerBusy
+
+
+class Speculator:
+    """
+    Упреждающая обработка: как только в черновик попал текст, операции (fix, rephrase)
+    запускаются в фоне, и нажатие кнопки забирает готовый или еще выполняющийся результат.
+    Результаты хранятся по хэшу фрагмента; когда черновик меняется или очищается, лишние запросы отменяются.
+    Упреждающие запросы идут через планировщик (общий лимит, слоты пользователя, отмена "❌ Отменить"),
+    но не мешают обычным: их не больше max_concurrent на весь бот, не больше user_budget в час на пользователя,
+    они не встают в очередь планировщика и не запускаются, пока в ней кто-то ждет.
+    """
+    def __init__(self, config: SpeculationConfig, scheduler: RequestScheduler, cache: ResultCache | None = None):
+        self.config = config
+        self.scheduler = scheduler
+        self.cache = cache
+        self._tasks: dict[int, dict[str, asyncio.Task]] = {}   # пользователь -> хэш фрагмента -> запрос
+        self._spent: dict[int, deque[float]] = {}               # время упреждающих запросов пользователя за час
+        self._running = 0
+        self.started = 0
+        self.hits = 0
+        self.misses = 0
+        self.cancelled = 0
+        self.wasted = 0
+        self.skipped = 0
+
+    @staticmethod
+    def key(operation: str, text: str) -> str:
+        return hashlib.sha256(f"{operation}\0{text}".encode()).hexdigest()
+
+    def _allow(self, user_id: int, operation: str) -> bool:
+        """Есть ли место для упреждающего запроса: общий лимит, очередь планировщика и бюджет пользователя"""
+        if self._running >= self.config.max_concurrent or self.scheduler.stats()["queued"]:
+            reason = "busy"
+        else:
+            spent = self._spent.setdefault(user_id, deque())
+            now = time.monotonic()
+            while spent and now - spent[0] > 3600:
+                spent.popleft()
+            if len(spent) < self.config.user_budget:
+                spent.append(now)
+                return True
+            reason = "budget"
+        self.skipped += 1
+        REGISTRY.inc("bot_speculation_skipped_total", operation=operation, reason=reason)
+        return False
+
+    async def _run(self, user_id: int, operation: str, text: str) -> str:
+        self._running += 1
+        try:
+            return await self.scheduler.run_idle(user_id, lambda: get_engine().run(operation, text, cache=self.cache))
+        except SchedulerBusy:
+            # Пока задача запускалась, свободные слоты заняли обычные запросы
+            self.skipped += 1
+            REGISTRY.inc("bot_speculation_skipped_total", operation=operation, reason="busy")
+            raise
+        finally:
+            self._running -= 1
+
+    def speculate(self, user_id: int, text: str) -> int:
+        """
+        Запускает операции для нового последнего фрагмента черновика.
+        Запросы для прежних фрагментов отменяются. Возвращает число запущенных запросов.
+        """
+        if not self.config.enabled:
+            return 0
+        if len(text.strip()) < self.config.min_chars:
+            self.discard(user_id)
+            return 0
+
+        keys = {self.key(operation, text): operation for operation in self.config.operations}
+        self._drop(user_id, keep=keys)
+        tasks = self._tasks.setdefault(user_id, {})
+        started = 0
+        for key, operation in keys.items():
+            if key in tasks or not self._allow(user_id, operation):
+                continue
+            task = asyncio.create_task(self._run(user_id, operation, text), name=f"speculate-{operation}-{user_id}")
+            # Результат упреждающего запроса может никто не забрать - не даем asyncio ругаться на ошибку
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            tasks[key] = task
+            started += 1
+            self.started += 1
+            REGISTRY.inc("bot_speculation_started_total", operation=operation)
+        if not tasks:
+            del self._tasks[user_id]
+        return started
+
+    def take(self, user_id: int, operation: str, text: str) -> asyncio.Task | None:
+        """Забирает готовый или выполняющийся результат для нажатой кнопки, None - промах"""
+        if not self.config.enabled:
+            return None
+        task = self._tasks.get(user_id, {}).pop(self.key(operation, text), None)
+        if task is None or (task.done() and (task.cancelled() or task.exception() is not None)):
+            self.misses += 1
+            REGISTRY.inc("bot_speculation_misses_total", operation=operation)
+            return None
+        self.hits += 1
+        REGISTRY.inc("bot_speculation_hits_total", operation=operation, state="done" if task.done() else "in_flight")
+        return task
+
+    def discard(self, user_id: int) -> None:
+        """Черновик очищен или изменен - отменяем все упреждающие запросы пользователя"""
+        self._drop(user_id, keep=())
+
+    def _drop(self, user_id: int, keep: Iterable[str]) -> None:
+        tasks = self._tasks.get(user_id)
+        if not tasks:
+            return
+        for key in [key for key in tasks if key not in keep]:
+            task = tasks.pop(key)
+            if not task.done():
+                task.cancel()
+                self.cancelled += 1
+                REGISTRY.inc("bot_speculation_cancelled_total")
+            elif not task.cancelled() and task.exception() is None:
+                # Результат посчитан, но не понадобился (он остался в кэше)
+                self.wasted += 1
+                REGISTRY.inc("bot_speculation_wasted_total")
+        if not tasks:
+            del self._tasks[user_id]
+
+    def close(self) -> None:
+        """Отменяет все упреждающие запросы при остановке бота"""
+        for user_id in list(self._tasks):
+            self.discard(user_id)
+
+    def stats(self) -> dict:
+        """Счетчики для /status"""
+        used = self.hits + self.misses
+        return {
+            "enabled": self.config.enabled,
+            "running": self._running,
+            "started": self.started,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / used * 100 if used else 0.0,
+            "cancelled": self.cancelled,
+            "wasted": self.wasted,
+            "skipped": self.skipped,
+        }
+
+
+REGISTRY.describe("bot_speculation_started_total", "Запущенные упреждающие запросы")
+REGISTRY.describe("bot_speculation_skipped_total", "Упреждающие запросы, пропущенные из-за нагрузки или бюджета")
+REGISTRY.describe("bot_speculation_hits_total", "Нажатия кнопок, получившие упреждающий результат")
+REGISTRY.describe("bot_speculation_misses_total", "Нажатия кнопок без упреждающего результата")
+REGISTRY.describe("bot_speculation_cancelled_total", "Упреждающие запросы, отмененные из-за изменения черновика")
+REGISTRY.describe("bot_speculation_wasted_total", "Упреждающие результаты, которые не понадобились")
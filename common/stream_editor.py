@@ -0,0 +1,99 @@
+import logging
+
+# Инициализируем логгер модуля
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.info("Загружен модуль: %s", __name__)
+
+import asyncio
+import time
+from html import escape
+
+from aiogram.types import Message
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+from common.send_queue import SendQueue, MESSAGE_LIMIT
+
+
+class MessageStreamer:
+    """
+    Выводит частичный ответ GPT в уже отправленное сообщение через edit_message_text.
+    Правки объединяются: сообщение редактируется не чаще, чем раз в interval секунд,
+    и всегда последним накопленным текстом. Правки идут через очередь отправки и ее лимиты.
+    """
+    def __init__(self, message: Message, header: str, send_queue: SendQueue, interval: float = 1.5):
+        self.message = message
+        self.header = header
+        self.send_queue = send_queue
+        self.interval = interval
+        self._text = ""
+        self._shown = ""
+        self._next_edit = 0.0
+        self._flusher: asyncio.Task | None = None
+
+    def _render(self, text: str, cursor: bool) -> str:
+        body = escape(text) + (" ▌" if cursor else "")
+        return f"{self.header}\n\n<code>{body}</code>"
+
+    async def _edit(self, rendered: str) -> bool:
+        """Редактирует сообщение, возвращает True если правка применена"""
+        try:
+            # Паузы флуд-контроля и повторы выполняет очередь, ждем только итог правки
+            await self.send_queue.submit(self.message.edit_text(rendered), exclusive=True)
+            return True
+        except TelegramRetryAfter as e:
+            # Очередь исчерпала повторы - сдвигаем следующую правку
+            self._next_edit = time.monotonic() + e.retry_after
+            logger.warning("Флуд-контроль при потоковой правке, ждем %s сек", e.retry_after)
+        except TelegramBadRequest as e:
+            if "message is not modified" not in str(e):
+                logger.error("Ошибка при потоковой правке сообщения: %s", e)
+        except Exception as e:
+            logger.error("Ошибка при потоковой правке сообщения: %s", e)
+        return False
+
+    async def _flush_loop(self):
+        """Фоновая задача: раз в interval выводит последний накопленный текст"""
+        while self._text != self._shown:
+            delay = self._next_edit - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            text = self._text
+            rendered = self._render(text, cursor=True)
+            if len(rendered) > MESSAGE_LIMIT:
+                # Дальше текст в сообщение не влезет - ждем финального результата
+                return
+            if await self._edit(rendered):
+                self._shown = text
+                self._next_edit = time.monotonic() + self.interval
+
+    async def push(self, text: str) -> None:
+        """Принимает накопленный на текущий момент текст ответа"""
+        self._text = text
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def cancel(self) -> None:
+        """Останавливает фоновые правки сообщения"""
+        if self._flusher is not None and not self._flusher.done():
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+
+    async def finish(self, text: str) -> bool:
+        """
+        Выводит итоговый текст в то же сообщение.
+        Возвращает False, если итог не поместился в сообщение и его нужно отправить отдельно.
+        """
+        await self.cancel()
+
+        rendered = self._render(text, cursor=False)
+        if len(rendered) > MESSAGE_LIMIT:
+            return False
+
+        delay = self._next_edit - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return await self._edit(rendered)
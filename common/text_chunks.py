@@ -0,0 +1,123 @@
+import logging
+
+# Инициализируем логгер модуля
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.info("Загружен модуль: %s", __name__)
+
+import asyncio
+import re
+from typing import Awaitable, Callable
+
+
+# Конец предложения: знак препинания и пробелы после него
+SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+
+
+# Функция грубой оценки количества токенов
+def estimate_tokens(text: str) -> int:
+    """Оценивает число токенов: для русского текста в среднем ~3 символа на токен"""
+    return len(text) // 3 + 1
+
+
+def _split_keep(text: str, pattern: re.Pattern) -> list[tuple[str, str]]:
+    """Делит текст по шаблону, сохраняя разделители: [(часть, разделитель после нее)]"""
+    parts = []
+    position = 0
+    for match in pattern.finditer(text):
+        parts.append((text[position:match.start()], match.group()))
+        position = match.end()
+    parts.append((text[position:], ""))
+    return parts
+
+
+def _split_chars(text: str, max_tokens: int) -> list[tuple[str, str]]:
+    """Слово длиннее бюджета (ссылка, base64 и т.п.) режем по символам"""
+    size = max(max_tokens * 3, 1)
+    return [(text[i:i + size], "") for i in range(0, len(text), size)]
+
+
+def _split_words(text: str, max_tokens: int) -> list[tuple[str, str]]:
+    """Последний вариант для очень длинного предложения: режем по словам"""
+    return _pack(_split_keep(text, re.compile(r"\s+")), max_tokens, _split_chars)
+
+
+def _pack(units: list[tuple[str, str]], max_tokens: int,
+          split_unit: Callable[[str, int], list[tuple[str, str]]] | None) -> list[tuple[str, str]]:
+    """Складывает части в куски не больше max_tokens; слишком большие части делит split_unit"""
+    chunks: list[tuple[str, str]] = []
+    current: str | None = None
+    current_sep = ""
+    for unit, sep in units:
+        if split_unit is not None and estimate_tokens(unit) > max_tokens:
+            if current is not None:
+                chunks.append((current, current_sep))
+                current, current_sep = None, ""
+            sub_chunks = split_unit(unit, max_tokens)
+            # Разделитель после большой части переносим на ее последний кусок
+            sub_chunks[-1] = (sub_chunks[-1][0], sub_chunks[-1][1] + sep)
+            chunks.extend(sub_chunks)
+            continue
+
+        if current is not None and estimate_tokens(current + current_sep + unit) > max_tokens:
+            chunks.append((current, current_sep))
+            current, current_sep = None, ""
+        current = unit if current is None else current + current_sep + unit
+        current_sep = sep
+
+    if current is not None:
+        chunks.append((current, current_sep))
+    return chunks
+
+
+def _split_sentences(text: str, max_tokens: int) -> list[tuple[str, str]]:
+    return _pack(_split_keep(text, SENTENCE_END), max_tokens, _split_words)
+
+
+# Функция разбиения текста на куски по абзацам и предложениям
+def split_text(text: str, max_tokens: int) -> list[tuple[str, str]]:
+    """
+    Делит текст на куски не больше max_tokens по границам абзацев, затем предложений.
+    Возвращает [(кусок, разделитель после него)] - склейка кусков с разделителями дает исходный текст.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return [(text, "")]
+    return _pack(_split_keep(text, re.compile(r"\n+")), max_tokens, _split_sentences)
+
+
+# Функция параллельной обработки кусков текста
+async def process_chunks(chunks: list[tuple[str, str]],
+                         worker: Callable[[str], Awaitable[str]],
+                         concurrency: int = 4,
+                         on_progress: Callable[[str], Awaitable[None]] | None = None) -> str:
+    """
+    Обрабатывает куски параллельно (не больше concurrency одновременно). Результаты склеиваются в исходном порядке.
+    Временные ошибки повторяет сам worker (LLMCaller), поэтому упавший кусок здесь не повторяется:
+    ошибка отменяет остальные куски.
+    on_progress получает готовое начало текста по мере завершения кусков.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    results: list[str | None] = [None] * len(chunks)
+
+    async def run(index: int, chunk: str) -> None:
+        async with semaphore:
+            results[index] = await worker(chunk)
+
+        if on_progress is not None:
+            # Показываем только непрерывное готовое начало текста, чтобы порядок не прыгал
+            prefix = []
+            for (_, sep), result in zip(chunks, results):
+                if result is None:
+                    break
+                prefix.append(result + sep)
+            await on_progress("".join(prefix))
+
+    tasks = [asyncio.create_task(run(index, chunk)) for index, (chunk, _) in enumerate(chunks)]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+    return "".join(result + sep for result, (_, sep) in zip(results, chunks))
@@ -0,0 +1,106 @@
+import logging
+
+# Инициализируем логгер модуля
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.info("Загружен модуль: %s", __name__)
+
+import json
+import re
+from dataclasses import dataclass
+from difflib import SequenceMatcher
+from html import escape
+
+
+# Слова, пробелы и знаки препинания - единицы сравнения для подсветки правок
+DIFF_TOKEN = re.compile(r"\s+|\w+|[^\w\s]")
+
+# Обертка ```json ... ```, которую модели иногда добавляют к ответу
+CODE_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+class EditError(ValueError):
+    """Список правок не разобрался или не применяется к тексту - нужен полный ответ модели"""
+
+
+@dataclass(frozen=True)
+class Edit:
+    """Замена фрагмента: old - дословная цитата из исходного текста, new - исправленный фрагмент"""
+    old: str
+    new: str
+
+
+# Функция разбора ответа модели со списком правок
+def parse_edits(raw: str) -> list[Edit]:
+    """Разбирает JSON вида {"edits": [{"old": "...", "new": "..."}]}"""
+    try:
+        data = json.loads(CODE_FENCE.sub("", raw.strip()))
+    except json.JSONDecodeError as e:
+        raise EditError(f"ответ не JSON: {e}") from None
+
+    items = data.get("edits") if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        raise EditError("в ответе нет списка edits")
+
+    edits = []
+    for item in items:
+        if not isinstance(item, dict) or not isinstance(item.get("old"), str) or not isinstance(item.get("new"), str):
+            raise EditError(f"неверная правка: {item!r}")
+        if not item["old"]:
+            raise EditError("пустой фрагмент old")
+        if item["old"] != item["new"]:
+            edits.append(Edit(item["old"], item["new"]))
+    return edits
+
+
+# Функция применения правок к тексту
+def apply_edits(text: str, edits: list[Edit]) -> str:
+    """
+    Применяет правки по порядку. Фрагмент old должен встречаться в тексте ровно один раз
+    и идти после предыдущей правки, иначе неясно, какое место править.
+    Если хоть одна правка не подходит, правки не применяются вовсе - EditError.
+    """
+    parts = []
+    position = 0
+    for edit in edits:
+        start = text.find(edit.old)
+        if start < 0:
+            raise EditError(f"фрагмент не найден: {edit.old[:50]!r}")
+        if text.find(edit.old, start + 1) >= 0:
+            raise EditError(f"фрагмент встречается в тексте несколько раз: {edit.old[:50]!r}")
+        if start < position:
+            raise EditError(f"правки пересекаются или идут не по порядку: {edit.old[:50]!r}")
+        parts.append(text[position:start])
+        parts.append(edit.new)
+        position = start + len(edit.old)
+    parts.append(text[position:])
+    return "".join(parts)
+
+
+# Функция подсветки правок для пользователя
+def render_diff(old: str, new: str, context: int = 4, max_hunks: int = 20) -> str:
+    """
+    Изменения в HTML для Telegram: по строке на группу близких правок, удаленное зачеркнуто,
+    добавленное жирным, вокруг - несколько слов контекста. Пустая строка, если текст не изменился.
+    """
+    a = DIFF_TOKEN.findall(old)
+    b = DIFF_TOKEN.findall(new)
+    hunks = []
+    for group in SequenceMatcher(None, a, b, autojunk=False).get_grouped_opcodes(context):
+        parts = []
+        for tag, i1, i2, j1, j2 in group:
+            if tag == "equal":
+                parts.append(escape("".join(a[i1:i2])))
+                continue
+            removed = "".join(a[i1:i2])
+            added = "".join(b[j1:j2])
+            # Изменение только в пробелах показываем значком, иначе его не видно
+            if removed:
+                parts.append(f"<s>{escape(removed) if removed.strip() else '␣'}</s>")
+            if added:
+                parts.append(f"<b>{escape(added) if added.strip() else '␣'}</b>")
+        hunks.append("…" + "".join(parts).strip() + "…")
+
+    if len(hunks) > max_hunks:
+        hunks = hunks[:max_hunks] + [f"и еще {len(hunks) - max_hunks}"]
+    return "\n".join(hunks)
@@ -0,0 +1,43 @@
+import logging
+
+# Инициализируем логгер модуля
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.info("Загружен модуль: %s", __name__)
+
+from functools import lru_cache
+
+from common.text_chunks import estimate_tokens
+
+
+# Кодировка для моделей, которых tiktoken не знает (локальные, новые)
+DEFAULT_ENCODING = "o200k_base"
+
+
+@lru_cache(maxsize=16)
+def _encoding(model: str):
+    """Токенизатор модели или None, если tiktoken не установлен или не смог загрузить словарь"""
+    # tiktoken нужен только для точного подсчета, поэтому импортируем его здесь
+    try:
+        import tiktoken
+    except ImportError:
+        logger.info("tiktoken не установлен, токены считаем приблизительно")
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding(DEFAULT_ENCODING)
+    except Exception as e:
+        # Словарь скачивается при первом использовании - без сети его может не быть
+        logger.warning("Не удалось загрузить токенизатор для %s, считаем приблизительно: %s", model, e)
+        return None
+
+
+# Функция подсчета токенов текста
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    """Число токенов текста для модели: через tiktoken, без него - оценка по длине"""
+    encoding = _encoding(model)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
@@ -0,0 +1,192 @@
+import logging
+
+# Инициализируем логгер модуля
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.info("Загружен модуль: %s", __name__)
+
+import asyncio
+import os
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+from typing import BinaryIO
+
+from config_data.config import TranscriptionConfig
+from common.gpt_client import get_client, get_caller
+from common.metrics import REGISTRY
+
+
+class TranscriptionBackend(ABC):
+    """
+    Интерфейс распознавания речи. Реализация получает открытый буфер с аудио (ogg/opus из Telegram)
+    и возвращает текст. model - имя модели, входит в ключ кэша расшифровок.
+    """
+    name = "base"
+    model = ""
+
+    @property
+    def ready(self) -> bool:
+        """Готов ли бэкенд принимать запросы (модель загружена)"""
+        return True
+
+    async def warm_up(self) -> None:
+        """Загружает модель заранее, чтобы первое голосовое не ждало загрузки"""
+
+    @abstractmethod
+    async def transcribe(self, audio: BinaryIO, language: str, size: int = 0) -> str:
+        """Распознает аудио из буфера, size - его размер в байтах"""
+
+    def close(self) -> None:
+        """Освобождает ресурсы бэкенда"""
+
+
+class OpenAIBackend(TranscriptionBackend):
+    """Распознавание через OpenAI Whisper API: с повторами и предохранителем LLMCaller"""
+    name = "openai"
+
+    def __init__(self, model: str = "whisper-1"):
+        self.model = model
+
+    async def transcribe(self, audio: BinaryIO, language: str, size: int = 0) -> str:
+        # Буфер в памяти отдаем байтами: у файлового объекта httpx вызывает fileno(),
+        # и SpooledTemporaryFile сбросился бы на диск
+        payload: bytes | None = None
+        if isinstance(audio, SpooledTemporaryFile) and not audio._rolled:
+            audio.seek(0)
+            payload = audio.read()
+
+        async def request(model: str):
+            # При повторе читаем файл с начала
+            if payload is None:
+                audio.seek(0)
+            upload = payload if payload is not None else audio
+            async with REGISTRY.timer("whisper", model=model):
+                return await get_client().audio.transcriptions.create(model=model,
+                                                                      file=("voice.ogg", upload),
+                                                                      language=language)
+
+        transcript = await get_caller().call("transcribe", self.model, request, size=size)
+        return transcript.text
+
+
+class LocalWhisperBackend(TranscriptionBackend):
+    """
+    Распознавание на CPU этого хоста через faster-whisper (CTranslate2) с квантованной моделью.
+    Модель загружается один раз, запросы выполняются в пуле потоков по числу ядер:
+    workers потоков, у каждого cpu_threads ядер, workers * cpu_threads <= числу ядер.
+    """
+    name = "local"
+
+    def __init__(self, model: str = "small", compute_type: str = "int8", workers: int = 0, beam_size: int = 1):
+        self.model = f"faster-whisper-{model}-{compute_type}"
+        self.model_size = model
+        self.compute_type = compute_type
+        cores = os.cpu_count() or 1
+        self.workers = workers or max(1, cores // 2)
+        self.cpu_threads = max(1, cores // self.workers)
+        self.beam_size = beam_size
+        self._model = None
+        self._loading: asyncio.Task | None = None
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="stt")
+
+    @property
+    def ready(self) -> bool:
+        return self._model is not None
+
+    def _load(self):
+        # faster-whisper нужен только для локального распознавания, поэтому импортируем его здесь
+        from faster_whisper import WhisperModel
+
+        model = WhisperModel(self.model_size, device="cpu", compute_type=self.compute_type,
+                             cpu_threads=self.cpu_threads, num_workers=self.workers)
+        # Прогоняем секунду тишины, чтобы первый настоящий запрос не платил за инициализацию
+        import numpy
+        list(model.transcribe(numpy.zeros(16000, dtype=numpy.float32), beam_size=1)[0])
+        return model
+
+    async def warm_up(self) -> None:
+        if self._model is not None:
+            return
+        if self._loading is None:
+            self._loading = asyncio.ensure_future(
+                asyncio.get_running_loop().run_in_executor(self._executor, self._load))
+        try:
+            self._model = await self._loading
+            logger.info("Локальная модель распознавания %s загружена: %s потоков x %s ядер",
+                        self.model, self.workers, self.cpu_threads)
+        except Exception:
+            # Следующий warm_up попробует загрузить модель заново
+            self._loading = None
+            raise
+
+    def _transcribe(self, audio: BinaryIO, language: str) -> str:
+        audio.seek(0)
+        segments, _ = self._model.transcribe(audio, language=language, beam_size=self.beam_size,
+                                             vad_filter=True)
+        return " ".join(segment.text.strip() for segment in segments).strip()
+
+    async def transcribe(self, audio: BinaryIO, language: str, size: int = 0) -> str:
+        await self.warm_up()
+        async with REGISTRY.timer("whisper", model=self.model):
+            return await asyncio.get_running_loop().run_in_executor(self._executor, self._transcribe, audio, language)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class Transcriber:
+    """
+    Выбор бэкенда распознавания по конфигу и длительности голосового:
+    - openai: всегда API;
+    - local: всегда локальная модель;
+    - auto: короткие голосовые (до local_max_seconds) - локально, длинные - в API.
+    Если локальная модель не загружена или упала, голосовое распознается через API.
+    """
+    def __init__(self, config: TranscriptionConfig, openai_model: str = "whisper-1"):
+        self.config = config
+        self.remote = OpenAIBackend(openai_model)
+        self.local: LocalWhisperBackend | None = None
+        self._warm_task: asyncio.Task | None = None
+        if config.backend in ("local", "auto"):
+            self.local = LocalWhisperBackend(config.local_model, config.local_compute_type,
+                                             config.local_workers, config.local_beam_size)
+
+    def select(self, duration: int) -> TranscriptionBackend:
+        """Бэкенд для голосового длительностью duration секунд"""
+        if self.local is None:
+            return self.remote
+        if self.config.backend == "local":
+            return self.local
+        if self.local.ready and duration <= self.config.local_max_seconds:
+            return self.local
+        return self.remote
+
+    async def warm_up(self) -> None:
+        """Загружает локальную модель при старте бота"""
+        if self.local is None:
+            return
+        try:
+            await self.local.warm_up()
+        except Exception as e:
+            logger.error("Не удалось загрузить локальную модель распознавания, используем API: %s", e)
+
+    def start(self) -> None:
+        """Запускает загрузку локальной модели в фоне, пока она грузится - голосовые идут в API"""
+        if self.local is not None and self._warm_task is None:
+            self._warm_task = asyncio.create_task(self.warm_up(), name="stt-warm-up")
+
+    async def transcribe(self, backend: TranscriptionBackend, audio: BinaryIO, language: str,
+                         size: int = 0) -> tuple[str, TranscriptionBackend]:
+        """Распознает аудио выбранным бэкендом, при ошибке локальной модели - через API"""
+        try:
+            return await backend.transcribe(audio, language, size), backend
+        except Exception as e:
+            if backend is self.remote:
+                raise
+            logger.error("Ошибка локального распознавания, повторяем через API: %s", e)
+            return await self.remote.transcribe(audio, language, size), self.remote
+
+    def close(self) -> None:
+        if self.local is not None:
+            self.local.close()
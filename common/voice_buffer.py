@@ -0,0 +1,48 @@
+import logging
+
+# Инициализируем логгер модуля
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.info("Загружен модуль: %s", __name__)
+
+from contextlib import contextmanager
+from tempfile import SpooledTemporaryFile
+from typing import Iterator
+
+
+class VoiceBuffers:
+    """
+    Буферы для скачивания голосовых в память.
+    Файл до spill_bytes держится в оперативной памяти, больше - сбрасывается во временный файл.
+    Считает, сколько байт сейчас занято голосовыми в обработке.
+    """
+    def __init__(self, spill_bytes: int = 5 * 1024 * 1024):
+        self.spill_bytes = spill_bytes
+        self.in_flight_bytes = 0
+        self.in_flight_count = 0
+        self.spilled = 0
+
+    @contextmanager
+    def open(self, expected_size: int | None = None) -> Iterator[SpooledTemporaryFile]:
+        """Открывает буфер на время обработки голосового, после выхода буфер закрывается"""
+        buffer = SpooledTemporaryFile(max_size=self.spill_bytes, mode="w+b")
+        reserved = expected_size or 0
+        self.in_flight_bytes += reserved
+        self.in_flight_count += 1
+        try:
+            yield buffer
+        finally:
+            if buffer._rolled:
+                self.spilled += 1
+                logger.info("Голосовое больше %s байт, буфер сброшен во временный файл", self.spill_bytes)
+            self.in_flight_bytes -= reserved
+            self.in_flight_count -= 1
+            buffer.close()
+
+    def stats(self) -> dict:
+        """Счетчики буферов для /status"""
+        return {
+            "in_flight_bytes": self.in_flight_bytes,
+            "in_flight_count": self.in_flight_count,
+            "spilled": self.spilled,
+        }
@@ -0,0 +1,113 @@
+import logging
+
+# Инициализируем логгер модуля
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.info("Загружен модуль: %s", __name__)
+
+import asyncio
+import secrets
+import signal
+from typing import Any
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import setup_application
+
+from config_data.config import WebhookConfig
+
+
+class WebhookHandler:
+    """
+    Обработчик POST запросов Telegram: проверяет секретный токен, сразу отвечает 200
+    и обрабатывает апдейт в фоне. Фоновые задачи хранятся в in_flight, чтобы дождаться их при остановке.
+    """
+    def __init__(self, dp: Dispatcher, bot: Bot, secret: str) -> None:
+        self.dp = dp
+        self.bot = bot
+        self.secret = secret
+        self.in_flight: set[asyncio.Task] = set()
+
+    async def _feed(self, update: dict[str, Any]) -> None:
+        result = await self.dp.feed_raw_update(bot=self.bot, update=update)
+        # Ответ хендлера методом (как в режиме ответа на вебхук) отправляем обычным запросом
+        if isinstance(result, TelegramMethod):
+            await self.dp.silent_call_request(bot=self.bot, result=result)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not secrets.compare_digest(token, self.secret):
+            return web.Response(text="Unauthorized", status=401)
+        task = asyncio.create_task(self._feed(await request.json(loads=self.bot.session.json_loads)))
+        self.in_flight.add(task)
+        task.add_done_callback(self.in_flight.discard)
+        return web.json_response({})
+
+
+# Функция запуска бота в режиме вебхука на встроенном aiohttp сервере
+async def run_webhook(dp: Dispatcher, bot: Bot, config: WebhookConfig, allowed_updates: list[str]) -> None:
+    """
+    Поднимает aiohttp сервер с обработчиком вебхука, проверкой секретного токена и /health.
+    Работает до SIGTERM/SIGINT, затем дожидается обработки принятых апдейтов (не дольше drain_timeout).
+    Без WEBHOOK_SECRET не запускается: иначе поддельные апдейты мог бы прислать любой, кто узнал адрес.
+    """
+    if not config.secret:
+        raise RuntimeError("Режим webhook требует WEBHOOK_SECRET")
+
+    app = web.Application()
+
+    # Апдейты обрабатываются в фоне, Telegram сразу получает ответ 200
+    webhook_handler = WebhookHandler(dp, bot, config.secret)
+    app.router.add_post(config.path, webhook_handler.handle)
+
+    # Задачи обработки апдейтов, принятых, но еще не обработанных
+    in_flight = webhook_handler.in_flight
+    stopping = asyncio.Event()
+
+    async def health(request: web.Request) -> web.Response:
+        status = "draining" if stopping.is_set() else "ok"
+        return web.json_response({"status": status, "in_flight": len(in_flight)},
+                                 status=503 if stopping.is_set() else 200)
+
+    app.router.add_get(config.health_path, health)
+
+    async def set_webhook(app: web.Application) -> None:
+        await bot.set_webhook(url=config.url.rstrip('/') + config.path,
+                              secret_token=config.secret,
+                              allowed_updates=allowed_updates,
+                              drop_pending_updates=True)
+        logger.info("Вебхук установлен: %s%s", config.url.rstrip('/'), config.path)
+
+    async def drain(app: web.Application) -> None:
+        # Новые запросы уже не принимаются - дожидаемся начатых апдейтов, потом останавливаем диспетчер
+        if in_flight:
+            logger.info("Ожидаем обработку %s апдейтов перед остановкой", len(in_flight))
+            done, pending = await asyncio.wait(set(in_flight), timeout=config.drain_timeout)
+            if pending:
+                logger.warning("Не дождались %s апдейтов за %s сек", len(pending), config.drain_timeout)
+
+    app.on_startup.append(set_webhook)
+    setup_application(app, dp, bot=bot)
+    # drain должен выполниться раньше остановки диспетчера (on_shutdown бота)
+    app.on_shutdown.insert(0, drain)
+
+    runner = web.AppRunner(app, shutdown_timeout=config.drain_timeout)
+    await runner.setup()
+    site = web.TCPSite(runner, host=config.host, port=config.port)
+    await site.start()
+    logger.info("Сервер вебхука запущен на %s:%s", config.host, config.port)
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stopping.set)
+        except NotImplementedError:  # Windows
+            pass
+
+    try:
+        await stopping.wait()
+    finally:
+        stopping.set()
+        logger.info("Останавливаем сервер вебхука")
+        await runner.cleanup()
@@ -5,7 +5,7 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 logger.info("Загружен модуль: %s", __name__)
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from environs import Env
 import json
 
@@ -24,13 +24,247 @@ class TgBot:
     api_gpt: str
 
 
+@dataclass
+class GptConfig:
+    """
+    Класс для хранения настроек HTTP-клиента OpenAI и движка редактирования.
+    """
+    base_url: str | None = None     # OpenAI-совместимый сервер (llama.cpp, vLLM, fake_openai), None - api.openai.com
+    model: str = ""                 # Модель для всех операций (пусто - модель из описания операции)
+    operation_models: dict[str, str] = field(default_factory=dict)  # Модель по операциям: {"fix": "gpt-4o-mini"}
+    pool_size: int = 20             # Максимум одновременных соединений с API
+    keepalive: int = 10             # Сколько соединений держать открытыми между запросами
+    keepalive_expiry: float = 30.0  # Через сколько секунд простоя закрывать соединение
+    connect_timeout: float = 10.0   # Таймаут установки соединения, сек
+    read_timeout: float = 120.0     # Таймаут ожидания ответа, сек
+    max_retries: int = 0            # Повторы внутри клиента OpenAI (повторами управляет LLMCaller)
+    stream: bool = False            # Потоковый вывод ответа GPT в сообщение "⌛️ ..."
+    stream_edit_interval: float = 1.5  # Минимальный интервал между правками сообщения, сек
+    chunk_tokens: int = 1500        # Длинный текст делится на куски примерно такого размера в токенах
+    chunk_concurrency: int = 4      # Сколько кусков обрабатывать одновременно
+    edit_mode: str = "full"         # Ответ списком правок: full - никогда, edits - всегда, auto - для длинных текстов
+    edit_min_tokens: int = 150      # С какого размера текста в режиме auto просить список правок
+
+
+@dataclass
+class CacheConfig:
+    """
+    Класс для хранения настроек кэша результатов GPT.
+    """
+    max_entries: int = 512          # Максимум записей в памяти
+    max_mb: float = 8.0             # Максимальный объем кэша в памяти, МБ
+    ttl_hours: float = 24.0         # Время жизни записи, часы
+    db_path: str | None = None      # Файл SQLite для кэша, переживающего перезапуск (None - только память)
+    voice_max_entries: int = 2048   # Максимум расшифровок голосовых в памяти
+    voice_ttl_hours: float = 720.0  # Время жизни расшифровки, часы
+    voice_db_path: str | None = "voice_cache.db"  # Файл SQLite для расшифровок голосовых
+    voice_buffer_mb: float = 5.0    # Голосовые до этого размера держим в памяти, больше - во временном файле
+
+
+@dataclass
+class StorageConfig:
+    """
+    Класс для хранения настроек хранилища FSM.
+    """
+    backend: str = "memory"         # memory, sqlite или redis
+    path: str = "fsm.db"            # Файл SQLite (для backend=sqlite)
+    redis_url: str = "redis://localhost:6379/0"  # Адрес Redis (для backend=redis)
+    ttl_hours: float = 168.0        # Сколько хранить брошенную сессию, часы
+    cache_size: int = 256           # Сколько сессий держать в памяти (для backend=sqlite)
+
+
+@dataclass
+class DraftConfig:
+    """
+    Класс для хранения настроек черновиков и истории правок.
+    """
+    db_path: str | None = None      # Файл SQLite для журнала черновиков (None - только в памяти)
+    max_fragments: int = 50         # Максимум фрагментов в черновике
+    max_chars: int = 50_000         # Максимум символов в черновике
+    max_revisions: int = 30         # Сколько ревизий черновика держать для отмены правок
+    max_history_mb: float = 1.0     # Предел объема текстов в истории одного черновика, МБ
+    compact_every: int = 50         # После скольких записей в журнале сворачивать черновик в снимок
+    cache_size: int = 256           # Сколько черновиков держать в памяти (без файла журнала лишние удаляются)
+
+
+@dataclass
+class WebhookConfig:
+    """
+    Класс для хранения настроек получения апдейтов.
+    """
+    mode: str = "polling"           # polling или webhook
+    url: str = ""                   # Публичный адрес, на который Telegram шлет апдейты (https://example.com)
+    path: str = "/webhook"          # Путь обработчика вебхука
+    secret: str = ""                # Секретный токен из заголовка X-Telegram-Bot-Api-Secret-Token (обязателен для webhook)
+    host: str = "127.0.0.1"         # Адрес встроенного сервера (за локальным обратным прокси)
+    port: int = 8080                # Порт встроенного сервера
+    health_path: str = "/health"    # Путь проверки состояния
+    drain_timeout: float = 30.0     # Сколько ждать обработки принятых апдейтов при остановке, сек
+
+
+@dataclass
+class SchedulerConfig:
+    """
+    Класс для хранения настроек очереди запросов к GPT и Whisper.
+    """
+    max_concurrent: int = 8         # Всего одновременных запросов
+    per_user_concurrent: int = 2    # Одновременных запросов на пользователя
+    max_queue: int = 50             # Максимум запросов в очереди, сверх - отказ сразу
+    max_queue_per_user: int = 5     # Максимум запросов в очереди на пользователя
+
+
+@dataclass
+class LaneConfig:
+    """
+    Класс для хранения настроек очередей апдейтов по пользователям.
+    """
+    enabled: bool = True            # Обрабатывать апдейты одного пользователя в чате строго по очереди
+    max_pending: int = 10           # Апдейтов в очереди пользователя (с выполняющимся), сверх - пропускаются
+    bypass: list[str] = field(default_factory=lambda: ["❌ Отменить", "ed_cancel", "/status", "/ping"])  # Команды и кнопки вне очереди
+
+
+@dataclass
+class AccessConfig:
+    """
+    Класс для хранения настроек допуска апдейтов и защиты от флуда.
+    """
+    rate: float = 1.0               # Апдейтов в секунду от администратора в среднем
+    burst: int = 20                 # Сколько апдейтов администратор может прислать разом
+    stranger_per_minute: float = 1.0  # /start в минуту от постороннего пользователя
+    stranger_burst: int = 3         # Сколько /start посторонний может прислать разом
+    announce_hours: float = 24.0    # Как часто сообщать в домашнюю группу о /start одного пользователя, часы
+    max_tracked: int = 10_000       # Сколько пользователей помнить для лимитов и оповещений
+
+
+@dataclass
+class ResilienceConfig:
+    """
+    Класс для хранения настроек повторов, предохранителя и запасной модели.
+    """
+    max_attempts: int = 3           # Попыток на один запрос
+    backoff_base: float = 1.0       # Базовая пауза между попытками, сек (растет вдвое, случайная в пределах)
+    backoff_cap: float = 20.0       # Максимальная пауза между попытками, сек
+    attempt_timeout: float = 90.0   # Таймаут одной попытки, сек
+    breaker_threshold: int = 5      # Ошибок подряд, после которых модель временно отключается
+    breaker_reset: float = 30.0     # Через сколько секунд пробовать модель снова
+    fallback_model: str = "gpt-4o-mini"  # Быстрая модель, если основная не укладывается в бюджет или недоступна
+    budgets: dict[str, float] = field(default_factory=lambda: {"fix": 15.0, "rephrase": 20.0})  # Бюджет задержки операций, сек
+
+
+@dataclass
+class MetricsConfig:
+    """
+    Класс для хранения настроек локального эндпоинта метрик.
+    """
+    host: str = "127.0.0.1"         # Адрес HTTP сервера метрик
+    port: int = 9100                # Порт HTTP сервера метрик (0 - не запускать)
+
+
+@dataclass
+class MonitorConfig:
+    """
+    Класс для хранения настроек фонового мониторинга ресурсов.
+    """
+    interval: float = 10.0          # Интервал замеров, сек
+    history_minutes: float = 60.0   # Сколько минут замеров держать в кольцевом буфере
+    cpu_limit: float = 80.0         # Порог загрузки CPU, %
+    fd_limit: int = 800             # Порог открытых файловых дескрипторов
+    lag_limit: float = 0.5          # Порог задержки цикла событий, сек
+    tasks_limit: int = 2000         # Порог числа задач asyncio
+    alert_cooldown: float = 900.0   # Не чаще одного предупреждения на показатель за это время, сек
+
+
+@dataclass
+class SendQueueConfig:
+    """
+    Класс для хранения настроек очереди исходящих сообщений.
+    """
+    global_rate: float = 25.0       # Запросов к Telegram в секунду на всего бота
+    global_burst: float = 30.0      # Сколько запросов можно выполнить разом сверх ровного темпа
+    chat_rate: float = 1.0          # Запросов в секунду в личный чат
+    group_rate: float = 0.33        # Запросов в секунду в группу или канал (Telegram: 20 в минуту)
+    chat_burst: float = 5.0         # Запас запросов на чат
+    max_retries: int = 3            # Повторов запроса после TelegramRetryAfter
+    workers: int = 4                # Воркеров доставки
+
+
+@dataclass
+class OutboxConfig:
+    """
+    Класс для хранения настроек очереди публикаций в каналы.
+    """
+    db_path: str = "outbox.db"      # Файл SQLite очереди публикаций
+    batch_size: int = 20            # Сколько публикаций отправлять за один проход
+    max_attempts: int = 5           # Попыток на публикацию при временных ошибках
+    retry_base: float = 5.0         # Пауза перед первым повтором, сек (дальше растет вдвое)
+    retry_cap: float = 600.0        # Максимальная пауза между повторами, сек
+    poll_interval: float = 30.0     # Как часто проверять очередь без новых записей, сек
+
+
+@dataclass
+class TranscriptionConfig:
+    """
+    Класс для хранения настроек распознавания голосовых.
+    """
+    backend: str = "openai"         # openai, local (модель на этом хосте) или auto (короткие - локально)
+    local_model: str = "small"      # Размер модели faster-whisper: tiny, base, small, medium
+    local_compute_type: str = "int8"  # Квантование модели на CPU
+    local_workers: int = 0          # Параллельных распознаваний (0 - половина ядер)
+    local_beam_size: int = 1        # Ширина поиска при декодировании (1 - быстрее всего)
+    local_max_seconds: int = 60     # В режиме auto голосовые длиннее этого отправляются в API
+
+
+@dataclass
+class RouterConfig:
+    """
+    Класс для хранения настроек выбора модели по размеру текста.
+    """
+    enabled: bool = True            # Выбирать модель по размеру текста (False - всегда модель операции)
+    small_model: str = "gpt-4o-mini"  # Быстрая модель для коротких текстов (пусто - не использовать)
+    small_tokens: dict[str, int] = field(default_factory=lambda: {"fix": 400, "rephrase": 120})  # До скольких токенов текст считается коротким
+    latency_targets: dict[str, float] = field(default_factory=lambda: {"fix": 8.0, "rephrase": 12.0})  # Желаемое время ответа, сек
+    output_ratio: dict[str, float] = field(default_factory=lambda: {"fix": 1.5, "rephrase": 1.5, "fix_edits": 0.5})  # max_tokens = токены текста * ratio + margin
+    output_margin: int = 200        # Запас токенов ответа
+    max_output: int = 16384         # Предел max_tokens модели
+
+
+@dataclass
+class SpeculationConfig:
+    """
+    Класс для хранения настроек упреждающей обработки текста.
+    """
+    enabled: bool = False           # Запускать операции в фоне сразу после получения текста
+    operations: list[str] = field(default_factory=lambda: ["fix"])  # Какие операции считать заранее
+    user_budget: int = 30           # Упреждающих запросов на пользователя в час
+    max_concurrent: int = 2         # Одновременных упреждающих запросов на весь бот
+    min_chars: int = 20             # Короче этого текст заранее не обрабатываем
+
+
 @dataclass
 class Config:
     """
     Основной класс конфигурации всего приложения
     """
     tg_bot: TgBot
+    gpt: GptConfig
+    cache: CacheConfig
+    storage: StorageConfig
+    draft: DraftConfig
+    webhook: WebhookConfig
+    scheduler: SchedulerConfig
+    lanes: LaneConfig
+    access: AccessConfig
+    resilience: ResilienceConfig
+    metrics: MetricsConfig
+    monitor: MonitorConfig
+    send_queue: SendQueueConfig
+    outbox: OutboxConfig
+    transcription: TranscriptionConfig
+    router: RouterConfig
+    speculation: SpeculationConfig
     memory_limit: float = 450.0  # Лимит памяти в МБ
+    channels_ttl: float = 3600.0  # Как долго доверять сведениям о каналах и правах бота, сек
+    editor_ui: str = "reply"  # Интерфейс редактора: reply - сообщения и обычная клавиатура, inline - одно сообщение с inline кнопками
 
 # Функция загрузки конфигурации из файла окружения .env
 def load_config(path: str | None = None) -> Config:
@@ -43,6 +277,7 @@ def load_config(path: str | None = None) -> Config:
     work_group = map(int, env('WORK_GROUP').split(','))
     channels_str = env('CHANNELS')
     channels = json.loads(channels_str)
+    fsm_storage = env.str('FSM_STORAGE', 'memory')
 
     return Config(
         tg_bot=TgBot(
@@ -53,5 +288,154 @@ def load_config(path: str | None = None) -> Config:
             work_group=list(work_group),
             channels=channels,
             api_gpt=env('API_GPT')
-            )
+            ),
+        gpt=GptConfig(
+            base_url=env.str('GPT_BASE_URL', None) or None,
+            model=env.str('GPT_MODEL', ''),
+            operation_models=env.json('GPT_OPERATION_MODELS', {}),
+            pool_size=env.int('GPT_POOL_SIZE', 20),
+            keepalive=env.int('GPT_KEEPALIVE', 10),
+            keepalive_expiry=env.float('GPT_KEEPALIVE_EXPIRY', 30.0),
+            connect_timeout=env.float('GPT_CONNECT_TIMEOUT', 10.0),
+            read_timeout=env.float('GPT_READ_TIMEOUT', 120.0),
+            max_retries=env.int('GPT_MAX_RETRIES', 0),
+            stream=env.bool('GPT_STREAM', False),
+            stream_edit_interval=env.float('GPT_STREAM_EDIT_INTERVAL', 1.5),
+            chunk_tokens=env.int('GPT_CHUNK_TOKENS', 1500),
+            chunk_concurrency=env.int('GPT_CHUNK_CONCURRENCY', 4),
+            edit_mode=env.str('GPT_EDIT_MODE', 'full'),
+            edit_min_tokens=env.int('GPT_EDIT_MIN_TOKENS', 150)
+            ),
+        cache=CacheConfig(
+            max_entries=env.int('CACHE_MAX_ENTRIES', 512),
+            max_mb=env.float('CACHE_MAX_MB', 8.0),
+            ttl_hours=env.float('CACHE_TTL_HOURS', 24.0),
+            db_path=env.str('CACHE_DB', None) or None,
+            voice_max_entries=env.int('VOICE_CACHE_MAX_ENTRIES', 2048),
+            voice_ttl_hours=env.float('VOICE_CACHE_TTL_HOURS', 720.0),
+            voice_db_path=env.str('VOICE_CACHE_DB', 'voice_cache.db') or None,
+            voice_buffer_mb=env.float('VOICE_BUFFER_MB', 5.0)
+            ),
+        storage=StorageConfig(
+            backend=fsm_storage,
+            path=env.str('FSM_DB', 'fsm.db'),
+            redis_url=env.str('REDIS_URL', 'redis://localhost:6379/0'),
+            ttl_hours=env.float('FSM_TTL_HOURS', 168.0),
+            cache_size=env.int('FSM_CACHE_SIZE', 256)
+            ),
+        draft=DraftConfig(
+            # С постоянным хранилищем FSM черновик тоже должен пережить перезапуск вместе с состоянием
+            db_path=env.str('DRAFT_DB', None if fsm_storage == 'memory' else 'drafts.db') or None,
+            max_fragments=env.int('DRAFT_MAX_FRAGMENTS', 50),
+            max_chars=env.int('DRAFT_MAX_CHARS', 50_000),
+            max_revisions=env.int('DRAFT_HISTORY_REVISIONS', 30),
+            max_history_mb=env.float('DRAFT_HISTORY_MB', 1.0),
+            compact_every=env.int('DRAFT_COMPACT_EVERY', 50),
+            cache_size=env.int('DRAFT_CACHE_SIZE', 256)
+            ),
+        webhook=WebhookConfig(
+            mode=env.str('UPDATES_MODE', 'polling'),
+            url=env.str('WEBHOOK_URL', ''),
+            path=env.str('WEBHOOK_PATH', '/webhook'),
+            secret=env.str('WEBHOOK_SECRET', ''),
+            host=env.str('WEBHOOK_HOST', '127.0.0.1'),
+            port=env.int('WEBHOOK_PORT', 8080),
+            health_path=env.str('WEBHOOK_HEALTH_PATH', '/health'),
+            drain_timeout=env.float('WEBHOOK_DRAIN_TIMEOUT', 30.0)
+            ),
+        scheduler=SchedulerConfig(
+            max_concurrent=env.int('SCHED_MAX_CONCURRENT', 8),
+            per_user_concurrent=env.int('SCHED_PER_USER', 2),
+            max_queue=env.int('SCHED_MAX_QUEUE', 50),
+            max_queue_per_user=env.int('SCHED_MAX_QUEUE_PER_USER', 5)
+            ),
+        lanes=LaneConfig(
+            enabled=env.bool('LANES_ENABLED', True),
+            max_pending=env.int('LANE_MAX_PENDING', 10),
+            bypass=env.list('LANE_BYPASS', ["❌ Отменить", "ed_cancel", "/status", "/ping"])
+            ),
+        access=AccessConfig(
+            rate=env.float('ACCESS_RATE', 1.0),
+            burst=env.int('ACCESS_BURST', 20),
+            stranger_per_minute=env.float('ACCESS_STRANGER_PER_MINUTE', 1.0),
+            stranger_burst=env.int('ACCESS_STRANGER_BURST', 3),
+            announce_hours=env.float('ACCESS_ANNOUNCE_HOURS', 24.0),
+            max_tracked=env.int('ACCESS_MAX_TRACKED', 10_000)
+            ),
+        resilience=ResilienceConfig(
+            max_attempts=env.int('LLM_MAX_ATTEMPTS', 3),
+            backoff_base=env.float('LLM_BACKOFF_BASE', 1.0),
+            backoff_cap=env.float('LLM_BACKOFF_CAP', 20.0),
+            attempt_timeout=env.float('LLM_ATTEMPT_TIMEOUT', 90.0),
+            breaker_threshold=env.int('LLM_BREAKER_THRESHOLD', 5),
+            breaker_reset=env.float('LLM_BREAKER_RESET', 30.0),
+            fallback_model=env.str('LLM_FALLBACK_MODEL', 'gpt-4o-mini'),
+            budgets={"fix": env.float('LLM_BUDGET_FIX', 15.0),
+                     "rephrase": env.float('LLM_BUDGET_REPHRASE', 20.0)}
+            ),
+        metrics=MetricsConfig(
+            host=env.str('METRICS_HOST', '127.0.0.1'),
+            port=env.int('METRICS_PORT', 9100)
+            ),
+        monitor=MonitorConfig(
+            interval=env.float('MONITOR_INTERVAL', 10.0),
+            history_minutes=env.float('MONITOR_HISTORY_MINUTES', 60.0),
+            cpu_limit=env.float('MONITOR_CPU_LIMIT', 80.0),
+            fd_limit=env.int('MONITOR_FD_LIMIT', 800),
+            lag_limit=env.float('MONITOR_LAG_LIMIT', 0.5),
+            tasks_limit=env.int('MONITOR_TASKS_LIMIT', 2000),
+            alert_cooldown=env.float('MONITOR_ALERT_COOLDOWN', 900.0)
+            ),
+        send_queue=SendQueueConfig(
+            global_rate=env.float('SEND_GLOBAL_RATE', 25.0),
+            global_burst=env.float('SEND_GLOBAL_BURST', 30.0),
+            chat_rate=env.float('SEND_CHAT_RATE', 1.0),
+            group_rate=env.float('SEND_GROUP_RATE', 0.33),
+            chat_burst=env.float('SEND_CHAT_BURST', 5.0),
+            max_retries=env.int('SEND_MAX_RETRIES', 3),
+            workers=env.int('SEND_WORKERS', 4)
+            ),
+        outbox=OutboxConfig(
+            db_path=env.str('OUTBOX_DB', 'outbox.db'),
+            batch_size=env.int('OUTBOX_BATCH_SIZE', 20),
+            max_attempts=env.int('OUTBOX_MAX_ATTEMPTS', 5),
+            retry_base=env.float('OUTBOX_RETRY_BASE', 5.0),
+            retry_cap=env.float('OUTBOX_RETRY_CAP', 600.0),
+            poll_interval=env.float('OUTBOX_POLL_INTERVAL', 30.0)
+            ),
+        transcription=TranscriptionConfig(
+            backend=env.str('STT_BACKEND', 'openai'),
+            local_model=env.str('STT_LOCAL_MODEL', 'small'),
+            local_compute_type=env.str('STT_LOCAL_COMPUTE_TYPE', 'int8'),
+            local_workers=env.int('STT_LOCAL_WORKERS', 0),
+            local_beam_size=env.int('STT_LOCAL_BEAM_SIZE', 1),
+            local_max_seconds=env.int('STT_LOCAL_MAX_SECONDS', 60)
+            ),
+        router=RouterConfig(
+            enabled=env.bool('ROUTER_ENABLED', True),
+            small_model=env.str('ROUTER_SMALL_MODEL', 'gpt-4o-mini'),
+            small_tokens=env.json('ROUTER_SMALL_TOKENS', {"fix": 400, "rephrase": 120}),
+            latency_targets=env.json('ROUTER_LATENCY_TARGETS', {"fix": 8.0, "rephrase": 12.0}),
+            output_ratio=env.json('ROUTER_OUTPUT_RATIO', {"fix": 1.5, "rephrase": 1.5, "fix_edits": 0.5}),
+            output_margin=env.int('ROUTER_OUTPUT_MARGIN', 200),
+            max_output=env.int('ROUTER_MAX_OUTPUT', 16384)
+            ),
+        speculation=SpeculationConfig(
+            enabled=env.bool('SPEC_ENABLED', False),
+            operations=env.list('SPEC_OPERATIONS', ['fix']),
+            user_budget=env.int('SPEC_USER_BUDGET', 30),
+            max_concurrent=env.int('SPEC_MAX_CONCURRENT', 2),
+            min_chars=env.int('SPEC_MIN_CHARS', 20)
+            ),
+        memory_limit=env.float('MEMORY_LIMIT', 450.0),
+        channels_ttl=env.float('CHANNELS_TTL', 3600.0),
+        editor_ui=env.str('EDITOR_UI', 'reply')
         )
+
+
+# Функция повторного чтения списка администраторов из файла окружения
+def load_admin_list(path: str | None = None) -> list[int]:
+    """Перечитывает ADMIN_LIST из .env (значение из файла важнее прежнего), чтобы сменить админов без перезапуска"""
+    env = Env()
+    env.read_env(path, override=True)
+    return [int(admin) for admin in env('ADMIN_LIST').split(',')]
@@ -0,0 +1,20 @@
+import logging
+
+# Инициализируем логгер модуля
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.info("Загружен модуль: %s", __name__)
+
+from aiogram.filters import BaseFilter
+from aiogram.types import TelegramObject
+
+class EditorUiFilter(BaseFilter):
+    """
+    Фильтр по режиму интерфейса редактора (EDITOR_UI): reply или inline.
+    Режим берется из workflow_data диспетчера (editor_ui).
+    """
+    def __init__(self, mode: str):
+        self.mode = mode
+
+    async def __call__(self, event: TelegramObject, editor_ui: str = "reply") -> bool:
+        return editor_ui == self.mode
@@ -28,5 +28,12 @@ class IsAdminListFilter(BaseFilter):
         self.is_admin = is_admin
 
     async def __call__(self, message: Message, bot: Bot) -> bool:
-        # Проверяем, находится ли ID пользователя, отправившего сообщение, в списке администраторов
-        return (message.from_user.id in bot.admin_list) & self.is_admin
+        # Проверяем, находится ли ID пользователя, отправившего сообщение, в множестве администраторов
+        return (message.from_user.id in bot.admin_list) == self.is_admin
+
+class IsOwnerFilter(BaseFilter):
+    """
+    Фильтр, проверяющий, что сообщение от владельца бота (владелец может не входить в список администраторов)
+    """
+    async def __call__(self, message: Message, bot: Bot) -> bool:
+        return message.from_user.id in bot.owner
@@ -7,7 +7,7 @@ logger.info("Загружен модуль: %s", __name__)
 
 import psutil
 from datetime import datetime
-from pathlib import Path
+from html import escape
 
 from aiogram import Router, F, Bot
 from aiogram.filters import Command, CommandStart, CommandObject
@@ -15,53 +15,88 @@ from aiogram.types import Message, FSInputFile
 from aiogram.fsm.context import FSMContext
 
 
-from filters.is_admin import IsAdminListFilter
+from filters.is_admin import IsAdminListFilter, IsOwnerFilter
 from filters.chat_type import ChatTypeFilter
 from common import keyboard
-
-
-
-admin_router = Router()
+from common.cache import ResultCache, TranscriptCache
+from common.voice_buffer import VoiceBuffers
+from common.scheduler import RequestScheduler
+from common.gpt_client import get_caller
+from common.metrics import REGISTRY
+from common.resource_monitor import ResourceMonitor
+from common.send_queue import SendQueue
+from common.publish_outbox import PublishOutbox
+from common.speculation import Speculator
+from common.draft import DraftStore
+from middlewares.lanes import UpdateLanesMiddleware
+from middlewares.access import AccessMiddleware
+from config_data.config import load_admin_list
+
+
+
+admin_router = Router(name="admin")
 admin_router.message.filter(ChatTypeFilter(["private", "group", "supergroup","channel"]), IsAdminListFilter(is_admin=True))
 
+# Команды владельца: подключается раньше admin_router, владелец может не входить в ADMIN_LIST
+owner_router = Router(name="owner")
+owner_router.message.filter(IsOwnerFilter())
+
 
 # команда /help
 @admin_router.message(Command("help"))
-async def cmd_help(message: Message, bot: Bot):
+async def cmd_help(message: Message, bot: Bot, send_queue: SendQueue):
     if message.from_user.id in bot.admin_list:
-        await message.answer(text=('Доступные команды:\n\n'
+        send_queue.submit(message.answer(text=('Доступные команды:\n\n'
                                     '/start - перезапустить бота\n'
                                     '/status - статус бота\n'
                                     '/data - состояние FSMContext\n'
                                     '/get_id - id диалога\n'
                                     '/ping - количество апдейтов\n'
+                                    '/metrics - время работы хендлеров и внешних вызовов\n'
+                                    '/reload_admins - перечитать список админов из .env (владелец)\n'
                                     '/info - инструкция'),
                             reply_markup=keyboard.del_kb
-                            )
+                            ))
 
 
 # хендлер, покажет содержимое data пользователя
 @admin_router.message(Command("data"))
-async def data_cmd(message: Message, state: FSMContext):
+async def data_cmd(message: Message, state: FSMContext, send_queue: SendQueue):
     data = await state.get_data()
-    await message.answer(str(data))
+    send_queue.submit(message.answer(str(data)))
+
+# хендлер /reload_admins - перечитывает список администраторов без перезапуска бота
+@owner_router.message(Command("reload_admins"))
+async def cmd_reload_admins(message: Message, bot: Bot, send_queue: SendQueue):
+    try:
+        bot.admin_list = frozenset(load_admin_list())
+    except Exception as e:
+        send_queue.submit(message.answer(f"Не удалось перечитать список админов: {escape(str(e))}"))
+        return
+    logger.info("Список администраторов перечитан: %s", len(bot.admin_list))
+    send_queue.submit(message.answer(f"✅ Администраторов: {len(bot.admin_list)}"))
+
+# /reload_admins от администратора, который не владелец, - не даем команде попасть в черновик
+@admin_router.message(Command("reload_admins"))
+async def cmd_reload_admins_denied(message: Message, send_queue: SendQueue):
+    send_queue.submit(message.answer("Команда доступна только владельцу"))
 
 # Here is some example !ping command ...
 @admin_router.message(Command(commands=["ping"]),)
-async def cmd_ping_bot(message: Message, counter):
-    await message.answer(f"ping-{counter}")
+async def cmd_ping_bot(message: Message, counter, send_queue: SendQueue):
+    send_queue.submit(message.answer(f"ping-{counter}"))
 
 
 # Этот хендлер показывает ID чата в котором запущена команда
 @admin_router.message(Command("get_id"))
-async def get_chat_id_cmd(message: Message):
-    await message.answer(f"ID: <code>{message.chat.id}</code>")
+async def get_chat_id_cmd(message: Message, send_queue: SendQueue):
+    send_queue.submit(message.answer(f"ID: <code>{message.chat.id}</code>"))
 
 # хендлер /info
 @admin_router.message(Command("info"))
-async def cmd_info(message: Message):
+async def cmd_info(message: Message, send_queue: SendQueue):
     # photo = FSInputFile("common/images/image_info.jpg")
-    await message.answer(text=('Инструкция по использованию:\n\n'
+    send_queue.submit(message.answer(text=('Инструкция по использованию:\n\n'
                                 '1) Бот всегда в режиме ожидания\n'
                                 '2) Боту можно отправить текстовое сообщение, либо войс\n'
                                 '3) После бот выведет кнопки с доступными командами\n\n'
@@ -71,15 +106,33 @@ async def cmd_info(message: Message):
                                 '🔄 Переформулировать\n<i>Бот переформулирует последний полученый текст, и выведет результат</i>\n\n'
                                 'ℹ️ Поправить текст\n<i>Бот исправит грамматику последнего полученного текста</i>\n\n'
                                 '❌ Отменить\n<i>Бот очистит память, перейдет в состояние ожидания</i>\n\n'
-                                '✅ Отправить\n<i>Бот отправить текст в группу с временной меткой в конце</i>'))
+                                '✅ Отправить\n<i>Бот отправить текст в группу с временной меткой в конце</i>')))
 
 @admin_router.message(Command("status"))
-async def cmd_status(message: Message):
+async def cmd_status(message: Message, text_cache: ResultCache, voice_cache: TranscriptCache,
+                     voice_buffers: VoiceBuffers, scheduler: RequestScheduler, resource_monitor: ResourceMonitor,
+                     send_queue: SendQueue, outbox: PublishOutbox, speculator: Speculator, drafts: DraftStore,
+                     lanes: UpdateLanesMiddleware, access: AccessMiddleware):
     """Показывает текущее состояние бота"""
     try:
         process = psutil.Process()
-        memory = process.memory_info().rss / 1024 / 1024
-        cpu = process.cpu_percent()
+
+        # Тренды ресурсов за последний час из фонового мониторинга: мин / сред / макс
+        trends = resource_monitor.trends()
+        if trends:
+            def trend(name: str, fmt: str) -> str:
+                low, avg, high = trends[name]
+                return f"{low:{fmt}} / {avg:{fmt}} / {high:{fmt}}"
+            resources = (
+                f"🔸 Ресурсы за час (мин / сред / макс, {len(resource_monitor.samples)} замеров):\n"
+                f"    память {trend('rss_mb', '.1f')} MB\n"
+                f"    CPU {trend('cpu', '.1f')} %\n"
+                f"    дескрипторы {trend('fds', '.0f')}\n"
+                f"    задержка цикла {trend('loop_lag', '.3f')} сек\n"
+                f"    задачи asyncio {trend('tasks', '.0f')}\n"
+            )
+        else:
+            resources = f"🔸 Память: {process.memory_info().rss / 1024 / 1024:.1f}MB (замеров еще нет)\n"
 
         # Форматируем uptime в дни, часы, минуты и секунды
         uptime = datetime.now() - datetime.fromtimestamp(process.create_time())
@@ -88,13 +141,71 @@ async def cmd_status(message: Message):
         minutes, seconds = divmod(remainder, 60)
         formatted_uptime = f"{days}d {hours:02}:{minutes:02}:{seconds:02}"
 
+        cache_stats = text_cache.stats()
+        voice_stats = voice_cache.stats()
+        buffer_stats = voice_buffers.stats()
+        sched_stats = scheduler.stats()
+        outbox_stats = await outbox.stats()
+        spec_stats = speculator.stats()
+        speculation = (f"{spec_stats['hits']} попаданий / {spec_stats['misses']} промахов ({spec_stats['hit_rate']:.0f}%), "
+                       f"запущено {spec_stats['started']}, отменено {spec_stats['cancelled']}, "
+                       f"не понадобилось {spec_stats['wasted']}, пропущено {spec_stats['skipped']}"
+                       if spec_stats['enabled'] else "выключена")
+        draft_stats = drafts.stats()
+        lane_stats = lanes.stats()
+        access_stats = access.stats()
+        breakers = get_caller().stats()['breakers']
+        breakers_line = ", ".join(f"{model}: {state}" for model, state in breakers.items()) or "нет запросов"
+
         status = (
             f"📊 Статус бота:\n\n"
-            f"🔸 Память: {memory:.1f}MB\n"
-            f"🔸 CPU: {cpu}%\n"
+            f"{resources}"
             f"🔸 Аптайм: {formatted_uptime}\n"
-            f"🔸 Временных файлов: {len(list(Path('temp_voice').glob('*.ogg')))}"
+            f"🔸 Голосовых в обработке: {buffer_stats['in_flight_count']} "
+            f"({buffer_stats['in_flight_bytes'] / 1024:.0f}KB в буферах)\n"
+            f"🔸 Кэш GPT: {cache_stats['hits']} попаданий (с диска {cache_stats['disk_hits']}) / "
+            f"{cache_stats['misses']} промахов ({cache_stats['hit_rate']:.0f}%), "
+            f"{cache_stats['entries']} записей, {cache_stats['bytes'] / 1024:.0f}KB\n"
+            f"🔸 Кэш голосовых: {voice_stats['hits']} попаданий / {voice_stats['misses']} промахов, "
+            f"{voice_stats['entries']} записей, сэкономлено {voice_stats['saved_seconds']} сек аудио\n"
+            f"🔸 Очередь GPT: {sched_stats['running']} выполняется, {sched_stats['queued']} ждут, "
+            f"ожидание {sched_stats['avg_wait']:.1f}/{sched_stats['max_wait']:.1f} сек (сред/макс), "
+            f"отклонено {sched_stats['rejected']}, отменено {sched_stats['cancelled']}\n"
+            f"🔸 Публикации: {outbox_stats['pending']} в очереди, {outbox_stats['scheduled']} запланировано, "
+            f"{outbox_stats['failed']} не удалось\n"
+            f"🔸 Отброшено апдейтов: посторонние {access_stats['stranger']}, флуд {access_stats['throttled']}\n"
+            f"🔸 Очереди апдейтов: {lane_stats['lanes']} пользователей, {lane_stats['pending']} апдейтов, "
+            f"вне очереди {lane_stats['bypassed']}, пропущено {lane_stats['dropped']}\n"
+            f"🔸 Упреждающая обработка: {speculation}\n"
+            f"🔸 Черновики: {draft_stats['drafts']}, ревизий {draft_stats['revisions']} "
+            f"({draft_stats['history_bytes'] / 1024:.0f}KB), записано {draft_stats['bytes_written'] / 1024:.0f}KB, "
+            f"сворачиваний {draft_stats['compactions']}, вытеснено {draft_stats['evicted']}\n"
+            f"🔸 Модели: {breakers_line}"
         )
-        await message.answer(status)
+        send_queue.submit(message.answer(status))
     except Exception as e:
-        await message.answer(f"Ошибка получения статуса: {e}")
+        send_queue.submit(message.answer(f"Ошибка получения статуса: {escape(str(e))}"))
+
+
+# хендлер /metrics - сводка по времени работы хендлеров и внешних вызовов
+@admin_router.message(Command("metrics"))
+async def cmd_metrics(message: Message, send_queue: SendQueue):
+    lines = ["📈 Хендлеры (вызовы, среднее / p95, ошибки):\n"]
+    errors = REGISTRY.counters.get("bot_handler_errors_total", {})
+    handlers = sorted(REGISTRY.histograms.get("bot_handler_seconds", {}).items(),
+                      key=lambda item: item[1].sum, reverse=True)
+    for labels, histogram in handlers:
+        name = "{router}/{handler}".format(**dict(labels))
+        lines.append(f"🔸 {name}: {histogram.count}, "
+                     f"{histogram.sum / histogram.count:.2f} / {histogram.quantile(0.95):.2f} сек, "
+                     f"ошибок {int(errors.get(labels, 0))}")
+
+    lines.append("\n🌐 Внешние вызовы (вызовы, среднее / p95):\n")
+    calls = sorted(REGISTRY.histograms.get("bot_external_seconds", {}).items(),
+                   key=lambda item: item[1].sum, reverse=True)
+    for labels, histogram in calls[:15]:
+        name = " ".join(value for _, value in labels)
+        lines.append(f"🔸 {name}: {histogram.count}, "
+                     f"{histogram.sum / histogram.count:.2f} / {histogram.quantile(0.95):.2f} сек")
+
+    send_queue.submit(message.answer("\n".join(lines)))
@@ -7,22 +7,37 @@ logger.info("Загружен модуль: %s", __name__)
 
 import asyncio
 from datetime import datetime, timedelta
-from pathlib import Path
+from html import escape
+from typing import Awaitable, Callable
 from aiogram import Router, F, Bot
 from aiogram.filters import StateFilter, or_f
-from aiogram.types import Message, InlineKeyboardButton, CallbackQuery
-from aiogram.utils.keyboard import InlineKeyboardBuilder
+from aiogram.types import Message, CallbackQuery, Voice, InlineKeyboardMarkup
+from aiogram.methods import SendMessage, EditMessageText
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
-from openai import OpenAI
 from filters.is_admin import IsAdminListFilter
 from filters.chat_type import ChatTypeFilter
+from filters.editor_ui import EditorUiFilter
 from common import keyboard
-from config_data.config import load_config
-
-
-editor_router = Router()
+from common.llm_resilience import LLMError
+from common.editing_engine import get_engine
+from common.metrics import REGISTRY
+from common.stream_editor import MessageStreamer
+from common.cache import ResultCache, TranscriptCache
+from common.voice_buffer import VoiceBuffers
+from common.scheduler import RequestScheduler, RequestCancelled, SchedulerBusy
+from common.send_queue import SendQueue, MESSAGE_LIMIT
+from common.text_edits import render_diff
+from common.channels import ChannelRegistry
+from common.publish_outbox import PublishOutbox
+from common.transcription import Transcriber
+from common.speculation import Speculator
+from common.draft import DraftStore
+from config_data.config import GptConfig
+
+
+editor_router = Router(name="editor")
 editor_router.message.filter(ChatTypeFilter(["private"]), IsAdminListFilter(is_admin=True))
 
 # Определяем класс состояния Editor
@@ -31,325 +46,615 @@ class Editor(StatesGroup):
     editor_wait_command = State()
     editor_wait_text = State()
     editor_wait_channel = State()
-# Получаем API ключ для работы с OpenAI
-API_GPT = load_config().tg_bot.api_gpt
+    editor_wait_publish_time = State()
 
-# Инициализируем клиент OpenAI
-client = OpenAI(api_key=API_GPT)
 
+# Названия команд в истории правок черновика
+DRAFT_LABELS = {"add": "добавление текста", "merge": "объединение", "fix": "исправление", "rephrase": "переформулирование"}
 
-# Функция очистки старых файлов
-async def cleanup_temp_files():
-    """Удаляет временные файлы старше 1 часа"""
-    try:
-        voice_dir = Path("temp_voice")
-        if not voice_dir.exists():
-            return
+# Модель распознавания голосовых в API и язык
+WHISPER_MODEL = "whisper-1"
+WHISPER_LANGUAGE = "ru"
 
-        current_time = datetime.now()
-        for file in voice_dir.glob("*.ogg"):
-            file_time = datetime.fromtimestamp(file.stat().st_mtime)
-            if current_time - file_time > timedelta(hours=1):
-                file.unlink(missing_ok=True)
-                logger.info("Удален старый временный файл: %s", file)
-    except Exception as e:
-        logger.error("Ошибка при очистке временных файлов: %s", e)
+# Функция исправления грамматики и пунктуации текста
+async def fix_text_style(text: str, on_partial: Callable[[str], Awaitable[None]] | None = None,
+                         cache: ResultCache | None = None) -> str:
+    """Функция исправления грамматики и пунктуации текста"""
+    return await get_engine().run("fix", text, on_partial, cache)
 
 
-# Функция исправления грамматики и пунктуации текста через GPT
-async def fix_text_style(text: str) -> str:
-    """Функция исправления грамматики и пунктуации текста через GPT"""
-    try:
-        system_prompt = """Ты опытный редактор текста. Твоя задача:
-                            1. Исправить грамматические и пунктуационные ошибки
-                            2. Обеспечить правильное написание заглавных букв (начало предложений, имена собственные)
-                            3. Расставить корректные знаки препинания
-                            4. НЕ менять порядок слов и смысл текста
-                            5. НЕ добавлять новую информацию
-                            6. НЕ писать ни чего от себя
-                            7. Сохранить исходный стиль автора"""
-
-        response = await asyncio.to_thread(
-            client.chat.completions.create,
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"Исправь этот текст:\n\n{text}"}]
-            )
-
-        content = response.choices[0].message.content
-        if content is None:
-            raise ValueError("GPT вернул пустой ответ")
-        return content
-
-    except Exception as e:
-        logger.error("Ошибка при обработке текста в GPT: %s", str(e))
-        return f"Ошибка обработки текста: {str(e)}"
-
-
-# Функция переформулирования текста через GPT
-async def rephrase_text(text: str) -> str:
+# Функция переформулирования текста
+async def rephrase_text(text: str, on_partial: Callable[[str], Awaitable[None]] | None = None,
+                        cache: ResultCache | None = None) -> str:
     """Переформулирует текст, делая его более лаконичным и литературным."""
+    return await get_engine().run("rephrase", text, on_partial, cache)
+
+
+# Функция распознавания голосового сообщения (API Whisper или локальная модель)
+async def transcribe_voice(bot: Bot, voice: Voice, voice_buffers: VoiceBuffers, transcriber: Transcriber,
+                           voice_cache: TranscriptCache | None = None) -> str:
+    """Скачивает и распознает голосовое. Повторное голосовое (тот же file_unique_id) берется из кэша"""
+    # Бэкенд выбираем по длительности: короткие голосовые можно распознать локально
+    backend = transcriber.select(voice.duration)
+
+    if voice_cache is not None:
+        # Расшифровка любой моделью подходит - сначала ищем от выбранной, затем от API
+        keys = [TranscriptCache.make_voice_key(voice.file_unique_id, WHISPER_LANGUAGE, model)
+                for model in dict.fromkeys((backend.model, transcriber.remote.model))]
+        cached = await voice_cache.get_voice(keys, voice.duration)
+        if cached is not None:
+            logger.info("Расшифровка голосового взята из кэша: %s сек аудио", voice.duration)
+            return cached
+
+    # Получаем файл голосового сообщения
+    voice_file = await bot.get_file(voice.file_id)
+
+    if not voice_file.file_path:
+        raise ValueError("Не удалось получить путь к файлу голосового сообщения")
+
+    # Скачиваем файл в буфер в памяти и сразу отдаем его на распознавание, без записи на диск
+    with voice_buffers.open(voice.file_size) as buffer:
+        async with REGISTRY.timer("download"):
+            await bot.download_file(voice_file.file_path, buffer)
+        logger.info("Скачано голосовое сообщение: %s байт, %s сек, распознаем: %s",
+                    voice.file_size, voice.duration, backend.name)
+
+        text, used = await transcriber.transcribe(backend, buffer, WHISPER_LANGUAGE, size=voice.file_size or 0)
+
+    if voice_cache is not None:
+        await voice_cache.set(TranscriptCache.make_voice_key(voice.file_unique_id, WHISPER_LANGUAGE, used.model), text)
+    return text
+
+
+# Функция ожидания сообщения, отправленного через очередь
+async def sent_message(future: asyncio.Future) -> Message | None:
+    """Дожидается отправки сообщения из очереди. None - отправить не удалось (флуд-контроль, остановка очереди)"""
+    await asyncio.wait({future})
+    if future.cancelled() or future.exception() is not None:
+        return None
+    return future.result()
+
+
+# Функция вывода в сообщение-черновик (EDITOR_UI=inline)
+async def show_panel(state: FSMContext, send_queue: SendQueue, chat_id: int, text: str,
+                     reply_markup: InlineKeyboardMarkup | None = None, new: bool = False) -> None:
+    """
+    Правит сообщение-черновик сессии на месте: один запрос к API, ответа не ждем.
+    new=True или черновика еще нет - отправляет новое сообщение и запоминает его id в FSM.
+    """
+    panel = None if new else (await state.get_data()).get('panel')
+    if panel is None:
+        sent = await send_queue.submit(SendMessage(chat_id=chat_id, text=text, reply_markup=reply_markup), exclusive=True)
+        await state.update_data(panel=sent.message_id)
+    else:
+        send_queue.submit(EditMessageText(chat_id=chat_id, message_id=panel, text=text, reply_markup=reply_markup))
+
+
+# Функция обработки последнего фрагмента черновика операцией GPT (исправление или переформулирование)
+async def apply_to_last_fragment(message: Message, state: FSMContext, drafts: DraftStore,
+                                 operation: Callable[..., Awaitable[str]],
+                                 processing_text: str, header: str,
+                                 gpt_config: GptConfig, text_cache: ResultCache,
+                                 scheduler: RequestScheduler, send_queue: SendQueue,
+                                 show_diff: bool = False,
+                                 speculator: Speculator | None = None, operation_name: str | None = None,
+                                 panel: Message | None = None, user_id: int | None = None) -> None:
+    """
+    Запускает операцию через планировщик, выводит результат и заменяет им последний фрагмент
+    (прежняя версия остается в истории черновика). show_diff=True - дополнительно показывает подсвеченные правки.
+    Если операция operation_name уже посчитана заранее (speculator), берет готовый результат.
+    panel - сообщение-черновик (EDITOR_UI=inline): весь вывод идет правкой этого сообщения, user_id - чей черновик.
+    """
+    user_id = user_id or message.from_user.id
+
+    # Получаем последний фрагмент (запоминаем его id - пока идет запрос, черновик могут изменить)
+    draft = await drafts.get(user_id)
+    if draft.last is None:
+        if panel:
+            send_queue.submit(panel.edit_text("Черновик пуст.\n\nОжидаю текст, или войс."))
+        else:
+            send_queue.submit(message.answer("Черновик пуст.\n\nОжидаю текст, или войс.", reply_markup=keyboard.del_kb))
+        await state.set_state(Editor.editor_wait_text)
+        return
+    text, fragment_id = draft.last, draft.last_id
+
+    # Сообщение о начале обработки (ждем доставки - его будем править).
+    # В inline режиме о начале сообщает ответ на нажатие кнопки, а править будем сам черновик
+    if panel:
+        processing_msg = panel
+    else:
+        processing_msg = await send_queue.submit(message.answer(processing_text), exclusive=True)
+
+    # В потоковом режиме ответ выводится прямо в сообщение о обработке
+    streamer = None
+    if gpt_config.stream:
+        streamer = MessageStreamer(processing_msg, header, send_queue, interval=gpt_config.stream_edit_interval)
+
+    async def compute() -> str:
+        # Готовый или выполняющийся упреждающий результат для этого же текста
+        speculative = speculator.take(user_id, operation_name, text) if speculator else None
+        if speculative is not None:
+            try:
+                return await speculative
+            except (LLMError, SchedulerBusy) as e:
+                logger.warning("Упреждающий запрос %s не удался, повторяем: %s", operation_name, e)
+        return await operation(text, on_partial=streamer.push if streamer else None, cache=text_cache)
+
     try:
-        system_prompt = """Ты опытный литературный редактор. Твоя задача:
-                            1. Переформулировать текст, сделав его более лаконичным и литературным
-                            2. Улучшить стиль изложения, сохраняя естественность речи
-                            3. Исправить грамматические и пунктуационные ошибки
-                            4. Сохранить основной смысл, идею и посыл текста
-                            5. НЕ добавлять новую информацию или факты
-                            6. НЕ менять эмоциональный окрас текста
-                            7. НЕ писать ни чего от себя"""
-
-        response = await asyncio.to_thread(
-            client.chat.completions.create,
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"Переформулируй этот текст:\n\n{text}"}
-            ]
-        )
-
-        content = response.choices[0].message.content
-        if content is None:
-            raise ValueError("GPT вернул пустой ответ")
-        return content
-
-    except Exception as e:
-        logger.error("Ошибка при обработке текста в GPT: %s", str(e))
-        return f"Ошибка обработки текста: {str(e)}"
-
-
-@editor_router.message(Editor.editor_wait_command, F.text)
-async def editor_wait_command(message: Message, state: FSMContext, chanel_dict: dict):
-    # Очищаем старые временные файлы
-    await cleanup_temp_files()
+        result = await scheduler.run(user_id, compute)
+    except RequestCancelled:
+        # Пользователь нажал "❌ Отменить" - черновик уже очищен (панель правит хендлер отмены)
+        if streamer:
+            await streamer.cancel()
+        if not panel:
+            send_queue.submit(processing_msg.delete())
+        return
+    except SchedulerBusy:
+        send_queue.submit(processing_msg.edit_text("⏳ Слишком много запросов, попробуйте чуть позже",
+                                                   reply_markup=keyboard.EDITOR_KB if panel else None))
+        return
+    except LLMError as e:
+        # Ошибку показываем, но черновик не трогаем
+        if streamer:
+            await streamer.cancel()
+        send_queue.submit(processing_msg.edit_text(f"⚠️ {escape(str(e))}\n\nЧерновик не изменен.",
+                                                   reply_markup=keyboard.EDITOR_KB if panel else None))
+        if not panel:
+            send_queue.submit(message.answer("Ожидаю команду ⬇️", reply_markup=keyboard.work_keyboard()))
+        return
+
+    # Заменяем фрагмент новой версией (фрагмент изменился - упреждающие результаты для него больше не нужны)
+    if speculator:
+        speculator.discard(user_id)
+    draft = await drafts.get(user_id)
+    if not draft.replace(fragment_id, result, operation_name or "edit"):
+        if streamer:
+            await streamer.cancel()
+        send_queue.submit(processing_msg.edit_text("⚠️ Черновик изменился, пока шел запрос. Результат не применен.",
+                                                   reply_markup=keyboard.EDITOR_KB if panel else None))
+        return
+    await drafts.save(user_id, draft)
+
+    # Подсветка правок (если не влезает в сообщение - не показываем)
+    changes = None
+    if show_diff:
+        diff = render_diff(text, result)
+        changes = f"✏️ Изменения:\n\n{diff}" if diff else "✏️ Ошибок не найдено"
+        if len(changes) > MESSAGE_LIMIT:
+            changes = None
+
+    if panel:
+        # Итог, правки и кнопки - одной правкой панели (потоковые правки к этому моменту остановлены)
+        if streamer:
+            await streamer.cancel()
+        body = f"{header}\n\n<code>{escape(result)}</code>"
+        if changes and len(body) + len(changes) + 2 <= MESSAGE_LIMIT:
+            body += f"\n\n{changes}"
+        send_queue.submit(panel.edit_text(body, reply_markup=keyboard.EDITOR_KB))
+
+    elif streamer and await streamer.finish(result):
+        if changes:
+            send_queue.submit(message.answer(changes))
+        send_queue.submit(message.answer("Ожидаю команду ⬇️", reply_markup=keyboard.work_keyboard()))
+    else:
+        # Удаляем сообщение о обработке
+        send_queue.submit(processing_msg.delete())
+
+        # Отправляем результат (очередь склеит его с правками и приглашением в одно сообщение)
+        send_queue.submit(message.answer(f"{header}\n\n<code>{escape(result)}</code>", reply_markup=keyboard.work_keyboard()))
+        if changes:
+            send_queue.submit(message.answer(changes))
+        send_queue.submit(message.answer("Ожидаю команду ⬇️"))
 
+
+@editor_router.message(Editor.editor_wait_command, F.text, EditorUiFilter("reply"))
+async def editor_wait_command(message: Message, state: FSMContext, channels: ChannelRegistry, gpt_config: GptConfig,
+                              text_cache: ResultCache, scheduler: RequestScheduler, send_queue: SendQueue,
+                              speculator: Speculator, drafts: DraftStore):
     if message.text == "↗️ Добавить":
-        await message.answer("Ожидаю текст, или войс.", reply_markup=keyboard.del_kb)
+        send_queue.submit(message.answer("Ожидаю текст, или войс.", reply_markup=keyboard.del_kb))
         await state.set_state(Editor.editor_wait_text)
 
     elif message.text == "⏺️ Объединить":
-        data = await state.get_data()
-        list_text = data.get('text',[])
-        text = '\n'.join(list_text)
-        await state.update_data(text=[text])
-        await message.answer(f"⏺️ Объединенный текст:\n\n<code>{text}</code>", reply_markup=keyboard.work_keyboard())
+        draft = await drafts.get(message.from_user.id)
+        if draft.merge():
+            await drafts.save(message.from_user.id, draft)
+        text = draft.last or ""
+        speculator.speculate(message.from_user.id, text)
+        send_queue.submit(message.answer(f"⏺️ Объединенный текст:\n\n<code>{escape(text)}</code>", reply_markup=keyboard.work_keyboard()))
         await state.set_state(Editor.editor_wait_command)
-        await asyncio.sleep(1)
-        await message.answer("Ожидаю команду ⬇️")
+        send_queue.submit(message.answer("Ожидаю команду ⬇️"))
 
     elif message.text == "🔄 Переформулировать 🔄":
         try:
-            # Получаем текущий текст
-            data = await state.get_data()
-            list_text = data.get('text', [])
-            text = list_text[-1]
-
-            # Отправляем сообщение о начале обработки
-            processing_msg = await message.answer("⌛️ Переформулирую текст...")
-
-            # Переформулируем текст
-            rephrased_text = await rephrase_text(text)
-
-            # Обновляем данные
-            list_text[-1] = rephrased_text
-            await state.update_data(text=list_text)
-
-            # Удаляем сообщение о обработке
-            await processing_msg.delete()
-
-            # Отправляем переформулированный текст
-            await message.answer(f"🔄 Переформулированный текст:\n\n<code>{rephrased_text}</code>",
-                                 reply_markup=keyboard.work_keyboard())
-            await asyncio.sleep(1)
-            await message.answer("Ожидаю команду ⬇️")
+            await apply_to_last_fragment(message, state, drafts, rephrase_text,
+                                         "⌛️ Переформулирую текст...", "🔄 Переформулированный текст:",
+                                         gpt_config, text_cache, scheduler, send_queue,
+                                         speculator=speculator, operation_name="rephrase")
 
         except Exception as e:
-            await message.answer(f"Ошибка при обработке текста: {str(e)}",
-                                 reply_markup=keyboard.work_keyboard())
+            send_queue.submit(message.answer(f"Ошибка при обработке текста: {escape(str(e))}",
+                                             reply_markup=keyboard.work_keyboard()))
 
     elif message.text == "ℹ️ Поправить текст ℹ️":
         try:
-            # Получаем текущий текст
-            data = await state.get_data()
-            list_text = data.get('text', [])
-            text = list_text[-1]
-
-            # Отправляем сообщение о начале обработки
-            processing_msg = await message.answer("⌛️ Обрабатываю текст...")
+            await apply_to_last_fragment(message, state, drafts, fix_text_style,
+                                         "⌛️ Обрабатываю текст...", "ℹ️ Исправленный текст:",
+                                         gpt_config, text_cache, scheduler, send_queue, show_diff=True,
+                                         speculator=speculator, operation_name="fix")
 
-            # Исправляем текст
-            fixed_text = await fix_text_style(text)
+        except Exception as e:
+            send_queue.submit(message.answer(f"Ошибка при обработке текста: {escape(str(e))}",
+                                             reply_markup=keyboard.work_keyboard()))
+
+    elif message.text in ("↩️ Назад", "↪️ Вперед"):
+        # Шаг по истории правок черновика
+        draft = await drafts.get(message.from_user.id)
+        undo = message.text == "↩️ Назад"
+        label = draft.undo() if undo else draft.redo()
+        if label is None:
+            send_queue.submit(message.answer("Отменять нечего" if undo else "Возвращать нечего",
+                                             reply_markup=keyboard.work_keyboard()))
+            return
+        await drafts.save(message.from_user.id, draft)
+        action = f"{'↩️ Отменено' if undo else '↪️ Возвращено'}: {DRAFT_LABELS.get(label, label)}"
+
+        if draft.last is None:
+            speculator.discard(message.from_user.id)
+            send_queue.submit(message.answer(f"{action}\n\nЧерновик пуст.", reply_markup=keyboard.del_kb))
+            await state.set_state(Editor.editor_wait_text)
+            send_queue.submit(message.answer("Ожидаю текст, или войс."))
+            return
+        speculator.speculate(message.from_user.id, draft.last)
+        text = '\n'.join(draft.fragments)
+        send_queue.submit(message.answer(f"{action}\n\n<code>{escape(text)}</code>", reply_markup=keyboard.work_keyboard()))
+        send_queue.submit(message.answer("Ожидаю команду ⬇️"))
 
-            # Обновляем данные
-            list_text[-1] = fixed_text
-            await state.update_data(text=list_text)
+    elif message.text == "❌ Отменить":
+        # Отменяем запросы к GPT, которые еще ждут очереди или выполняются
+        scheduler.cancel(message.from_user.id)
+        speculator.discard(message.from_user.id)
+        await drafts.clear(message.from_user.id)
+        send_queue.submit(message.answer("❌ Действия отменены", reply_markup=keyboard.del_kb))
+        await state.clear()
+        send_queue.submit(message.answer("Ожидаю текст, или войс."))
 
-            # Удаляем сообщение о обработке
-            await processing_msg.delete()
+    elif message.text == "✅ Отправить":
+        send_queue.submit(message.answer('Выберите каналы для отправки', reply_markup=keyboard.del_kb))
+        await state.update_data(channels=[])
+        send_queue.submit(message.answer('Доступные каналы:', reply_markup=keyboard.channels_keyboard(channels.names, [])))
+        await state.set_state(Editor.editor_wait_channel)
 
-            # Отправляем исправленный текст
-            await message.answer(f"ℹ️ Исправленный текст:\n\n<code>{fixed_text}</code>",
-                                 reply_markup=keyboard.work_keyboard())
-            await asyncio.sleep(1)
-            await message.answer("Ожидаю команду ⬇️")
+    else:
+        send_queue.submit(message.answer("Неизвестная команда.\nНажми на кнопку ⬇️", reply_markup=keyboard.work_keyboard()))
+
+
+# Кнопки сообщения-черновика (EDITOR_UI=inline): каждое нажатие правит это же сообщение
+@editor_router.callback_query(Editor.editor_wait_command, F.data.startswith("ed_"))
+async def editor_panel(callback: CallbackQuery, state: FSMContext, channels: ChannelRegistry, gpt_config: GptConfig,
+                       text_cache: ResultCache, scheduler: RequestScheduler, send_queue: SendQueue,
+                       speculator: Speculator, drafts: DraftStore):
+    panel = callback.message
+    user_id = callback.from_user.id
+    data = await state.get_data()
+
+    # Черновик показывает только последнее сообщение, кнопки прежних не действуют
+    if panel is None or data.get('panel') != panel.message_id:
+        send_queue.submit(callback.answer("Это сообщение устарело"))
+        return
+
+    if callback.data in ("ed_fix", "ed_rephrase"):
+        fix = callback.data == "ed_fix"
+        processing_text = "⌛️ Обрабатываю текст..." if fix else "⌛️ Переформулирую текст..."
+        send_queue.submit(callback.answer(processing_text))
+        try:
+            await apply_to_last_fragment(panel, state, drafts, fix_text_style if fix else rephrase_text,
+                                         processing_text, "ℹ️ Исправленный текст:" if fix else "🔄 Переформулированный текст:",
+                                         gpt_config, text_cache, scheduler, send_queue, show_diff=fix,
+                                         speculator=speculator, operation_name="fix" if fix else "rephrase",
+                                         panel=panel, user_id=user_id)
 
         except Exception as e:
-            await message.answer(f"Ошибка при обработке текста: {str(e)}",
-                                 reply_markup=keyboard.work_keyboard())
-
-    elif message.text == "❌ Отменить":
-        await message.answer("❌ Действия отменены", reply_markup=keyboard.del_kb)
+            send_queue.submit(panel.edit_text(f"Ошибка при обработке текста: {escape(str(e))}",
+                                              reply_markup=keyboard.EDITOR_KB))
+        return
+
+    if callback.data in ("ed_undo", "ed_redo"):
+        # Шаг по истории правок черновика
+        draft = await drafts.get(user_id)
+        undo = callback.data == "ed_undo"
+        label = draft.undo() if undo else draft.redo()
+        if label is None:
+            send_queue.submit(callback.answer("Отменять нечего" if undo else "Возвращать нечего"))
+            return
+        send_queue.submit(callback.answer())
+        await drafts.save(user_id, draft)
+        action = f"{'↩️ Отменено' if undo else '↪️ Возвращено'}: {DRAFT_LABELS.get(label, label)}"
+
+        if draft.last is None:
+            speculator.discard(user_id)
+            send_queue.submit(panel.edit_text(f"{action}\n\nЧерновик пуст.\n\nОжидаю текст, или войс."))
+            await state.set_state(Editor.editor_wait_text)
+            return
+        speculator.speculate(user_id, draft.last)
+        text = '\n'.join(draft.fragments)
+        send_queue.submit(panel.edit_text(f"{action}\n\n<code>{escape(text)}</code>", reply_markup=keyboard.EDITOR_KB))
+        return
+
+    send_queue.submit(callback.answer())
+
+    if callback.data == "ed_merge":
+        draft = await drafts.get(user_id)
+        if draft.merge():
+            await drafts.save(user_id, draft)
+        text = draft.last or ""
+        speculator.speculate(user_id, text)
+        send_queue.submit(panel.edit_text(f"⏺️ Объединенный текст:\n\n<code>{escape(text)}</code>",
+                                          reply_markup=keyboard.EDITOR_KB))
+
+    elif callback.data == "ed_cancel":
+        # Отменяем запросы к GPT, которые еще ждут очереди или выполняются
+        scheduler.cancel(user_id)
+        speculator.discard(user_id)
+        await drafts.clear(user_id)
+        send_queue.submit(panel.edit_text("❌ Действия отменены\n\nОжидаю текст, или войс."))
         await state.clear()
-        await asyncio.sleep(2)
-        await message.answer("Ожидаю текст, или войс.")
 
-    elif message.text == "✅ Отправить":
-        inline_channels_keyboard = InlineKeyboardBuilder()
-        await message.answer('Выберите канал для отправки', reply_markup=keyboard.del_kb)
-        await asyncio.sleep(1)
-        for text, data in chanel_dict.items():
-            btn = "btn_" + data
-            inline_channels_keyboard.add(InlineKeyboardButton(text=text, callback_data=btn))
-        inline_channels_keyboard.add(InlineKeyboardButton(text="❌ Отменить", callback_data="btn_cancel"))
-        await message.answer('Доступные каналы:', reply_markup=inline_channels_keyboard.adjust(1,1,1,1).as_markup())
+    elif callback.data == "ed_send":
+        await state.update_data(channels=[])
+        send_queue.submit(panel.edit_text("Выберите каналы для отправки:",
+                                          reply_markup=keyboard.channels_keyboard(channels.names, [])))
         await state.set_state(Editor.editor_wait_channel)
 
+
+# Форматы времени публикации, которые понимает бот
+PUBLISH_TIME_FORMATS = ("%d.%m.%Y %H:%M", "%d.%m %H:%M", "%H:%M")
+
+
+# Функция разбора времени отложенной публикации
+def parse_publish_time(text: str, now: datetime) -> datetime | None:
+    """Понимает "ДД.ММ.ГГГГ ЧЧ:ММ", "ДД.ММ ЧЧ:ММ" и "ЧЧ:ММ" (сегодня, а если время прошло - завтра)"""
+    for fmt in PUBLISH_TIME_FORMATS:
+        try:
+            parsed = datetime.strptime(text.strip(), fmt)
+        except ValueError:
+            continue
+        if fmt == "%H:%M":
+            parsed = now.replace(hour=parsed.hour, minute=parsed.minute, second=0, microsecond=0)
+            if parsed <= now:
+                parsed += timedelta(days=1)
+        elif fmt == "%d.%m %H:%M":
+            parsed = parsed.replace(year=now.year)
+        return parsed
+    return None
+
+
+# Функция постановки черновика в очередь публикаций
+async def enqueue_publication(message: Message, state: FSMContext, outbox: PublishOutbox,
+                              channels: ChannelRegistry, send_queue: SendQueue, speculator: Speculator,
+                              drafts: DraftStore, publish_at: datetime | None = None, editor_ui: str = "reply") -> None:
+    """
+    Записывает пост в очередь публикаций и сразу отвечает, отправку делает фоновый воркер.
+    В inline режиме ответ выводится в сообщение-черновик.
+    """
+    data = await state.get_data()
+    selected = data.get('channels', [])
+    draft = await drafts.get(message.chat.id)
+    text = (publish_at or datetime.now()).strftime("%d.%m.%Y") + '\n\n' + '\n'.join(draft.fragments)
+
+    added = await outbox.enqueue(data['publish_batch'], selected, text, notify_chat=message.chat.id,
+                                 publish_at=publish_at.timestamp() if publish_at else None)
+
+    if added:
+        names = ", ".join(f"<b>{escape(channels.names[chat_id])}</b>" for chat_id in selected)
+        when = f" на {publish_at.strftime('%d.%m.%Y %H:%M')}" if publish_at else ""
+        result = f"📤 Публикация{when} поставлена в очередь: {names}"
+    else:
+        result = "📤 Эта публикация уже в очереди"
+
+    if editor_ui == "inline":
+        await show_panel(state, send_queue, message.chat.id, f"{result}\n\nОжидаю текст, или войс.")
     else:
-        await message.answer("Неизвестная команда.\nНажми на кнопку ⬇️", reply_markup=keyboard.work_keyboard())
+        send_queue.submit(message.answer(result, reply_markup=keyboard.del_kb))
+    await state.clear()
+    await drafts.clear(message.chat.id)
+    speculator.discard(message.chat.id)
+    if editor_ui != "inline":
+        send_queue.submit(message.answer("Ожидаю текст, или войс.", reply_markup=keyboard.del_kb))
+    await state.set_state(Editor.editor_wait_text)
 
 
 @editor_router.callback_query(Editor.editor_wait_channel, F.data.startswith("btn_"))
-async def editor_wait_channel(callback: CallbackQuery, state: FSMContext, bot: Bot, chanel_dict: dict):
-    channel_data = callback.data.split('_')[1]
-    channel_name = [k for k, v in chanel_dict.items() if v == channel_data]
-    if channel_data == "cancel":
-        await callback.message.delete()
-        await callback.message.answer("❌ Отправка отменена", reply_markup=keyboard.del_kb)
-        data = await state.get_data()
-        text = data.get('text',[])
-        await callback.message.answer(f"✍️ Ты написал:\n\n<code>{text}</code>")
+async def editor_wait_channel(callback: CallbackQuery, state: FSMContext, channels: ChannelRegistry,
+                              outbox: PublishOutbox, send_queue: SendQueue, speculator: Speculator,
+                              drafts: DraftStore, editor_ui: str):
+    channel_data = callback.data.split('_', 1)[1]
+    data = await state.get_data()
+    selected = data.get('channels', [])
+    inline = editor_ui == "inline"
+
+    if channel_data == "cancel" and inline:
+        # Возвращаем сообщение-черновик к тексту и кнопкам редактора
+        send_queue.submit(callback.answer("❌ Отправка отменена"))
+        draft = await drafts.get(callback.from_user.id)
+        text = '\n'.join(draft.fragments)
+        send_queue.submit(callback.message.edit_text(f"✍️ Ты написал:\n\n<code>{escape(text)}</code>",
+                                                     reply_markup=keyboard.EDITOR_KB))
+        await state.set_state(Editor.editor_wait_command)
+
+    elif channel_data == "cancel":
+        send_queue.submit(callback.answer())
+        send_queue.submit(callback.message.delete())
+        send_queue.submit(callback.message.answer("❌ Отправка отменена", reply_markup=keyboard.del_kb))
+        draft = await drafts.get(callback.from_user.id)
+        text = '\n'.join(draft.fragments)
+        send_queue.submit(callback.message.answer(f"✍️ Ты написал:\n\n<code>{escape(text)}</code>"))
         await state.set_state(Editor.editor_wait_command)
-        await asyncio.sleep(1)
-        await callback.message.answer("Ожидаю команду ⬇️", reply_markup=keyboard.work_keyboard())
+        send_queue.submit(callback.message.answer("Ожидаю команду ⬇️", reply_markup=keyboard.work_keyboard()))
+
+    elif channel_data in ("publish", "schedule"):
+        if not selected:
+            send_queue.submit(callback.answer("Выберите хотя бы один канал"))
+            return
+        send_queue.submit(callback.answer())
+        if not inline:
+            send_queue.submit(callback.message.delete())
+
+        # Пачка привязана к сообщению с выбором каналов - повторное нажатие не поставит пост дважды
+        await state.update_data(publish_batch=f"{callback.from_user.id}:{callback.message.message_id}")
+
+        if channel_data == "publish":
+            await enqueue_publication(callback.message, state, outbox, channels, send_queue, speculator, drafts,
+                                      editor_ui=editor_ui)
+        elif inline:
+            send_queue.submit(callback.message.edit_text("🕒 Когда опубликовать?\n\n"
+                                                         "Формат: <code>ЧЧ:ММ</code>, <code>ДД.ММ ЧЧ:ММ</code> "
+                                                         "или <code>ДД.ММ.ГГГГ ЧЧ:ММ</code>",
+                                                         reply_markup=keyboard.PUBLISH_TIME_KB))
+            await state.set_state(Editor.editor_wait_publish_time)
+        else:
+            send_queue.submit(callback.message.answer("🕒 Когда опубликовать?\n\n"
+                                                      "Формат: <code>ЧЧ:ММ</code>, <code>ДД.ММ ЧЧ:ММ</code> "
+                                                      "или <code>ДД.ММ.ГГГГ ЧЧ:ММ</code>",
+                                                      reply_markup=keyboard.CANCEL_KB))
+            await state.set_state(Editor.editor_wait_publish_time)
+
     else:
+        # Кнопка канала включает или выключает его в списке публикации
         try:
-            channel_id = int(channel_data)
-            data = await state.get_data()
-            current_time = datetime.now().strftime("%d.%m.%Y")
-            list_text = data.get('text',[])
-            text = current_time + '\n\n' + '\n'.join(list_text)
-
-            # Проверяем существование чата
-            chat = await bot.get_chat(chat_id=channel_id)
-            print(f"Chat found: {chat.title} (ID: {chat.id})")
+            chat_id = int(channel_data)
+        except ValueError:
+            send_queue.submit(callback.answer())
+            return
+        if chat_id not in channels.names:
+            send_queue.submit(callback.answer("Канал не найден"))
+            return
+        if chat_id in selected:
+            selected.remove(chat_id)
+        else:
+            selected.append(chat_id)
+        await state.update_data(channels=selected)
+        send_queue.submit(callback.answer())
+        send_queue.submit(callback.message.edit_reply_markup(reply_markup=keyboard.channels_keyboard(channels.names, selected)))
+
+
+# Обработка времени отложенной публикации
+@editor_router.message(Editor.editor_wait_publish_time, F.text)
+async def editor_wait_publish_time(message: Message, state: FSMContext, channels: ChannelRegistry,
+                                   outbox: PublishOutbox, send_queue: SendQueue, speculator: Speculator,
+                                   drafts: DraftStore, editor_ui: str):
+    if message.text == "❌ Отменить":
+        data = await state.get_data()
+        send_queue.submit(message.answer("❌ Публикация отменена", reply_markup=keyboard.del_kb))
+        send_queue.submit(message.answer('Доступные каналы:',
+                                         reply_markup=keyboard.channels_keyboard(channels.names, data.get('channels', []))))
+        await state.set_state(Editor.editor_wait_channel)
+        return
 
-            # Проверяем права бота
-            bot_member = await bot.get_chat_member(chat_id=channel_id, user_id=bot.id)
-            print(f"Bot rights: {bot_member.status}")
+    now = datetime.now()
+    publish_at = parse_publish_time(message.text, now)
+    if publish_at is None:
+        send_queue.submit(message.answer("Не понял время. Пример: <code>18:30</code> или <code>25.12 09:00</code>"))
+        return
+    if publish_at <= now:
+        send_queue.submit(message.answer("Это время уже прошло, укажите время в будущем"))
+        return
 
-            # Пробуем отправить сообщение
-            message = await bot.send_message(chat_id=channel_id, text=text)
-            print(f"Message sent successfully: {message.message_id}")
+    await enqueue_publication(message, state, outbox, channels, send_queue, speculator, drafts, publish_at, editor_ui)
 
-        except Exception as e:
-            print(f"Error details: {type(e).__name__}: {str(e)}")
-            await callback.message.answer(f"❌ Ошибка отправки:\n\n<code>{str(e)}</code>", reply_markup=keyboard.del_kb)
-            return
 
-        await callback.message.delete()
-        await callback.message.answer(f"✅ Текст отправлен в <b>{channel_name[0]}</b>", reply_markup=keyboard.del_kb)
-        await state.clear()
-        await asyncio.sleep(1)
-        await callback.message.answer("Ожидаю текст, или войс.", reply_markup=keyboard.del_kb)
-        await state.set_state(Editor.editor_wait_text)
+# Отмена ввода времени публикации кнопкой сообщения-черновика (EDITOR_UI=inline)
+@editor_router.callback_query(Editor.editor_wait_publish_time, F.data == "ed_time_cancel")
+async def editor_cancel_publish_time(callback: CallbackQuery, state: FSMContext, channels: ChannelRegistry,
+                                     send_queue: SendQueue):
+    data = await state.get_data()
+    send_queue.submit(callback.answer("❌ Публикация отменена"))
+    send_queue.submit(callback.message.edit_text("Выберите каналы для отправки:",
+                                                 reply_markup=keyboard.channels_keyboard(channels.names, data.get('channels', []))))
+    await state.set_state(Editor.editor_wait_channel)
 
 
 # Обработка неизвестных команд
-@editor_router.message(Editor.editor_wait_command)
-async def not_command(message: Message):
-    await message.answer("Ожидаю получить команду.\nНажми на кнопку ⬇️", reply_markup=keyboard.work_keyboard())
-
-# Обработка текста и голосовых сообщений
-@editor_router.message(~StateFilter(Editor.editor_wait_command), or_f(F.text, F.voice))
-async def editor_wait_text(message: Message, state: FSMContext, bot: Bot):
+@editor_router.message(Editor.editor_wait_command, EditorUiFilter("reply"))
+async def not_command(message: Message, send_queue: SendQueue):
+    send_queue.submit(message.answer("Ожидаю получить команду.\nНажми на кнопку ⬇️", reply_markup=keyboard.work_keyboard()))
+
+# Обработка текста и голосовых сообщений (в inline режиме команды - кнопки, поэтому текст принимается всегда)
+@editor_router.message(or_f(~StateFilter(Editor.editor_wait_command), EditorUiFilter("inline")), or_f(F.text, F.voice))
+async def editor_wait_text(message: Message, state: FSMContext, bot: Bot, voice_cache: TranscriptCache,
+                          voice_buffers: VoiceBuffers, transcriber: Transcriber,
+                          scheduler: RequestScheduler, send_queue: SendQueue, speculator: Speculator,
+                          drafts: DraftStore, editor_ui: str):
+    inline = editor_ui == "inline"
     if message.text:
-        data = await state.get_data()
-        list_text = data.get('text',[])
-        list_text.append(message.text)
-        await state.update_data(text=list_text)
-        await message.answer(f"✍️ Ты написал:\n\n<code>{message.text}</code>",
-                         reply_markup=keyboard.work_keyboard())
+        draft = await drafts.get(message.from_user.id)
+        draft.add(message.text)
+        await drafts.save(message.from_user.id, draft)
+        # Новый последний фрагмент - заранее запускаем операции, пока пользователь выбирает кнопку
+        speculator.speculate(message.from_user.id, message.text)
+        if inline:
+            # Новое сообщение-черновик под текстом пользователя, кнопки прежнего перестают действовать
+            await show_panel(state, send_queue, message.chat.id, f"✍️ Ты написал:\n\n<code>{escape(message.text)}</code>",
+                             keyboard.EDITOR_KB, new=True)
+            await state.set_state(Editor.editor_wait_command)
+            return
+        send_queue.submit(message.answer(f"✍️ Ты написал:\n\n<code>{escape(message.text)}</code>",
+                                         reply_markup=keyboard.work_keyboard()))
         await state.set_state(Editor.editor_wait_command)
-        await asyncio.sleep(1)
-        await message.answer("Ожидаю команду ⬇️")
+        send_queue.submit(message.answer("Ожидаю команду ⬇️"))
 
     elif message.voice:
-        # Сообщаем пользователю о начале обработки
-        processing_msg = await message.answer("⌛️ Обрабатываю голосовое сообщение...")
+        # Сообщаем пользователю о начале обработки (ответ на сообщение не ждем - распознавание идет параллельно)
+        processing = send_queue.submit(message.answer("⌛️ Обрабатываю голосовое сообщение..."), exclusive=True)
         try:
-            # Получаем файл голосового сообщения
-            voice = await bot.get_file(message.voice.file_id)
-
-            if not voice.file_path:
-                raise ValueError("Не удалось получить путь к файлу голосового сообщения")
-
-            # Создаем временную директорию, если её нет
-            voice_dir = Path("temp_voice")
-            voice_dir.mkdir(exist_ok=True)
-
-            # Формируем путь для файла
-            voice_path = voice_dir / f"{message.voice.file_id}.ogg"
-
-            # Скачиваем файл
-            await bot.download_file(voice.file_path, voice_path)
-            logger.info("Скачан файл голосового сообщения: %s", voice_path)
-
-            # Инициализируем клиент OpenAI
-            # client = OpenAI(api_key=API_GPT)
-
-            # Транскрибируем аудио
-            with open(voice_path, "rb") as audio_file:
-                transcript = await asyncio.to_thread(client.audio.transcriptions.create,
-                                                                    model="whisper-1",
-                                                                    file=audio_file,
-                                                                    language="ru"
-                                                                    )
-
-            transcribed_text = transcript.text
-
-            # Обновляем данные в FSM
-            data = await state.get_data()
-            list_text = data.get('text', [])
-            list_text.append(transcribed_text)
-            await state.update_data(text=list_text)
-
-            # Отправляем результат пользователю
-            await processing_msg.delete()
-            await message.answer(f"🔍 Распознанный текст:\n\n<code>{transcribed_text}</code>",
-                                reply_markup=keyboard.work_keyboard())
+            # Распознаем голосовое (повторное голосовое берется из кэша)
+            transcribed_text = await scheduler.run(message.from_user.id,
+                                                   lambda: transcribe_voice(bot, message.voice, voice_buffers, transcriber, voice_cache))
+
+            # Добавляем фрагмент в черновик
+            draft = await drafts.get(message.from_user.id)
+            draft.add(transcribed_text)
+            await drafts.save(message.from_user.id, draft)
+            speculator.speculate(message.from_user.id, transcribed_text)
+
+            # Отправляем результат пользователю (в inline режиме сообщение о обработке становится черновиком)
+            processing_msg = await processing
+            if inline:
+                send_queue.submit(processing_msg.edit_text(f"🔍 Распознанный текст:\n\n<code>{escape(transcribed_text)}</code>",
+                                                           reply_markup=keyboard.EDITOR_KB))
+                await state.update_data(panel=processing_msg.message_id)
+                await state.set_state(Editor.editor_wait_command)
+                return
+            send_queue.submit(processing_msg.delete())
+            send_queue.submit(message.answer(f"🔍 Распознанный текст:\n\n<code>{escape(transcribed_text)}</code>",
+                                             reply_markup=keyboard.work_keyboard()))
             await state.set_state(Editor.editor_wait_command)
-            await asyncio.sleep(1)
-            await message.answer("Ожидаю команду ⬇️")
+            send_queue.submit(message.answer("Ожидаю команду ⬇️"))
+
+        except RequestCancelled:
+            processing_msg = await sent_message(processing)
+            if processing_msg is not None:
+                send_queue.submit(processing_msg.delete())
+
+        except SchedulerBusy:
+            # Сообщение о обработке могло не отправиться - тогда отвечаем новым
+            processing_msg = await sent_message(processing)
+            if processing_msg is not None:
+                send_queue.submit(processing_msg.edit_text("⏳ Слишком много запросов, попробуйте чуть позже"))
+            else:
+                send_queue.submit(message.answer("⏳ Слишком много запросов, попробуйте чуть позже"))
 
         except Exception as e:
-            await processing_msg.delete()
-            await message.answer(f"Ошибка при обработке голосового сообщения: {e}",
-                                 reply_markup=keyboard.work_keyboard())
+            if processing.done() and not processing.cancelled() and processing.exception() is None:
+                send_queue.submit(processing.result().delete())
+            send_queue.submit(message.answer(f"Ошибка при обработке голосового сообщения: {escape(str(e))}",
+                                             reply_markup=None if inline else keyboard.work_keyboard()))
             await state.set_state(Editor.editor_wait_command)
             logger.error("Ошибка при обработке голосового сообщения: %s", str(e))
 
-        finally:
-            # Удаляем временный файл
-            if 'voice_path' in locals():
-                try:
-                    voice_path.unlink()
-                except Exception as e:
-                    logger.error("Ошибка при удалении временного файла: %s", str(e))
-
 
 # Обработка неизвестных форматов сообщений
 @editor_router.message(~StateFilter(Editor.editor_wait_command))
-async def not_text_not_voice(message: Message):
-    await message.answer("Ожидаю текст, или войс.\nНапиши что-нибудь в поле ввода, или создай войс.\nДругие форматы сообщений не обрабатываются.",
-                         reply_markup=keyboard.del_kb)
+async def not_text_not_voice(message: Message, send_queue: SendQueue):
+    send_queue.submit(message.answer("Ожидаю текст, или войс.\nНапиши что-нибудь в поле ввода, или создай войс.\nДругие форматы сообщений не обрабатываются.",
+                                     reply_markup=keyboard.del_kb))
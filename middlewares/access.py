@@ -0,0 +1,118 @@
+import logging
+
+# Инициализируем логгер модуля
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.info("Загружен модуль: %s", __name__)
+
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.types import TelegramObject, Update, User
+
+from config_data.config import AccessConfig
+from common.metrics import REGISTRY
+
+
+class Bucket:
+    """Токен-бакет пользователя: запас апдейтов, время последнего пополнения и было ли предупреждение"""
+    __slots__ = ("tokens", "updated", "warned")
+
+    def __init__(self, tokens: float, updated: float) -> None:
+        self.tokens = tokens
+        self.updated = updated
+        self.warned = False
+
+
+class AccessMiddleware(BaseMiddleware):
+    """
+    Внешний мидлварь на апдейты, до роутеров: допуск и защита от флуда.
+    - Администраторы (bot.admin_list, bot.owner - множества, проверка за O(1)) проходят
+      с лимитом rate апдейтов в секунду и запасом burst; при превышении - одно короткое "не так быстро".
+    - Посторонним доступен только /start в личке, не чаще stranger_per_minute в минуту;
+      остальное отбрасывается молча, без запросов к Telegram и без прохода по роутерам.
+    Пропущенные апдейты считаются по причине. Список администраторов меняется на лету: /reload_admins.
+    """
+    def __init__(self, config: AccessConfig) -> None:
+        self.config = config
+        self._buckets: OrderedDict[int, Bucket] = OrderedDict()
+        self._announced: OrderedDict[int, float] = OrderedDict()
+        self.dropped: dict[str, int] = {"stranger": 0, "throttled": 0}
+        logger.info("class AccessMiddleware __init__")
+
+    @staticmethod
+    def _is_private_start(event: TelegramObject) -> bool:
+        message = event.message if isinstance(event, Update) else None
+        return (message is not None and message.chat.type == "private"
+                and message.text is not None and message.text.split("@", 1)[0].split(maxsplit=1)[0] == "/start")
+
+    def _take(self, user_id: int, rate: float, burst: int) -> Bucket | None:
+        """Забирает токен из бакета пользователя. Возвращает бакет, если токенов не хватило, иначе None"""
+        now = time.monotonic()
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = self._buckets[user_id] = Bucket(burst, now)
+            # Помним ограниченное число пользователей: давно молчавшие все равно пришли бы с полным бакетом
+            while len(self._buckets) > self.config.max_tracked:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(user_id)
+            bucket.tokens = min(burst, bucket.tokens + (now - bucket.updated) * rate)
+            bucket.updated = now
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            bucket.warned = False
+            return None
+        return bucket
+
+    def _drop(self, reason: str) -> None:
+        self.dropped[reason] += 1
+        REGISTRY.inc("bot_access_dropped_total", reason=reason)
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]], event: TelegramObject, data: Dict[str, Any]) -> Any:
+        # Пользователя уже определил UserContextMiddleware диспетчера; апдейты без пользователя не трогаем
+        user: User | None = data.get('event_from_user')
+        if user is None:
+            return await handler(event, data)
+
+        bot: Bot = data['bot']
+        if user.id in bot.admin_list or user.id in bot.owner:
+            bucket = self._take(user.id, self.config.rate, self.config.burst)
+            if bucket is None:
+                return await handler(event, data)
+            self._drop("throttled")
+            # Предупреждаем один раз, пока бакет не пополнится
+            send_queue = data.get('send_queue')
+            if not bucket.warned and send_queue is not None and isinstance(event, Update) and event.message is not None:
+                bucket.warned = True
+                send_queue.submit(event.message.answer("⏳ Не так быстро, это сообщение пропущено"))
+            return None
+
+        if not self._is_private_start(event):
+            self._drop("stranger")
+            return None
+        if self._take(user.id, self.config.stranger_per_minute / 60, self.config.stranger_burst) is not None:
+            self._drop("throttled")
+            return None
+        return await handler(event, data)
+
+    def should_announce(self, user_id: int) -> bool:
+        """Сообщать ли в домашнюю группу о /start: не чаще раза в announce_hours на пользователя"""
+        now = time.monotonic()
+        last = self._announced.get(user_id)
+        if last is not None and now - last < self.config.announce_hours * 3600:
+            return False
+        self._announced[user_id] = now
+        self._announced.move_to_end(user_id)
+        while len(self._announced) > self.config.max_tracked:
+            self._announced.popitem(last=False)
+        return True
+
+    def stats(self) -> dict:
+        """Счетчики для /status"""
+        return {"tracked": len(self._buckets), **self.dropped}
+
+
+REGISTRY.describe("bot_access_dropped_total", "Апдейты, отброшенные до роутеров: посторонние и превышение лимита")
@@ -0,0 +1,114 @@
+import logging
+
+# Инициализируем логгер модуля
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.info("Загружен модуль: %s", __name__)
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import Chat, TelegramObject, Update, User
+
+from config_data.config import LaneConfig
+from common.metrics import REGISTRY
+
+
+class Lane:
+    """Очередь апдейтов одного пользователя в чате: замок (ждущие проходят по порядку) и число апдейтов в ней"""
+    __slots__ = ("lock", "pending")
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.pending = 0
+
+
+class UpdateLanesMiddleware(BaseMiddleware):
+    """
+    Внешний мидлварь на апдейты: апдейты одного пользователя в одном чате обрабатываются строго по очереди,
+    разные пользователи - параллельно. Два быстрых сообщения или голосовых не обгоняют друг друга
+    и не меняют черновик одновременно.
+    Очередь пользователя ограничена max_pending апдейтами, лишние пропускаются с ответом пользователю.
+    Команды из bypass (например "❌ Отменить") идут вне очереди, чтобы не ждать долгий запрос к GPT или Whisper,
+    который они и отменяют.
+    """
+    def __init__(self, config: LaneConfig) -> None:
+        self.config = config
+        self.bypass = frozenset(config.bypass)
+        self._lanes: dict[tuple[int, int], Lane] = {}
+        self.dropped = 0
+        self.bypassed = 0
+        logger.info("class UpdateLanesMiddleware __init__")
+
+    def _is_bypass(self, event: TelegramObject) -> bool:
+        if not isinstance(event, Update):
+            return False
+        if event.message is not None and event.message.text:
+            text = event.message.text
+            # Команда может прийти с именем бота: /status@bot
+            command = text.split(maxsplit=1)[0].split("@", 1)[0] if text.startswith("/") else text
+            return command in self.bypass
+        if event.callback_query is not None:
+            return event.callback_query.data in self.bypass
+        return False
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]], event: TelegramObject, data: Dict[str, Any]) -> Any:
+        # Пользователя и чат уже определил UserContextMiddleware диспетчера
+        user: User | None = data.get('event_from_user')
+        chat: Chat | None = data.get('event_chat')
+        if not self.config.enabled or (user is None and chat is None):
+            return await handler(event, data)
+        if self._is_bypass(event):
+            self.bypassed += 1
+            REGISTRY.inc("bot_lane_bypass_total")
+            return await handler(event, data)
+
+        key = (chat.id if chat else 0, user.id if user else 0)
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = Lane()
+        if lane.pending >= self.config.max_pending:
+            self.dropped += 1
+            REGISTRY.inc("bot_lane_dropped_total")
+            logger.warning("Очередь апдейтов %s переполнена (%s), апдейт пропущен", key, lane.pending)
+            send_queue = data.get('send_queue')
+            if isinstance(event, Update) and event.message is not None and send_queue is not None:
+                send_queue.submit(event.message.answer("⏳ Слишком много сообщений подряд, это сообщение пропущено"))
+            return None
+
+        lane.pending += 1
+        REGISTRY.gauge_add("bot_lane_pending", 1)
+        started = time.perf_counter()
+        waited = lane.lock.locked()
+        try:
+            async with lane.lock:
+                REGISTRY.observe("bot_lane_wait_seconds", time.perf_counter() - started)
+                # FSMContextMiddleware прочитал состояние до очереди - пока ждали, его могли сменить
+                if waited:
+                    state = data.get('state')
+                    if state is not None:
+                        data['raw_state'] = await state.get_state()
+                return await handler(event, data)
+        finally:
+            lane.pending -= 1
+            REGISTRY.gauge_add("bot_lane_pending", -1)
+            # Пустые очереди не копим: следующий апдейт пользователя создаст новую
+            if not lane.pending:
+                del self._lanes[key]
+
+    def stats(self) -> dict:
+        """Счетчики для /status"""
+        return {
+            "lanes": len(self._lanes),
+            "pending": sum(lane.pending for lane in self._lanes.values()),
+            "dropped": self.dropped,
+            "bypassed": self.bypassed,
+        }
+
+
+REGISTRY.describe("bot_lane_wait_seconds", "Ожидание апдейта в очереди пользователя, сек")
+REGISTRY.describe("bot_lane_pending", "Апдейты в очередях пользователей (с выполняющимися)")
+REGISTRY.describe("bot_lane_dropped_total", "Апдейты, пропущенные из-за переполнения очереди пользователя")
+REGISTRY.describe("bot_lane_bypass_total", "Апдейты команд, обработанные вне очереди")
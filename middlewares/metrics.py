@@ -0,0 +1,84 @@
+import logging
+
+# Инициализируем логгер модуля
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.info("Загружен модуль: %s", __name__)
+
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+from aiogram.types import TelegramObject, Update
+
+from common.metrics import MetricsRegistry, REGISTRY
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """
+    Внешний мидлварь на апдейты: считает апдейты по типу, время обработки, ошибки и апдейты в работе.
+    Заменяет CounterMiddleware - общий счетчик апдейтов по-прежнему кладется в data['counter'] для /ping.
+    """
+    def __init__(self, registry: MetricsRegistry = REGISTRY) -> None:
+        self.registry = registry
+        self.counter = 0
+        logger.info("class UpdateMetricsMiddleware __init__")
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]], event: TelegramObject, data: Dict[str, Any]) -> Any:
+        self.counter += 1
+        data['counter'] = self.counter
+
+        update_type = event.event_type if isinstance(event, Update) else type(event).__name__
+        self.registry.inc("bot_updates_total", type=update_type)
+        self.registry.gauge_add("bot_updates_in_flight", 1)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            self.registry.inc("bot_update_errors_total", type=update_type)
+            raise
+        finally:
+            self.registry.observe("bot_update_seconds", time.perf_counter() - started, type=update_type)
+            self.registry.gauge_add("bot_updates_in_flight", -1)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Внутренний мидлварь роутера: вызывается уже после фильтров, поэтому знает роутер и хендлер.
+    Считает вызовы, время работы, ошибки и хендлеры в работе.
+    """
+    def __init__(self, registry: MetricsRegistry = REGISTRY) -> None:
+        self.registry = registry
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]], event: TelegramObject, data: Dict[str, Any]) -> Any:
+        router = data.get('event_router')
+        handler_object = data.get('handler')
+        labels = {
+            "router": router.name if router is not None else "unknown",
+            "handler": handler_object.callback.__name__ if handler_object is not None else "unknown",
+        }
+
+        self.registry.inc("bot_handler_calls_total", **labels)
+        self.registry.gauge_add("bot_handler_in_flight", 1, **labels)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            self.registry.inc("bot_handler_errors_total", **labels)
+            raise
+        finally:
+            self.registry.observe("bot_handler_seconds", time.perf_counter() - started, **labels)
+            self.registry.gauge_add("bot_handler_in_flight", -1, **labels)
+
+
+class TelegramRequestMetrics(BaseRequestMiddleware):
+    """Мидлварь сессии бота: время каждого запроса к Telegram Bot API по методу"""
+    def __init__(self, registry: MetricsRegistry = REGISTRY) -> None:
+        self.registry = registry
+
+    async def __call__(self, make_request: NextRequestMiddlewareType[TelegramType], bot: Bot, method: TelegramMethod[TelegramType]) -> Response[TelegramType]:
+        async with self.registry.timer("telegram", method=type(method).__name__):
+            return await make_request(bot, method)